@@ -26,6 +26,7 @@ echo RABBITMQ_PASSWORD=guest >> services\user_management\.env.template
 echo. >> services\user_management\.env.template
 echo # JWT Settings >> services\user_management\.env.template
 echo JWT_SECRET_KEY=your_jwt_secret_key_here >> services\user_management\.env.template
+echo JWT_SIGNING_KEY=your_shared_jwt_signing_key_here >> services\user_management\.env.template
 echo JWT_ACCESS_TOKEN_LIFETIME=5 >> services\user_management\.env.template
 echo JWT_REFRESH_TOKEN_LIFETIME=1 >> services\user_management\.env.template
 echo. >> services\user_management\.env.template
@@ -56,6 +57,14 @@ echo RABBITMQ_PORT=5672 >> services\wallet\.env.template
 echo RABBITMQ_USER=guest >> services\wallet\.env.template
 echo RABBITMQ_PASSWORD=guest >> services\wallet\.env.template
 echo. >> services\wallet\.env.template
+echo # JWT Settings >> services\wallet\.env.template
+echo JWT_SIGNING_KEY=your_shared_jwt_signing_key_here >> services\wallet\.env.template
+echo INTERNAL_SERVICE_KEY=your_shared_service_key_here >> services\wallet\.env.template
+echo WALLET_HOLD_DEFAULT_TTL=900 >> services\wallet\.env.template
+echo WALLET_HOLD_MAX_TTL=3600 >> services\wallet\.env.template
+echo INBOX_CACHE_TTL=86400 >> services\wallet\.env.template
+echo INBOX_RETENTION_DAYS=14 >> services\wallet\.env.template
+echo. >> services\wallet\.env.template
 echo # CORS >> services\wallet\.env.template
 echo CORS_ALLOWED_ORIGINS=http://localhost:3000 >> services\wallet\.env.template
 
@@ -76,6 +85,9 @@ echo # Redis >> services\transaction_engine\.env.template
 echo REDIS_HOST=localhost >> services\transaction_engine\.env.template
 echo REDIS_PORT=6379 >> services\transaction_engine\.env.template
 echo REDIS_DB=2 >> services\transaction_engine\.env.template
+echo TRANSACTION_CACHE_TTL=3600 >> services\transaction_engine\.env.template
+echo IDEMPOTENCY_KEY_TTL=86400 >> services\transaction_engine\.env.template
+echo IDEMPOTENCY_WAIT_TIMEOUT=30 >> services\transaction_engine\.env.template
 echo. >> services\transaction_engine\.env.template
 echo # RabbitMQ >> services\transaction_engine\.env.template
 echo RABBITMQ_HOST=localhost >> services\transaction_engine\.env.template
@@ -83,6 +95,14 @@ echo RABBITMQ_PORT=5672 >> services\transaction_engine\.env.template
 echo RABBITMQ_USER=guest >> services\transaction_engine\.env.template
 echo RABBITMQ_PASSWORD=guest >> services\transaction_engine\.env.template
 echo. >> services\transaction_engine\.env.template
+echo # JWT Settings >> services\transaction_engine\.env.template
+echo JWT_SIGNING_KEY=your_shared_jwt_signing_key_here >> services\transaction_engine\.env.template
+echo INTERNAL_SERVICE_KEY=your_shared_service_key_here >> services\transaction_engine\.env.template
+echo WALLET_HOLD_TTL=900 >> services\transaction_engine\.env.template
+echo TRANSACTION_SWEEP_AFTER=900 >> services\transaction_engine\.env.template
+echo TRANSACTION_SWEEP_MAX_REPUBLISH=3 >> services\transaction_engine\.env.template
+echo TRANSACTION_SWEEP_FAIL_AFTER=3600 >> services\transaction_engine\.env.template
+echo. >> services\transaction_engine\.env.template
 echo # CORS >> services\transaction_engine\.env.template
 echo CORS_ALLOWED_ORIGINS=http://localhost:3000 >> services\transaction_engine\.env.template
 
@@ -110,6 +130,14 @@ echo RABBITMQ_PORT=5672 >> services\commission_engine\.env.template
 echo RABBITMQ_USER=guest >> services\commission_engine\.env.template
 echo RABBITMQ_PASSWORD=guest >> services\commission_engine\.env.template
 echo. >> services\commission_engine\.env.template
+echo # Consumers >> services\commission_engine\.env.template
+echo INBOX_CACHE_TTL=86400 >> services\commission_engine\.env.template
+echo INBOX_RETENTION_DAYS=14 >> services\commission_engine\.env.template
+echo COMMISSION_RATE_TABLE_REFRESH=600 >> services\commission_engine\.env.template
+echo COMMISSION_BATCH_SIZE=0 >> services\commission_engine\.env.template
+echo COMMISSION_BATCH_WINDOW_MS=50 >> services\commission_engine\.env.template
+echo COMMISSION_ROLLUP_DAILY_MONTHS=3 >> services\commission_engine\.env.template
+echo. >> services\commission_engine\.env.template
 echo # CORS >> services\commission_engine\.env.template
 echo CORS_ALLOWED_ORIGINS=http://localhost:3000 >> services\commission_engine\.env.template
 
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from 'react';
+import React, { useEffect, useMemo, useState } from 'react';
 import {
     Container,
     Grid,
@@ -39,7 +39,7 @@ import {
 } from '@mui/icons-material';
 import { useSelector } from 'react-redux';
 import { RootState } from '../store';
-import { Agent, AgentDocument, TransactionStats, Transaction } from '../types';
+import { Agent, AgentDocument, TransactionStats, Transaction, TransactionVolumePoint } from '../types';
 import * as api from '../services/api';
 import { useNavigate } from 'react-router-dom';
 
@@ -98,10 +98,91 @@ const Sidebar: React.FC = () => {
     );
 };
 
+const TYPE_COLORS: Record<TransactionVolumePoint['transaction_type'], string> = {
+    WALLET_LOAD: 'primary.main',
+    BANK_DEPOSIT: 'success.main',
+    BANK_WITHDRAWAL: 'warning.main',
+};
+
+const TYPE_LABELS: Record<TransactionVolumePoint['transaction_type'], string> = {
+    WALLET_LOAD: 'Wallet Load',
+    BANK_DEPOSIT: 'Bank Deposit',
+    BANK_WITHDRAWAL: 'Bank Withdrawal',
+};
+
+const TRANSACTION_TYPES = Object.keys(TYPE_COLORS) as TransactionVolumePoint['transaction_type'][];
+
+// Stacked bars of daily amount per transaction type, from the stats series
+const VolumeChart: React.FC<{ series: TransactionVolumePoint[] }> = ({ series }) => {
+    const days = useMemo(() => {
+        const byDay = new Map<string, Partial<Record<TransactionVolumePoint['transaction_type'], number>>>();
+        series.forEach((point) => {
+            const totals = byDay.get(point.bucket) || {};
+            totals[point.transaction_type] = (totals[point.transaction_type] || 0) + parseFloat(point.amount);
+            byDay.set(point.bucket, totals);
+        });
+        return Array.from(byDay.entries());
+    }, [series]);
+
+    if (days.length === 0) {
+        return (
+            <Typography color="textSecondary" align="center">
+                No transactions in the last 30 days
+            </Typography>
+        );
+    }
+
+    const dayTotal = (totals: Partial<Record<string, number>>) =>
+        Object.values(totals).reduce((sum: number, amount) => sum + (amount || 0), 0);
+    const max = Math.max(...days.map(([, totals]) => dayTotal(totals)), 1);
+
+    return (
+        <Box>
+            <Box display="flex" alignItems="flex-end" height={160} gap={0.5}>
+                {days.map(([bucket, totals]) => (
+                    <Tooltip
+                        key={bucket}
+                        title={
+                            <Box>
+                                <Typography variant="caption" display="block">
+                                    {new Date(bucket).toLocaleDateString()}
+                                </Typography>
+                                {TRANSACTION_TYPES.filter((type) => totals[type]).map((type) => (
+                                    <Typography key={type} variant="caption" display="block">
+                                        {TYPE_LABELS[type]}: ETB {(totals[type] || 0).toFixed(2)}
+                                    </Typography>
+                                ))}
+                            </Box>
+                        }
+                    >
+                        <Box flex={1} display="flex" flexDirection="column-reverse" height="100%">
+                            {TRANSACTION_TYPES.filter((type) => totals[type]).map((type) => (
+                                <Box
+                                    key={type}
+                                    sx={{ height: `${((totals[type] || 0) / max) * 100}%`, bgcolor: TYPE_COLORS[type] }}
+                                />
+                            ))}
+                        </Box>
+                    </Tooltip>
+                ))}
+            </Box>
+            <Box display="flex" gap={2} mt={1}>
+                {TRANSACTION_TYPES.map((type) => (
+                    <Box key={type} display="flex" alignItems="center" gap={0.5}>
+                        <Box sx={{ width: 12, height: 12, bgcolor: TYPE_COLORS[type] }} />
+                        <Typography variant="caption">{TYPE_LABELS[type]}</Typography>
+                    </Box>
+                ))}
+            </Box>
+        </Box>
+    );
+};
+
 const AgentDashboard: React.FC = () => {
     const [agentData, setAgentData] = useState<Agent | null>(null);
     const [walletBalance, setWalletBalance] = useState<string>('0.00');
     const [transactionStats, setTransactionStats] = useState<TransactionStats | null>(null);
+    const [volumeSeries, setVolumeSeries] = useState<TransactionVolumePoint[]>([]);
     const [recentTransactions, setRecentTransactions] = useState<Transaction[]>([]);
     const [isLoading, setIsLoading] = useState(true);
     const [error, setError] = useState<string | null>(null);
@@ -112,15 +193,17 @@ const AgentDashboard: React.FC = () => {
         setIsLoading(true);
         setError(null);
         try {
-            const [agentResponse, walletResponse, statsResponse, transactionsResponse] = await Promise.all([
+            const [agentResponse, walletResponse, statsResponse, volumeResponse, transactionsResponse] = await Promise.all([
                 api.getAgentProfile(),
                 api.getWalletBalance(),
                 api.getTransactionStats(),
+                api.getTransactionStats({ bucket: 'day' }),
                 api.getRecentTransactions(5)
             ]);
             setAgentData(agentResponse);
             setWalletBalance(walletResponse.balance);
             setTransactionStats(statsResponse);
+            setVolumeSeries(volumeResponse.series || []);
             setRecentTransactions(transactionsResponse.results);
         } catch (err) {
             setError('Failed to fetch data');
@@ -356,6 +439,21 @@ const AgentDashboard: React.FC = () => {
                     </Card>
                 </Grid>
 
+                {/* Daily Volume */}
+                <Grid item xs={12}>
+                    <Card>
+                        <CardContent>
+                            <Box display="flex" alignItems="center" mb={2}>
+                                <AssessmentIcon fontSize="large" color="primary" />
+                                <Typography variant="h6" component="div" ml={1}>
+                                    Daily Volume (last 30 days)
+                                </Typography>
+                            </Box>
+                            <VolumeChart series={volumeSeries} />
+                        </CardContent>
+                    </Card>
+                </Grid>
+
                 {/* Recent Transactions */}
                 <Grid item xs={12}>
                     <Paper sx={{ p: 3 }}>
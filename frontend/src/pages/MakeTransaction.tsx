@@ -1,4 +1,4 @@
-import React, { useState } from 'react';
+import React, { useEffect, useRef, useState } from 'react';
 import {
     Container,
     Paper,
@@ -41,6 +41,13 @@ const MakeTransaction: React.FC = () => {
     const [isLoading, setIsLoading] = useState(false);
     const [error, setError] = useState<string | null>(null);
     const [success, setSuccess] = useState<string | null>(null);
+    // One key per submission: resubmitting the unchanged form after a timeout
+    // or error replays the first attempt instead of creating a duplicate
+    const idempotencyKey = useRef<string | null>(null);
+
+    useEffect(() => {
+        idempotencyKey.current = null;
+    }, [transactionType, provider, amount, identifier]);
 
     const handleSubmit = async (e: React.FormEvent) => {
         e.preventDefault();
@@ -59,7 +66,10 @@ const MakeTransaction: React.FC = () => {
                 )
             };
 
-            const response = await api.createTransaction(transactionData);
+            if (!idempotencyKey.current) {
+                idempotencyKey.current = crypto.randomUUID();
+            }
+            const response = await api.createTransaction(transactionData, idempotencyKey.current);
 
             setSuccess('Transaction initiated successfully!');
             // Reset form
@@ -13,23 +13,29 @@ import {
     TablePagination,
     CircularProgress,
 } from '@mui/material';
-import { Transaction } from '../types';
+import { CursorPage, Transaction } from '../types';
 import * as api from '../services/api';
 
 const TransactionHistory: React.FC = () => {
     const [transactions, setTransactions] = useState<Transaction[]>([]);
     const [page, setPage] = useState(0);
     const [rowsPerPage, setRowsPerPage] = useState(10);
-    const [totalCount, setTotalCount] = useState(0);
+    // cursors[n] fetches page n; page 0 needs none
+    const [cursors, setCursors] = useState<(string | null)[]>([null]);
+    const [hasNext, setHasNext] = useState(false);
     const [isLoading, setIsLoading] = useState(true);
     const [error, setError] = useState<string | null>(null);
 
     const fetchTransactions = async () => {
         try {
             setIsLoading(true);
-            const response = await api.getTransactions(page + 1, rowsPerPage);
+            const response: CursorPage<Transaction> = await api.getTransactions(cursors[page], rowsPerPage);
             setTransactions(response.results);
-            setTotalCount(response.count);
+            setHasNext(response.next_cursor !== null);
+            if (response.next_cursor) {
+                const nextCursor = response.next_cursor;
+                setCursors((known) => [...known.slice(0, page + 1), nextCursor]);
+            }
         } catch (err) {
             setError('Failed to fetch transactions');
             console.error('Error fetching transactions:', err);
@@ -48,6 +54,7 @@ const TransactionHistory: React.FC = () => {
 
     const handleChangeRowsPerPage = (event: React.ChangeEvent<HTMLInputElement>) => {
         setRowsPerPage(parseInt(event.target.value, 10));
+        setCursors([null]);
         setPage(0);
     };
 
@@ -132,7 +139,8 @@ const TransactionHistory: React.FC = () => {
                 <TablePagination
                     rowsPerPageOptions={[5, 10, 25, 50]}
                     component="div"
-                    count={totalCount}
+                    // The total is not counted; -1 shows "of more than n"
+                    count={hasNext ? -1 : page * rowsPerPage + transactions.length}
                     rowsPerPage={rowsPerPage}
                     page={page}
                     onPageChange={handleChangePage}
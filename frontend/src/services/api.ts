@@ -211,8 +211,18 @@ export const getWalletBalance = async () => {
 };
 
 // Transaction API calls
-export const getTransactionStats = async () => {
+export type TransactionStatsParams = {
+    from?: string;
+    to?: string;
+    bucket?: 'hour' | 'day';
+    type?: string;
+    status?: string;
+    provider?: string;
+};
+
+export const getTransactionStats = async (params: TransactionStatsParams = {}) => {
     const response = await axios.get(`${TRANSACTION_SERVICE_URL}/transactions/stats/`, {
+        params,
         headers: {
             'Authorization': api.defaults.headers.common['Authorization']
         }
@@ -220,8 +230,10 @@ export const getTransactionStats = async () => {
     return response.data;
 };
 
-export const getTransactions = async (page: number = 1, limit: number = 10) => {
-    const response = await axios.get(`${TRANSACTION_SERVICE_URL}/transactions/?page=${page}&limit=${limit}`, {
+// Pages are linked by an opaque cursor; pass the previous page's next_cursor
+export const getTransactions = async (cursor: string | null = null, limit: number = 10) => {
+    const response = await axios.get(`${TRANSACTION_SERVICE_URL}/transactions/`, {
+        params: { limit, ...(cursor ? { cursor } : {}) },
         headers: {
             'Authorization': api.defaults.headers.common['Authorization']
         }
@@ -247,10 +259,13 @@ type CreateTransactionData = {
     | { bank_provider: string; wallet_provider?: never }
 );
 
-export const createTransaction = async (data: CreateTransactionData) => {
+// Send the same idempotencyKey when retrying a submission, so the retry
+// returns the original transaction instead of creating a second one
+export const createTransaction = async (data: CreateTransactionData, idempotencyKey?: string) => {
     const response = await axios.post(`${TRANSACTION_SERVICE_URL}/transactions/`, data, {
         headers: {
-            'Authorization': api.defaults.headers.common['Authorization']
+            'Authorization': api.defaults.headers.common['Authorization'],
+            ...(idempotencyKey ? { 'Idempotency-Key': idempotencyKey } : {})
         }
     });
     return response.data;
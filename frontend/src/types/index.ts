@@ -74,6 +74,27 @@ export interface TransactionStats {
     failed_transactions: number;
     pending_transactions: number;
     total_commission_earned: string;
+    // Present when requested with a bucket
+    from?: string;
+    to?: string;
+    bucket?: 'hour' | 'day';
+    series?: TransactionVolumePoint[];
+}
+
+export interface TransactionVolumePoint {
+    bucket: string;
+    transaction_type: 'WALLET_LOAD' | 'BANK_DEPOSIT' | 'BANK_WITHDRAWAL';
+    provider: string | null;
+    count: number;
+    amount: string;
+    successful_count: number;
+    successful_amount: string;
+}
+
+export interface CursorPage<T> {
+    next: string | null;
+    next_cursor: string | null;
+    results: T[];
 }
 
 export interface Transaction {
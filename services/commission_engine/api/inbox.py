@@ -0,0 +1,93 @@
+import logging
+from typing import Iterable
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from .models import ProcessedEvent
+
+logger = logging.getLogger(__name__)
+
+INBOX_CACHE_PREFIX = 'inbox:'
+
+# Consumer whose side effects must happen once per event; a transaction
+# earns at most one commission, so the event id is the transaction_id
+WALLET_EVENT = 'commission.wallet_event'
+
+_RECORD_SQL = """
+    INSERT INTO {table} (consumer, event_id, processed_at)
+    VALUES {rows}
+    ON CONFLICT (consumer, event_id) DO NOTHING
+    RETURNING event_id
+"""
+
+
+def inbox_cache_key(consumer: str, event_id) -> str:
+    return f"{INBOX_CACHE_PREFIX}{consumer}:{event_id}"
+
+
+def already_processed(consumer: str, event_id) -> bool:
+    """
+    Whether the event is known to be processed, from the cache alone. A
+    False is not conclusive; record() decides inside the transaction.
+    """
+    return bool(already_processed_many(consumer, [event_id]))
+
+
+def already_processed_many(consumer: str, event_ids: Iterable) -> set:
+    """The subset of event_ids the cache knows to be processed"""
+    keys = {inbox_cache_key(consumer, event_id): event_id for event_id in event_ids}
+    if not keys:
+        return set()
+    try:
+        return {keys[key] for key in cache.get_many(list(keys))}
+    except Exception as e:
+        logger.warning(f"Inbox cache unavailable: {str(e)}")
+        return set()
+
+
+def record(consumer: str, event_id) -> bool:
+    """
+    Record the event as processed; True the first time, False for a
+    redelivery. Call inside the atomic block that applies its side effects,
+    before applying them.
+    """
+    return str(event_id) in record_many(consumer, [event_id])
+
+
+def record_many(consumer: str, event_ids: Iterable) -> set:
+    """
+    Record events as processed in one statement and return the ids seen for
+    the first time. Ids are inserted in sorted order so concurrent callers
+    cannot deadlock; a concurrent caller inserting the same id waits for
+    this transaction and then finds it recorded. Once committed, all the ids
+    are cached so their redeliveries are turned away without a query.
+    """
+    event_ids = sorted({str(event_id) for event_id in event_ids})
+    if not event_ids:
+        return set()
+
+    params = []
+    for event_id in event_ids:
+        params.extend([consumer, event_id])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _RECORD_SQL.format(
+                table=ProcessedEvent._meta.db_table,
+                rows=', '.join(['(%s, %s, now())'] * len(event_ids))
+            ),
+            params
+        )
+        fresh = {row[0] for row in cursor.fetchall()}
+
+    transaction.on_commit(lambda: _remember(consumer, event_ids))
+    return fresh
+
+
+def _remember(consumer: str, event_ids: list) -> None:
+    try:
+        cache.set_many(
+            {inbox_cache_key(consumer, event_id): 1 for event_id in event_ids},
+            settings.INBOX_CACHE_TTL
+        )
+    except Exception as e:
+        logger.warning(f"Inbox cache unavailable: {str(e)}")
@@ -0,0 +1,62 @@
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from api.models import TransactionType
+from api.schedules import compile_schedule
+
+PROVIDERS = (None, 'TELEBIRR', 'MPESA', 'CBE', 'DASHEN')
+
+
+class Command(BaseCommand):
+    help = 'Time compiled commission schedule lookups on a synthetic schedule (no database needed)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--versions', type=int, default=12,
+                            help='Effective-dated versions per transaction type and provider')
+        parser.add_argument('--tiers', type=int, default=10, help='Amount tiers per version')
+        parser.add_argument('--lookups', type=int, default=1000000, help='Lookups timed')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+        rows = []
+        schedule_id = 0
+        for transaction_type in TransactionType:
+            for provider in PROVIDERS:
+                for version in range(options['versions']):
+                    schedule_id += 1
+                    effective_from = start + timedelta(days=30 * version)
+                    for tier in range(options['tiers']):
+                        rows.append((
+                            transaction_type.name, provider, effective_from, schedule_id,
+                            Decimal(tier * 1000), Decimal(rng.randint(50, 300)) / 100
+                        ))
+        rows.sort(key=lambda row: (row[0], row[1] or '', row[2], row[3], row[4]))
+        schedule = compile_schedule(rows, (schedule_id, schedule_id))
+
+        end = start + timedelta(days=30 * options['versions'])
+        types = [transaction_type.name for transaction_type in TransactionType]
+        providers = list(PROVIDERS) + ['AWASH']  # one without its own line
+        lookups = [
+            (
+                rng.choice(types),
+                rng.choice(providers),
+                Decimal(rng.randint(1, options['tiers'] * 1000 * 100)) / 100,
+                rng.uniform(start.timestamp(), end.timestamp())
+            )
+            for _ in range(options['lookups'])
+        ]
+
+        rate_for = schedule.rate_for
+        began = time.perf_counter()
+        for transaction_type, provider, amount, at in lookups:
+            rate_for(transaction_type, provider, amount, at)
+        elapsed = time.perf_counter() - began
+
+        self.stdout.write(
+            f"{len(rows)} tiers in {sum(map(len, schedule.lines.values()))} lines, {options['lookups']} lookups: "
+            f"{elapsed * 1e9 / options['lookups']:.0f} ns per lookup"
+        )
@@ -0,0 +1,31 @@
+import logging
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from api.rollups import compact, daily_since, rebuild
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Fold daily commission rollups of past months into monthly rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', type=str,
+                            help='Compact months starting before this ISO date '
+                                 '(default: COMMISSION_ROLLUP_DAILY_MONTHS before the current month)')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recompute every rollup from the commission records first')
+
+    def handle(self, *args, **options):
+        before = daily_since()
+        if options['before']:
+            try:
+                before = date.fromisoformat(options['before'])
+            except ValueError:
+                raise CommandError(f"Invalid --before {options['before']}, expected an ISO date")
+
+        if options['rebuild']:
+            rebuild()
+            self.stdout.write('Rebuilt commission rollups')
+
+        months = compact(before)
+        self.stdout.write(self.style.SUCCESS(f'Compacted {months} months of commission rollups before {before}'))
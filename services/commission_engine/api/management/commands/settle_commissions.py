@@ -0,0 +1,101 @@
+import signal
+import logging
+import threading
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from api.mq.publisher import EventPublisher
+from api.settlement import complete_batch, open_batch, settle_next
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Pay out PENDING commissions in a payout batch, resuming the open batch if there is one'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._shutdown_event = threading.Event()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--cutoff', type=str,
+                            help='Pay commissions created before this ISO date or time '
+                                 '(default: the start of the current month)')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Agents settled in parallel, each on its own connection')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Commissions marked paid per UPDATE')
+
+    def handle(self, *args, **options):
+        def signal_handler(signum, frame):
+            self.stdout.write(self.style.WARNING('\nStopping settlement after the agents in progress...'))
+            self._shutdown_event.set()
+
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
+
+        batch, created = open_batch(self._cutoff(options['cutoff']))
+        if created:
+            self.stdout.write(
+                f"Opened payout batch {batch.pk} up to {batch.cutoff}: {batch.agent_count} agents, "
+                f"{batch.commission_count} commissions, {batch.total_amount}"
+            )
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"Resuming open payout batch {batch.pk} up to {batch.cutoff}; --cutoff is ignored"
+            ))
+
+        settled = []
+        threads = [
+            threading.Thread(target=self._work, args=(batch, options['chunk_size'], settled),
+                             name=f"Settlement-{i + 1}")
+            for i in range(max(1, options['workers']))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if complete_batch(batch):
+            batch.refresh_from_db()
+            self.stdout.write(self.style.SUCCESS(
+                f"Payout batch {batch.pk} completed: {batch.agent_count} agents, "
+                f"{batch.commission_count} commissions, {batch.total_amount}"
+            ))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"Settled {len(settled)} agents; payout batch {batch.pk} is still open, run again to resume"
+            ))
+
+    def _work(self, batch, chunk_size: int, settled: list):
+        """Settle agents of the batch until none is left or shutdown is requested"""
+        publisher = None
+        try:
+            publisher = EventPublisher()
+            while not self._shutdown_event.is_set():
+                try:
+                    payout = settle_next(batch, publisher, chunk_size)
+                except Exception as e:
+                    # The agent stays unsettled for the next run
+                    logger.error(f"Settlement worker stopped: {str(e)}")
+                    break
+                if payout is None:
+                    break
+                settled.append(payout.pk)
+        except Exception as e:
+            logger.error(f"Settlement worker failed to start: {str(e)}")
+        finally:
+            if publisher is not None:
+                publisher.close()
+            connection.close()
+
+    @staticmethod
+    def _cutoff(value):
+        if not value:
+            now = timezone.localtime()
+            return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        try:
+            cutoff = datetime.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f"Invalid --cutoff {value}, expected an ISO date or time")
+        return timezone.make_aware(cutoff) if timezone.is_naive(cutoff) else cutoff
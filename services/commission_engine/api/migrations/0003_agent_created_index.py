@@ -0,0 +1,17 @@
+# Generated by Django 4.2.9 on 2026-10-17 03:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_alter_commissiontransaction_status'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commissiontransaction',
+            index=models.Index(fields=['agent_id', 'created_at', 'transaction_id'], name='commission_agent_created_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-17 03:30
+
+import api.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_agent_created_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='commissiontransaction',
+            index=models.Index(condition=models.Q(('status', api.models.TransactionStatus(1))), fields=['agent_id', 'created_at'], name='commission_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 4.2.9 on 2026-10-17 03:37
+
+import api.models
+from django.db import migrations, models
+import django.db.models.deletion
+import enumchoicefield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_processed_events'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommissionSchedule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('agent_id', models.CharField(max_length=100)),
+                ('transaction_type', enumchoicefield.fields.EnumChoiceField(enum_class=api.models.TransactionType, max_length=20)),
+                ('provider', models.CharField(blank=True, max_length=50, null=True)),
+                ('effective_from', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'db_table': 'commission_schedules',
+                'ordering': ['agent_id', 'transaction_type', 'provider', 'effective_from'],
+            },
+        ),
+        migrations.CreateModel(
+            name='CommissionTier',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('min_amount', models.DecimalField(decimal_places=2, max_digits=12)),
+                ('rate', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('schedule', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tiers', to='api.commissionschedule')),
+            ],
+            options={
+                'db_table': 'commission_tiers',
+                'ordering': ['schedule', 'min_amount'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='commissionschedule',
+            index=models.Index(fields=['agent_id', 'effective_from'], name='schedule_agent_effective_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='commissiontier',
+            constraint=models.UniqueConstraint(fields=('schedule', 'min_amount'), name='tier_schedule_min_uniq'),
+        ),
+    ]
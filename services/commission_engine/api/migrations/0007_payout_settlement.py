@@ -0,0 +1,63 @@
+# Generated by Django 4.2.9 on 2026-10-17 03:42
+
+import api.models
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+import enumchoicefield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_commission_schedules'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayoutBatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cutoff', models.DateTimeField()),
+                ('status', enumchoicefield.fields.EnumChoiceField(default=api.models.PayoutBatchStatus(1), enum_class=api.models.PayoutBatchStatus, max_length=10)),
+                ('agent_count', models.PositiveIntegerField(default=0)),
+                ('commission_count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'db_table': 'payout_batches',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.CreateModel(
+            name='AgentPayout',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('agent_id', models.CharField(max_length=100)),
+                ('status', enumchoicefield.fields.EnumChoiceField(default=api.models.PayoutStatus(1), enum_class=api.models.PayoutStatus, max_length=10)),
+                ('commission_count', models.PositiveIntegerField(default=0)),
+                ('total_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=14)),
+                ('settled_at', models.DateTimeField(blank=True, null=True)),
+                ('batch', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payouts', to='api.payoutbatch')),
+            ],
+            options={
+                'db_table': 'agent_payouts',
+                'ordering': ['batch', 'agent_id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='commissiontransaction',
+            name='payout',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='commissions', to='api.agentpayout'),
+        ),
+        migrations.AddIndex(
+            model_name='agentpayout',
+            index=models.Index(condition=models.Q(('status', api.models.PayoutStatus(1))), fields=['batch', 'id'], name='payout_pending_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='agentpayout',
+            constraint=models.UniqueConstraint(fields=('batch', 'agent_id'), name='payout_batch_agent_uniq'),
+        ),
+    ]
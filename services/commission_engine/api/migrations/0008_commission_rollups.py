@@ -0,0 +1,40 @@
+# Generated by Django 4.2.9 on 2026-10-17 03:43
+
+import api.models
+from decimal import Decimal
+from django.db import migrations, models
+import enumchoicefield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_payout_settlement'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CommissionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('agent_id', models.CharField(max_length=100)),
+                ('granularity', enumchoicefield.fields.EnumChoiceField(enum_class=api.models.RollupGranularity, max_length=5)),
+                ('period', models.DateField()),
+                ('transaction_type', enumchoicefield.fields.EnumChoiceField(enum_class=api.models.TransactionType, max_length=20)),
+                ('status', enumchoicefield.fields.EnumChoiceField(enum_class=api.models.TransactionStatus, max_length=10)),
+                ('commission_count', models.IntegerField(default=0)),
+                ('transaction_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('commission_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=16)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'commission_rollups',
+                'ordering': ['agent_id', 'period'],
+                'indexes': [models.Index(fields=['agent_id', 'period'], name='rollup_agent_period_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='commissionrollup',
+            constraint=models.UniqueConstraint(fields=('agent_id', 'granularity', 'period', 'transaction_type', 'status'), name='rollup_key_uniq'),
+        ),
+    ]
@@ -14,6 +14,18 @@ class TransactionStatus(ChoiceEnum):
     PAID = "PAID"
     FAILED = "FAILED"
 
+class PayoutBatchStatus(ChoiceEnum):
+    OPEN = "OPEN"
+    COMPLETED = "COMPLETED"
+
+class PayoutStatus(ChoiceEnum):
+    PENDING = "PENDING"
+    SETTLED = "SETTLED"
+
+class RollupGranularity(ChoiceEnum):
+    DAY = "DAY"
+    MONTH = "MONTH"
+
 class CommissionRate(models.Model):
     agent_id = models.CharField(max_length=100, unique=True)
     wallet_load_rate = models.DecimalField(max_digits=5, decimal_places=2, default=Decimal('1.50'))
@@ -46,7 +58,170 @@ class CommissionTransaction(models.Model):
     status = EnumChoiceField(TransactionStatus, max_length=10, default=TransactionStatus.PENDING)
     created_at = models.DateTimeField(auto_now_add=True)
     paid_at = models.DateTimeField(null=True, blank=True)
+    # The settlement that paid it (see api.settlement)
+    payout = models.ForeignKey('AgentPayout', on_delete=models.SET_NULL, null=True, blank=True,
+                               related_name='commissions')
 
     class Meta:
         db_table = 'commission_transactions'
         ordering = ['-created_at']
+        indexes = [
+            # Serves the agent filter and keyset pages of an agent's commissions
+            models.Index(fields=['agent_id', 'created_at', 'transaction_id'], name='commission_agent_created_idx'),
+            # Unpaid commissions per agent, for payouts; paid rows drop out of it
+            models.Index(fields=['agent_id', 'created_at'], name='commission_pending_idx',
+                         condition=models.Q(status=TransactionStatus.PENDING)),
+        ]
+
+
+class CommissionSchedule(models.Model):
+    """
+    One version of an agent's tiered commission rates for a transaction
+    type, optionally for a single provider, in effect from effective_from
+    until the next version starts. Versions are not edited; a change is a
+    new version. Amounts no version covers earn the agent's flat
+    CommissionRate (see api.schedules).
+    """
+    agent_id = models.CharField(max_length=100)
+    transaction_type = EnumChoiceField(TransactionType, max_length=20)
+    # Provider code (TELEBIRR, CBE, ...); null applies to every provider
+    provider = models.CharField(max_length=50, null=True, blank=True)
+    effective_from = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'commission_schedules'
+        ordering = ['agent_id', 'transaction_type', 'provider', 'effective_from']
+        indexes = [
+            models.Index(fields=['agent_id', 'effective_from'], name='schedule_agent_effective_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.agent_id} - {self.transaction_type.value} - {self.provider or 'all'} from {self.effective_from}"
+
+
+class CommissionTier(models.Model):
+    """A slab of a schedule: amounts from min_amount up to the next tier earn rate percent"""
+    schedule = models.ForeignKey(CommissionSchedule, on_delete=models.CASCADE, related_name='tiers')
+    min_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    rate = models.DecimalField(max_digits=5, decimal_places=2)
+
+    class Meta:
+        db_table = 'commission_tiers'
+        ordering = ['schedule', 'min_amount']
+        constraints = [
+            models.UniqueConstraint(fields=['schedule', 'min_amount'], name='tier_schedule_min_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.rate}% from {self.min_amount}"
+
+
+class PayoutBatch(models.Model):
+    """
+    One settlement run: pays every commission still PENDING that was
+    created before cutoff, one AgentPayout per agent. Only one batch is
+    open at a time (see api.settlement).
+    """
+    cutoff = models.DateTimeField()
+    status = EnumChoiceField(PayoutBatchStatus, max_length=10, default=PayoutBatchStatus.OPEN)
+    agent_count = models.PositiveIntegerField(default=0)
+    commission_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'payout_batches'
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"Payout batch {self.pk} up to {self.cutoff} ({self.status.value})"
+
+
+class AgentPayout(models.Model):
+    """
+    An agent's share of a payout batch. The counts and total are estimated
+    when the batch is created and replaced with what was actually paid when
+    the agent is settled.
+    """
+    batch = models.ForeignKey(PayoutBatch, on_delete=models.CASCADE, related_name='payouts')
+    agent_id = models.CharField(max_length=100)
+    status = EnumChoiceField(PayoutStatus, max_length=10, default=PayoutStatus.PENDING)
+    commission_count = models.PositiveIntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'))
+    settled_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'agent_payouts'
+        ordering = ['batch', 'agent_id']
+        constraints = [
+            models.UniqueConstraint(fields=['batch', 'agent_id'], name='payout_batch_agent_uniq'),
+        ]
+        indexes = [
+            # Payouts left to settle, claimed by settlement workers
+            models.Index(fields=['batch', 'id'], name='payout_pending_idx',
+                         condition=models.Q(status=PayoutStatus.PENDING)),
+        ]
+
+    def __str__(self):
+        return f"{self.agent_id} - {self.total_amount} ({self.status.value})"
+
+
+class CommissionRollup(models.Model):
+    """
+    Commissions of an agent summed per day, transaction type and status,
+    kept current by every write to commission_transactions (see
+    api.rollups). Days of months past COMMISSION_ROLLUP_DAILY_MONTHS are
+    compacted into one row per month, whose period is the first of the
+    month.
+    """
+    agent_id = models.CharField(max_length=100)
+    granularity = EnumChoiceField(RollupGranularity, max_length=5)
+    period = models.DateField()
+    transaction_type = EnumChoiceField(TransactionType, max_length=20)
+    status = EnumChoiceField(TransactionStatus, max_length=10)
+    commission_count = models.IntegerField(default=0)
+    transaction_amount = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal('0.00'))
+    commission_amount = models.DecimalField(max_digits=16, decimal_places=2, default=Decimal('0.00'))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'commission_rollups'
+        ordering = ['agent_id', 'period']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['agent_id', 'granularity', 'period', 'transaction_type', 'status'],
+                name='rollup_key_uniq'
+            ),
+        ]
+        indexes = [
+            # An agent's summary over a date range
+            models.Index(fields=['agent_id', 'period'], name='rollup_agent_period_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.agent_id} - {self.period} - {self.transaction_type.value} - {self.status.value}"
+
+
+class ProcessedEvent(models.Model):
+    """
+    A message whose side effects were applied, recorded in the same
+    database transaction as them (see api.inbox), so a redelivery of it is
+    recognised and acknowledged without being applied again.
+    """
+    consumer = models.CharField(max_length=100)
+    event_id = models.CharField(max_length=100)
+    processed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'processed_events'
+        constraints = [
+            models.UniqueConstraint(fields=['consumer', 'event_id'], name='processed_event_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['processed_at'], name='processed_event_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.consumer} - {self.event_id}"
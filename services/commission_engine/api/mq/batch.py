@@ -0,0 +1,215 @@
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+from django.db import connection, transaction
+from django.utils import timezone
+from ..models import CommissionTransaction, TransactionStatus, TransactionType
+from .. import inbox
+from ..rates import ELIGIBLE, rate_table
+from ..rollups import RollupDeltas
+from .handlers import commission_rate, recorded_payload
+
+logger = logging.getLogger(__name__)
+
+_INSERT_SQL = """
+    INSERT INTO {table} (
+        transaction_id, agent_id, transaction_type, transaction_amount,
+        commission_rate, commission_amount, status, created_at, paid_at
+    )
+    VALUES {rows}
+    ON CONFLICT (transaction_id) DO NOTHING
+    RETURNING transaction_id
+"""
+
+
+class _Commission:
+    """One wallet event's commission"""
+    __slots__ = ('delivery_tag', 'transaction_id', 'agent_id', 'amount', 'transaction_type', 'data',
+                 'rate', 'commission_amount', 'outcome')
+
+    def __init__(self, delivery_tag, transaction_id, agent_id, amount, transaction_type, data):
+        self.delivery_tag = delivery_tag
+        self.transaction_id = transaction_id
+        self.agent_id = agent_id
+        self.amount = amount
+        self.transaction_type = transaction_type
+        self.data = data
+        self.rate = None
+        self.commission_amount = None
+        self.outcome = None  # 'recorded', 'skipped' or 'duplicate'
+
+
+class BatchCommissionHandler:
+    """
+    Records the commissions of a batch of wallet.credited and wallet.debited
+    events.
+
+    Rates are looked up and commissions computed in memory, then the batch
+    is written in one database transaction: its inbox rows in one INSERT and
+    its commissions in another, both ON CONFLICT DO NOTHING RETURNING, so
+    redeliveries are told apart by what each insert returns rather than by
+    IntegrityError. The commission.recorded and commission.skipped events go
+    out in one AMQP transaction before the commit, as on the single-message
+    path, and the batch is acked with a single multiple=True ack. A
+    redelivered event gets its commission.recorded published again from the
+    stored commission, in case the first one was lost after the commit.
+    """
+
+    def __init__(self, handler):
+        # handler.publisher publishes the batch; handler.handle_wallet_event
+        # records the deliveries one by one when a batch fails
+        self.handler = handler
+
+    def handle(self, ch, deliveries: list) -> None:
+        commissions = []
+        settled = set()
+
+        for method, properties, body in deliveries:
+            commission = self._parse(method.delivery_tag, body)
+            if commission is None:
+                ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+                settled.add(method.delivery_tag)
+            else:
+                commissions.append(commission)
+
+        processed = inbox.already_processed_many(
+            inbox.WALLET_EVENT, [commission.transaction_id for commission in commissions]
+        )
+        redelivered = len(commissions)
+        # Acked with the batch
+        commissions = [commission for commission in commissions if commission.transaction_id not in processed]
+        redelivered -= len(commissions)
+
+        try:
+            results = self._record(commissions, processed)
+        except Exception as e:
+            logger.error(f"Batch of {len(commissions)} wallet events failed, retrying one by one: {str(e)}")
+            for method, properties, body in deliveries:
+                if method.delivery_tag not in settled:
+                    self.handler.handle_wallet_event(ch, method, properties, body)
+            return
+
+        pending = [method.delivery_tag for method, _, _ in deliveries if method.delivery_tag not in settled]
+        if pending:
+            ch.basic_ack(delivery_tag=max(pending), multiple=True)
+        logger.info(
+            f"Recorded batch: {results['recorded']} recorded, {results['skipped']} skipped, "
+            f"{results['duplicate'] + redelivered} redelivered, {len(deliveries)} deliveries"
+        )
+
+    @staticmethod
+    def _parse(delivery_tag, body: bytes):
+        try:
+            data = json.loads(body)
+            transaction_id = data.get('transaction_id')
+            agent_id = data.get('agent_id')
+            amount = Decimal(str(data.get('amount', 0)))
+            event_transaction_type = data.get('transaction_type')
+            if not all([transaction_id, agent_id, event_transaction_type]):
+                logger.error(f"Missing required fields in wallet event: {data}")
+                return None
+            return _Commission(
+                delivery_tag, transaction_id, agent_id, amount, TransactionType[event_transaction_type], data
+            )
+        except KeyError as e:
+            logger.error(f"Invalid transaction type {str(e)} in wallet event")
+            return None
+        except (ValueError, TypeError, InvalidOperation, AttributeError) as e:
+            logger.error(f"Undecodable wallet event: {str(e)}")
+            return None
+
+    def _record(self, commissions: list, replayed: set) -> dict:
+        """Record the commissions; replayed are transaction_ids of redeliveries to publish again"""
+        results = {'recorded': 0, 'skipped': 0, 'duplicate': 0}
+        events = []
+        replayed = set(replayed)
+
+        for commission in commissions:
+            rates = rate_table.get(commission.agent_id)
+            if rates is None or not rates[ELIGIBLE]:
+                commission.outcome = 'skipped'
+                results['skipped'] += 1
+                events.append(('commission.skipped', {
+                    'transaction_id': commission.transaction_id,
+                    'agent_id': commission.agent_id,
+                    'reason': 'commission_rate_not_found' if rates is None else 'agent_not_eligible'
+                }))
+                continue
+            commission.rate = commission_rate(
+                commission.agent_id, rates, commission.transaction_type, commission.amount, commission.data
+            )
+            commission.commission_amount = (commission.amount * commission.rate) / Decimal('100')
+        commissions = [commission for commission in commissions if commission.outcome is None]
+
+        with transaction.atomic():
+            if commissions:
+                # Inbox rows first, as record() on the single-message path;
+                # a transaction_id seen twice in the batch is fresh only once
+                fresh = inbox.record_many(inbox.WALLET_EVENT, [commission.transaction_id for commission in commissions])
+                for commission in commissions:
+                    if str(commission.transaction_id) in fresh:
+                        fresh.discard(str(commission.transaction_id))
+                    else:
+                        commission.outcome = 'duplicate'
+                        results['duplicate'] += 1
+                        replayed.add(commission.transaction_id)
+                commissions = [commission for commission in commissions if commission.outcome is None]
+
+            # Commissions recorded before the inbox existed have no inbox
+            # row; the unique transaction_id turns those away
+            now = timezone.now()
+            inserted = self._insert(commissions, now)
+            rollups = RollupDeltas()
+            for commission in commissions:
+                if commission.transaction_id in inserted:
+                    commission.outcome = 'recorded'
+                    rollups.add(
+                        commission.agent_id, now, commission.transaction_type, TransactionStatus.PENDING,
+                        1, commission.amount, commission.commission_amount
+                    )
+                    events.append(('commission.recorded', {
+                        'transaction_id': commission.transaction_id,
+                        'agent_id': commission.agent_id,
+                        'transaction_type': commission.transaction_type.name,
+                        'commission_rate': str(commission.rate),
+                        'commission_amount': str(commission.commission_amount)
+                    }))
+                else:
+                    commission.outcome = 'duplicate'
+                    replayed.add(commission.transaction_id)
+                results[commission.outcome] += 1
+            rollups.apply()
+
+            if replayed:
+                events.extend(
+                    ('commission.recorded', recorded_payload(commission))
+                    for commission in CommissionTransaction.objects.filter(transaction_id__in=replayed)
+                )
+
+            # Publish before commit, so a broker failure rolls the batch back
+            # instead of losing events
+            self.handler.publisher.publish_batch(events)
+
+        return results
+
+    @staticmethod
+    def _insert(commissions: list, now) -> set:
+        """Insert the commissions in one statement; returns the transaction_ids actually inserted"""
+        if not commissions:
+            return set()
+        params = []
+        for commission in commissions:
+            params.extend([
+                commission.transaction_id, commission.agent_id, commission.transaction_type.name,
+                commission.amount, commission.rate, commission.commission_amount,
+                TransactionStatus.PENDING.name, now, None
+            ])
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _INSERT_SQL.format(
+                    table=CommissionTransaction._meta.db_table,
+                    rows=', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s)'] * len(commissions))
+                ),
+                params
+            )
+            return {row[0] for row in cursor.fetchall()}
@@ -1,8 +1,13 @@
 import os
+import time
 import django
 import logging
+from django.conf import settings
 from .client import RabbitMQClient
 from .handlers import EventHandler
+from .batch import BatchCommissionHandler
+from ..rates import RATE_CHANGED_EVENT, rate_table
+from ..schedules import schedule_cache
 
 # Set up Django environment
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'commission_engine.settings')
@@ -11,11 +16,25 @@ django.setup()
 logger = logging.getLogger(__name__)
 
 class EventConsumer:
+    """
+    Consumes every commission engine queue on one channel. With
+    COMMISSION_BATCH_SIZE above one, wallet events are collected until the
+    batch is full or COMMISSION_BATCH_WINDOW_MS passes, and recorded
+    together; other events are still handled as they arrive.
+    """
+
     def __init__(self):
         logger.info("Initializing commission engine consumer")
         self.client = RabbitMQClient()
         self.handler = EventHandler()
+        self.batch_size = settings.COMMISSION_BATCH_SIZE
+        self.batch = BatchCommissionHandler(self.handler) if self.batch_size > 1 else None
+        self._pending = []  # wallet event deliveries waiting for their batch
+        self._stopping = False
         self.setup_queues()
+        # Loaded after subscribing to rate changes, so none is missed
+        rate_table.load()
+        schedule_cache.load()
 
     def setup_queues(self):
         """Declare queues and set up bindings"""
@@ -34,6 +53,11 @@ class EventConsumer:
                     durable=True
                 )
             
+            # Set prefetch count to ensure fair dispatch; a batch can only
+            # fill up if the broker sends that many unacked. The limit only
+            # applies to consumers registered after it, so it comes first
+            self.client.channel.basic_qos(prefetch_count=self.batch_size if self.batch else 1)
+
             # Declare queues and bind them
             for exchange, routing_keys in exchanges.items():
                 for key in routing_keys:
@@ -52,8 +76,19 @@ class EventConsumer:
                         auto_ack=False
                     )
             
-            # Set prefetch count to ensure fair dispatch
-            self.client.channel.basic_qos(prefetch_count=1)
+            # Every consumer keeps its own rate table, so each gets its own
+            # copy of rate changes on a private queue
+            result = self.client.channel.queue_declare(queue='', exclusive=True)
+            self.client.channel.queue_bind(
+                exchange='commission_events',
+                queue=result.method.queue,
+                routing_key=RATE_CHANGED_EVENT
+            )
+            self.client.channel.basic_consume(
+                queue=result.method.queue,
+                on_message_callback=self._create_callback(RATE_CHANGED_EVENT),
+                auto_ack=False
+            )
             
             logger.info("Successfully set up exchanges and queues")
             
@@ -68,7 +103,12 @@ class EventConsumer:
                 if routing_key == 'agent.created':
                     self.handler.handle_agent_created(ch, method, properties, body)
                 elif routing_key in ['wallet.credited', 'wallet.debited']:
-                    self.handler.handle_wallet_event(ch, method, properties, body)
+                    if self.batch:
+                        self._pending.append((method, properties, body))
+                    else:
+                        self.handler.handle_wallet_event(ch, method, properties, body)
+                elif routing_key == RATE_CHANGED_EVENT:
+                    self.handler.handle_rate_changed(ch, method, properties, body)
                 else:
                     logger.warning(f"No handler for routing key: {routing_key}")
                     ch.basic_ack(delivery_tag=method.delivery_tag)
@@ -81,7 +121,10 @@ class EventConsumer:
         """Start consuming messages"""
         try:
             logger.info("Commission engine consumer started")
-            self.client.channel.start_consuming()
+            if self.batch:
+                self._consume_batches()
+            else:
+                self.client.channel.start_consuming()
         except KeyboardInterrupt:
             self.stop()
         except Exception as e:
@@ -89,9 +132,33 @@ class EventConsumer:
             self.stop()
             raise
 
+    def _consume_batches(self):
+        """Dispatch deliveries and record wallet events in batches until stop()"""
+        connection = self.client.connection
+        channel = self.client.channel
+        window = settings.COMMISSION_BATCH_WINDOW_MS / 1000
+        deadline = None
+        while not self._stopping and channel.is_open:
+            # Returns once deliveries were dispatched or the window passed
+            connection.process_data_events(time_limit=window)
+            if not self._pending:
+                continue
+            if deadline is None:
+                deadline = time.monotonic() + window
+            if len(self._pending) >= self.batch_size or time.monotonic() >= deadline:
+                batch, self._pending, deadline = self._pending, [], None
+                try:
+                    self.batch.handle(channel, batch)
+                except Exception as e:
+                    logger.error(f"Error processing batch of {len(batch)} wallet events: {str(e)}")
+                    channel.basic_nack(delivery_tag=batch[-1][0].delivery_tag, multiple=True, requeue=True)
+
     def stop(self):
         """Stop consuming messages and close connections"""
         try:
+            # Deliveries still pending in a batch are redelivered once the
+            # channel closes
+            self._stopping = True
             if self.client.channel:
                 self.client.channel.stop_consuming()
             self.handler.close()
@@ -1,18 +1,56 @@
 import json
 import logging
 from decimal import Decimal
-from django.core.cache import cache
-from django.conf import settings
-from django.db import IntegrityError
+from django.db import IntegrityError, transaction
 from ..models import CommissionRate, CommissionTransaction, TransactionType
 from .publisher import EventPublisher
+from .. import inbox
+from ..rates import ELIGIBLE, RATE_CHANGED_EVENT, RATE_INDEX, rate_changed_payload, rate_table
+from ..rollups import RollupDeltas
+from ..schedules import event_timestamp, schedule_cache
 
 logger = logging.getLogger(__name__)
 
+
+def commission_rate(agent_id: str, rates: tuple, transaction_type: TransactionType, amount: Decimal, data: dict) -> Decimal:
+    """
+    Rate for a wallet event: the agent's tiered schedule in effect when the
+    transaction was initiated wins over the flat rate in its rate entry
+    """
+    schedule = schedule_cache.get(agent_id)
+    rate = schedule.rate_for(
+        transaction_type.name, data.get('provider'), amount, event_timestamp(data.get('initiated_at'))
+    ) if schedule is not None else None
+    return rate if rate is not None else rates[RATE_INDEX[transaction_type]]
+
+
+def recorded_payload(commission: CommissionTransaction) -> dict:
+    """Message body of the commission.recorded event of a commission"""
+    return {
+        'transaction_id': commission.transaction_id,
+        'agent_id': commission.agent_id,
+        'transaction_type': commission.transaction_type.name,
+        'commission_rate': str(commission.commission_rate),
+        'commission_amount': str(commission.commission_amount)
+    }
+
+
 class EventHandler:
     def __init__(self):
         self.publisher = EventPublisher()
 
+    def _replay(self, ch, method, transaction_id) -> None:
+        """
+        Acknowledge a redelivered wallet event whose commission is already
+        recorded, publishing commission.recorded again from the stored
+        commission, as the first one may have been lost after the commit
+        """
+        commission = CommissionTransaction.objects.filter(transaction_id=transaction_id).first()
+        if commission is not None:
+            self.publisher.publish_event('commission.recorded', recorded_payload(commission))
+        logger.info(f"Commission already recorded for transaction {transaction_id}, acknowledging redelivery")
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+
     def handle_agent_created(self, ch, method, properties, body):
         try:
             # Log the raw event data for debugging
@@ -50,10 +88,14 @@ class EventHandler:
                         bank_withdrawal_rate=Decimal('1.25')
                     )
                     logger.info(f"Successfully created commission rates for agent {agent_id}")
-                    
-                    # Cache the commission rate
-                    cache_key = f'commission_rate_{agent_id}'
-                    cache.set(cache_key, commission_rate, timeout=settings.CACHE_TTL)
+
+                    # Other consumers may have remembered the agent as
+                    # having no rates
+                    rate_table.set(commission_rate)
+                    try:
+                        self.publisher.publish_event(RATE_CHANGED_EVENT, rate_changed_payload(commission_rate))
+                    except Exception as e:
+                        logger.error(f"Failed to publish {RATE_CHANGED_EVENT} for agent {agent_id}: {str(e)}")
                     
                     ch.basic_ack(delivery_tag=method.delivery_tag)
                 except IntegrityError as e:
@@ -78,28 +120,25 @@ class EventHandler:
             event_type = method.routing_key
             
             logger.info(f"Processing wallet event: type={event_type}, agent={agent_id}, transaction={transaction_id}, amount={amount}")
+
+            if transaction_id and inbox.already_processed(inbox.WALLET_EVENT, transaction_id):
+                self._replay(ch, method, transaction_id)
+                return
             
-            # Get commission rate from cache or database
-            cache_key = f'commission_rate_{agent_id}'
-            commission_rate = cache.get(cache_key)
-            
-            if not commission_rate:
-                try:
-                    commission_rate = CommissionRate.objects.get(agent_id=agent_id)
-                    cache.set(cache_key, commission_rate, timeout=settings.CACHE_TTL)
-                    logger.info(f"Retrieved commission rate from database for agent {agent_id}")
-                except CommissionRate.DoesNotExist:
-                    logger.error(f"No commission rate found for agent {agent_id}")
-                    self.publisher.publish_event('commission.skipped', {
-                        'transaction_id': transaction_id,
-                        'agent_id': agent_id,
-                        'reason': 'commission_rate_not_found'
-                    })
-                    ch.basic_ack(delivery_tag=method.delivery_tag)
-                    return
+            # Rates come from the in-process table
+            rates = rate_table.get(agent_id)
+            if rates is None:
+                logger.error(f"No commission rate found for agent {agent_id}")
+                self.publisher.publish_event('commission.skipped', {
+                    'transaction_id': transaction_id,
+                    'agent_id': agent_id,
+                    'reason': 'commission_rate_not_found'
+                })
+                ch.basic_ack(delivery_tag=method.delivery_tag)
+                return
             
             # Check eligibility
-            if not commission_rate.is_eligible:
+            if not rates[ELIGIBLE]:
                 logger.info(f"Agent {agent_id} is not eligible for commission")
                 self.publisher.publish_event('commission.skipped', {
                     'transaction_id': transaction_id,
@@ -128,7 +167,7 @@ class EventHandler:
                 return
             
             # Calculate commission
-            rate = commission_rate.get_rate_for_transaction_type(transaction_type)
+            rate = commission_rate(agent_id, rates, transaction_type, amount, data)
             commission_amount = (amount * rate) / Decimal('100')
             
             logger.info(
@@ -137,31 +176,33 @@ class EventHandler:
             )
             
             try:
-                # Create commission transaction record
-                CommissionTransaction.objects.create(
-                    transaction_id=transaction_id,
-                    agent_id=agent_id,
-                    transaction_type=transaction_type,
-                    transaction_amount=amount,
-                    commission_rate=rate,
-                    commission_amount=commission_amount
-                )
-                
-                # Publish commission recorded event
-                self.publisher.publish_event('commission.recorded', {
-                    'transaction_id': transaction_id,
-                    'agent_id': agent_id,
-                    'transaction_type': transaction_type.name,
-                    'commission_rate': str(rate),
-                    'commission_amount': str(commission_amount)
-                })
-                
+                with transaction.atomic():
+                    if not inbox.record(inbox.WALLET_EVENT, transaction_id):
+                        self._replay(ch, method, transaction_id)
+                        return
+
+                    # Create commission transaction record
+                    commission = CommissionTransaction.objects.create(
+                        transaction_id=transaction_id,
+                        agent_id=agent_id,
+                        transaction_type=transaction_type,
+                        transaction_amount=amount,
+                        commission_rate=rate,
+                        commission_amount=commission_amount
+                    )
+                    rollups = RollupDeltas()
+                    rollups.add_commission(commission)
+                    rollups.apply()
+
+                    # Publish before commit, so a broker failure rolls the
+                    # record back instead of losing the event
+                    self.publisher.publish_event('commission.recorded', recorded_payload(commission))
+
                 logger.info(f"Successfully recorded commission for transaction {transaction_id}")
                 ch.basic_ack(delivery_tag=method.delivery_tag)
                 
             except IntegrityError:
-                logger.info(f"Commission already recorded for transaction {transaction_id}")
-                ch.basic_ack(delivery_tag=method.delivery_tag)
+                self._replay(ch, method, transaction_id)
             except Exception as e:
                 logger.error(f"Failed to record commission: {str(e)}")
                 ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
@@ -170,5 +211,26 @@ class EventHandler:
             logger.error(f"Failed to process wallet event: {str(e)}")
             ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
 
+    def handle_rate_changed(self, ch, method, properties, body):
+        """
+        Handle commission_rate.changed event
+        Drops the agent from this consumer's rate table and schedule cache;
+        both are reloaded on its next lookup
+        """
+        try:
+            data = json.loads(body)
+            agent_id = data.get('agent_id')
+            if not agent_id:
+                logger.error(f"No agent_id in {RATE_CHANGED_EVENT} event")
+                ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+                return
+            rate_table.invalidate(agent_id)
+            schedule_cache.invalidate(agent_id)
+            logger.info(f"Invalidated commission rates of agent {agent_id}")
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+        except Exception as e:
+            logger.error(f"Error handling {RATE_CHANGED_EVENT} event: {str(e)}")
+            ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+
     def close(self):
         self.publisher.close() 
\ No newline at end of file
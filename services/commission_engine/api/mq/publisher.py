@@ -8,6 +8,7 @@ logger = logging.getLogger(__name__)
 class EventPublisher:
     def __init__(self):
         self.client = RabbitMQClient()
+        self._tx_channel = None
 
     def publish_event(self, event_type: str, data: dict):
         try:
@@ -26,5 +27,37 @@ class EventPublisher:
             logger.error(f"Failed to publish event {event_type}: {str(e)}")
             raise
 
+    def publish_batch(self, events: list):
+        """
+        Publish (event_type, data) pairs in one AMQP transaction, so a batch
+        costs one broker round trip and the broker takes all of it or none.
+        A channel cannot be in confirm and tx mode at once, so batches go out
+        on a second channel of the same connection.
+        """
+        if not events:
+            return
+        try:
+            self.client.ensure_connection()
+            channel = self._tx_channel
+            if channel is None or not channel.is_open:
+                channel = self._tx_channel = self.client.connection.channel()
+                channel.tx_select()
+            properties = pika.BasicProperties(
+                delivery_mode=2,  # make message persistent
+                content_type='application/json'
+            )
+            for event_type, data in events:
+                channel.basic_publish(
+                    exchange='commission_events',
+                    routing_key=event_type,
+                    body=json.dumps(data),
+                    properties=properties
+                )
+            channel.tx_commit()
+            logger.info(f"Published batch of {len(events)} events")
+        except Exception as e:
+            logger.error(f"Failed to publish batch of {len(events)} events: {str(e)}")
+            raise
+
     def close(self):
         self.client.close() 
\ No newline at end of file
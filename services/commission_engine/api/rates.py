@@ -0,0 +1,83 @@
+import logging
+import time
+from typing import Optional
+from django.conf import settings
+from .models import CommissionRate, TransactionType
+
+logger = logging.getLogger(__name__)
+
+RATE_CHANGED_EVENT = 'commission_rate.changed'
+
+# Position of each transaction type's rate in a rate table entry
+RATE_INDEX = {
+    TransactionType.WALLET_LOAD: 0,
+    TransactionType.BANK_DEPOSIT: 1,
+    TransactionType.BANK_WITHDRAWAL: 2,
+}
+ELIGIBLE = 3
+
+_COLUMNS = ('agent_id', 'wallet_load_rate', 'bank_deposit_rate', 'bank_withdrawal_rate', 'is_eligible')
+
+
+class RateTable:
+    """
+    Every agent's commission rates held in process, as agent_id ->
+    (wallet_load_rate, bank_deposit_rate, bank_withdrawal_rate, is_eligible),
+    so commission calculation reads a dict instead of Redis or the database.
+
+    The table is loaded in full at consumer start and again every
+    COMMISSION_RATE_TABLE_REFRESH seconds as a safety net; in between,
+    commission_rate.changed events invalidate single agents, which are then
+    reloaded on their next lookup. An agent without rates is remembered as
+    None until its rates change.
+    """
+
+    def __init__(self):
+        self._rates = {}
+        self._loaded_at = None
+
+    def load(self) -> int:
+        """Replace the table with all rates, streamed from the database"""
+        rates = {
+            row[0]: tuple(row[1:])
+            for row in CommissionRate.objects.order_by().values_list(*_COLUMNS).iterator(chunk_size=5000)
+        }
+        self._rates = rates
+        self._loaded_at = time.monotonic()
+        logger.info(f"Loaded commission rates for {len(rates)} agents")
+        return len(rates)
+
+    def get(self, agent_id: str) -> Optional[tuple]:
+        """The agent's rate entry, or None if the agent has no rates"""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > settings.COMMISSION_RATE_TABLE_REFRESH:
+            self.load()
+        try:
+            return self._rates[agent_id]
+        except KeyError:
+            row = CommissionRate.objects.filter(agent_id=agent_id).values_list(*_COLUMNS[1:]).first()
+            entry = self._rates[agent_id] = tuple(row) if row is not None else None
+            return entry
+
+    def set(self, rate: CommissionRate) -> None:
+        self._rates[rate.agent_id] = entry_for(rate)
+
+    def invalidate(self, agent_id: str) -> None:
+        self._rates.pop(agent_id, None)
+
+
+def entry_for(rate: CommissionRate) -> tuple:
+    return (rate.wallet_load_rate, rate.bank_deposit_rate, rate.bank_withdrawal_rate, rate.is_eligible)
+
+
+def rate_changed_payload(rate: CommissionRate) -> dict:
+    """Message body of the commission_rate.changed event"""
+    return {
+        'agent_id': rate.agent_id,
+        'wallet_load_rate': str(rate.wallet_load_rate),
+        'bank_deposit_rate': str(rate.bank_deposit_rate),
+        'bank_withdrawal_rate': str(rate.bank_withdrawal_rate),
+        'is_eligible': rate.is_eligible,
+    }
+
+
+rate_table = RateTable()
@@ -0,0 +1,184 @@
+import logging
+from collections import defaultdict
+from datetime import date
+from decimal import Decimal
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import CommissionRollup, CommissionTransaction, RollupGranularity, TransactionStatus, TransactionType
+
+logger = logging.getLogger(__name__)
+
+_COLUMNS = """
+    agent_id, granularity, period, transaction_type, status,
+    commission_count, transaction_amount, commission_amount, updated_at
+"""
+
+_ADD_SQL = """
+    INSERT INTO {table} AS rollup ({columns})
+    {rows}
+    ON CONFLICT (agent_id, granularity, period, transaction_type, status) DO UPDATE SET
+        commission_count = rollup.commission_count + EXCLUDED.commission_count,
+        transaction_amount = rollup.transaction_amount + EXCLUDED.transaction_amount,
+        commission_amount = rollup.commission_amount + EXCLUDED.commission_amount,
+        updated_at = EXCLUDED.updated_at
+"""
+
+# Moves one month of daily rows into its monthly rows in one statement; a
+# data-modifying WITH must lead the statement, so it goes before the INSERT
+_COMPACT_WITH = """
+    WITH moved AS (
+        DELETE FROM {table}
+        WHERE granularity = %(day)s AND period >= %(month)s AND period < %(next_month)s
+        RETURNING agent_id, transaction_type, status, commission_count, transaction_amount, commission_amount
+    )
+"""
+
+_COMPACT_ROWS = """
+    SELECT agent_id, %(granularity)s, %(month)s, transaction_type, status,
+           SUM(commission_count), SUM(transaction_amount), SUM(commission_amount), now()
+    FROM moved
+    GROUP BY agent_id, transaction_type, status
+"""
+
+_REBUILD_ROWS = """
+    SELECT agent_id,
+           CASE WHEN day < %(since)s THEN %(month)s ELSE %(day)s END,
+           CASE WHEN day < %(since)s THEN date_trunc('month', day)::date ELSE day END,
+           transaction_type, status,
+           COUNT(*), SUM(transaction_amount), SUM(commission_amount), now()
+    FROM (
+        SELECT agent_id, (created_at AT TIME ZONE %(time_zone)s)::date AS day,
+               transaction_type, status, transaction_amount, commission_amount
+        FROM {source}
+    ) AS commissions
+    GROUP BY 1, 2, 3, 4, 5
+"""
+
+
+def daily_since(today: date = None) -> date:
+    """First day rolled up per day; earlier days belong to monthly rows"""
+    today = today or timezone.localdate()
+    month = today.year * 12 + today.month - 1 - settings.COMMISSION_ROLLUP_DAILY_MONTHS
+    return date(month // 12, month % 12 + 1, 1)
+
+
+class RollupDeltas:
+    """
+    Changes to the rollups, summed per row and written in one upsert by
+    apply(), which belongs in the database transaction of the commission
+    writes it mirrors. Rows are upserted in key order so concurrent writers
+    cannot deadlock. A change to a day that is already compacted goes to its
+    monthly row; a day row written while its month is being compacted is
+    folded in by the next compaction, and sums stay right meanwhile.
+    """
+
+    def __init__(self):
+        self._since = daily_since()
+        self._deltas = defaultdict(lambda: [0, Decimal('0.00'), Decimal('0.00')])
+
+    def add(self, agent_id: str, created_at, transaction_type: TransactionType, status: TransactionStatus,
+            count: int, transaction_amount: Decimal, commission_amount: Decimal) -> None:
+        day = timezone.localtime(created_at).date()
+        if day < self._since:
+            key = (agent_id, RollupGranularity.MONTH.name, day.replace(day=1), transaction_type.name, status.name)
+        else:
+            key = (agent_id, RollupGranularity.DAY.name, day, transaction_type.name, status.name)
+        delta = self._deltas[key]
+        delta[0] += count
+        delta[1] += transaction_amount
+        delta[2] += commission_amount
+
+    def add_commission(self, commission: CommissionTransaction, sign: int = 1) -> None:
+        """Count a commission row in (or, with sign -1, out of) the rollups"""
+        self.add(
+            commission.agent_id, commission.created_at, commission.transaction_type, commission.status,
+            sign, sign * commission.transaction_amount, sign * commission.commission_amount
+        )
+
+    def move(self, agent_id: str, created_at, transaction_type: TransactionType, from_status: TransactionStatus,
+             to_status: TransactionStatus, transaction_amount: Decimal, commission_amount: Decimal) -> None:
+        """Move one commission from one status to another"""
+        self.add(agent_id, created_at, transaction_type, from_status, -1, -transaction_amount, -commission_amount)
+        self.add(agent_id, created_at, transaction_type, to_status, 1, transaction_amount, commission_amount)
+
+    def apply(self, chunk_size: int = 1000) -> None:
+        keys = sorted(key for key, delta in self._deltas.items() if any(delta))
+        now = timezone.now()
+        with connection.cursor() as cursor:
+            for start in range(0, len(keys), chunk_size):
+                chunk = keys[start:start + chunk_size]
+                params = []
+                for key in chunk:
+                    params.extend(key)
+                    params.extend(self._deltas[key])
+                    params.append(now)
+                cursor.execute(
+                    _ADD_SQL.format(
+                        table=CommissionRollup._meta.db_table,
+                        columns=_COLUMNS,
+                        rows='VALUES ' + ', '.join(['(%s, %s, %s, %s, %s, %s, %s, %s, %s)'] * len(chunk))
+                    ),
+                    params
+                )
+        self._deltas.clear()
+
+
+def compact(before: date = None) -> int:
+    """
+    Fold the daily rows of months starting before `before` (by default
+    daily_since()) into monthly rows, a month per transaction; returns how
+    many months were compacted
+    """
+    before = before or daily_since()
+    table = CommissionRollup._meta.db_table
+    months = sorted({
+        period.replace(day=1)
+        for period in CommissionRollup.objects.filter(
+            granularity=RollupGranularity.DAY, period__lt=before
+        ).values_list('period', flat=True).distinct()
+    })
+    for month in months:
+        next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                _COMPACT_WITH.format(table=table) + _ADD_SQL.format(
+                    table=table,
+                    columns=_COLUMNS,
+                    rows=_COMPACT_ROWS
+                ),
+                {
+                    'day': RollupGranularity.DAY.name,
+                    'granularity': RollupGranularity.MONTH.name,
+                    'month': month,
+                    'next_month': next_month,
+                }
+            )
+        logger.info(f"Compacted commission rollups of {month:%Y-%m}")
+    return len(months)
+
+
+def rebuild() -> None:
+    """
+    Recompute every rollup from commission_transactions, e.g. to backfill
+    commissions recorded before the rollups existed. Rollup writers wait on
+    the table lock until it commits and then apply on top of it.
+    """
+    table = CommissionRollup._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {table} IN EXCLUSIVE MODE")
+        cursor.execute(f"DELETE FROM {table}")
+        cursor.execute(
+            _ADD_SQL.format(
+                table=table,
+                columns=_COLUMNS,
+                rows=_REBUILD_ROWS.format(source=CommissionTransaction._meta.db_table)
+            ),
+            {
+                'since': daily_since(),
+                'day': RollupGranularity.DAY.name,
+                'month': RollupGranularity.MONTH.name,
+                'time_zone': settings.TIME_ZONE,
+            }
+        )
+    logger.info("Rebuilt commission rollups")
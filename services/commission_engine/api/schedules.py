@@ -0,0 +1,174 @@
+import logging
+import time
+from bisect import bisect_right
+from datetime import datetime
+from decimal import Decimal
+from itertools import groupby
+from typing import Iterable, Optional
+from django.conf import settings
+from django.db.models import Count, Max
+from .models import CommissionSchedule, CommissionTier
+
+logger = logging.getLogger(__name__)
+
+_TIER_COLUMNS = (
+    'schedule__agent_id', 'schedule__transaction_type', 'schedule__provider',
+    'schedule__effective_from', 'schedule_id', 'min_amount', 'rate',
+)
+
+
+class CompiledSchedule:
+    """
+    An agent's schedules compiled for lookup. lines maps a transaction type
+    name to its lines by provider code (None for the line of every
+    provider); a line is a sorted tuple of version start timestamps and,
+    per version, a sorted tuple of tier boundaries with the matching rates.
+    A lookup is two dict probes and two bisects. version identifies the
+    schedule rows it was compiled from.
+    """
+    __slots__ = ('lines', 'version')
+
+    def __init__(self, lines: dict, version: tuple):
+        self.lines = lines
+        self.version = version
+
+    def rate_for(self, transaction_type: str, provider: Optional[str], amount: Decimal, at: float) -> Optional[Decimal]:
+        """
+        Rate of the tier amount falls in, under the version in effect at
+        timestamp at; the provider's own line wins over the line for every
+        provider. None when no version covers it.
+        """
+        lines = self.lines.get(transaction_type)
+        if lines is None:
+            return None
+        line = lines.get(provider)
+        if line is not None:
+            rate = _rate_in(line, amount, at)
+            if rate is not None or provider is None:
+                return rate
+        line = lines.get(None)
+        return _rate_in(line, amount, at) if line is not None else None
+
+
+def _rate_in(line: tuple, amount: Decimal, at: float) -> Optional[Decimal]:
+    starts, versions = line
+    version = bisect_right(starts, at) - 1
+    if version < 0:
+        return None
+    bounds, rates = versions[version]
+    tier = bisect_right(bounds, amount) - 1
+    return rates[tier] if tier >= 0 else None
+
+
+def compile_schedule(rows: Iterable[tuple], version: tuple) -> CompiledSchedule:
+    """
+    Compile one agent's tier rows, given as (transaction type name, provider,
+    effective_from, schedule id, min_amount, rate) ordered by line,
+    effective_from, schedule id and min_amount
+    """
+    lines = {}
+    for (transaction_type, provider, effective_from, _), tiers in groupby(rows, key=lambda row: row[:4]):
+        tiers = list(tiers)
+        starts, versions = lines.setdefault(transaction_type, {}).setdefault(provider, ([], []))
+        starts.append(effective_from.timestamp())
+        versions.append((tuple(tier[4] for tier in tiers), tuple(tier[5] for tier in tiers)))
+    return CompiledSchedule(
+        {
+            transaction_type: {
+                provider: (tuple(starts), tuple(versions)) for provider, (starts, versions) in by_provider.items()
+            }
+            for transaction_type, by_provider in lines.items()
+        },
+        version
+    )
+
+
+class ScheduleCache:
+    """
+    Compiled schedules of every agent that has any, held in process.
+
+    An agent is compiled on its first lookup, or by the full load at
+    consumer start; a commission_rate.changed event drops it so it is
+    recompiled on its next lookup. Every COMMISSION_RATE_TABLE_REFRESH
+    seconds the schedule versions are compared and only agents whose
+    schedules changed are recompiled.
+    """
+
+    def __init__(self):
+        self._compiled = {}
+        self._loaded_at = None
+
+    def load(self, chunk_size: int = 1000) -> int:
+        """Recompile the agents whose schedules changed since they were compiled; returns how many"""
+        versions = {
+            row['agent_id']: (row['last_id'], row['count'])
+            for row in CommissionSchedule.objects.order_by().values('agent_id').annotate(
+                last_id=Max('id'), count=Count('id')
+            )
+        }
+        # Agents known to have no schedules stay cached as None
+        compiled = {
+            agent_id: schedule for agent_id, schedule in self._compiled.items()
+            if (schedule is None and agent_id not in versions)
+            or (schedule is not None and versions.get(agent_id) == schedule.version)
+        }
+        stale = sorted(agent_id for agent_id in versions if agent_id not in compiled)
+        for start in range(0, len(stale), chunk_size):
+            chunk = stale[start:start + chunk_size]
+            for agent_id, schedule in self._compile_agents(chunk, versions):
+                compiled[agent_id] = schedule
+
+        self._compiled = compiled
+        self._loaded_at = time.monotonic()
+        logger.info(f"Compiled commission schedules for {len(stale)} agents")
+        return len(stale)
+
+    def get(self, agent_id: str) -> Optional[CompiledSchedule]:
+        """The agent's compiled schedules, or None if the agent has none"""
+        if self._loaded_at is None or time.monotonic() - self._loaded_at > settings.COMMISSION_RATE_TABLE_REFRESH:
+            self.load()
+        try:
+            return self._compiled[agent_id]
+        except KeyError:
+            version = CommissionSchedule.objects.filter(agent_id=agent_id).aggregate(
+                last_id=Max('id'), count=Count('id')
+            )
+            schedule = None
+            if version['count']:
+                schedule = next(
+                    (schedule for _, schedule in
+                     self._compile_agents([agent_id], {agent_id: (version['last_id'], version['count'])})),
+                    None
+                )
+            self._compiled[agent_id] = schedule
+            return schedule
+
+    def invalidate(self, agent_id: str) -> None:
+        self._compiled.pop(agent_id, None)
+
+    @staticmethod
+    def _compile_agents(agent_ids: list, versions: dict):
+        rows = (
+            CommissionTier.objects.filter(schedule__agent_id__in=agent_ids)
+            .order_by(*_TIER_COLUMNS[:5], 'min_amount')
+            .values_list(*_TIER_COLUMNS)
+            .iterator(chunk_size=5000)
+        )
+        for agent_id, agent_rows in groupby(rows, key=lambda row: row[0]):
+            yield agent_id, compile_schedule(
+                ((row[1].name,) + row[2:] for row in agent_rows),
+                versions[agent_id]
+            )
+
+
+def event_timestamp(value: Optional[str]) -> float:
+    """Timestamp of an ISO datetime from an event, or now when absent or invalid"""
+    if value:
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except (TypeError, ValueError):
+            logger.warning(f"Invalid event time {value}, using the current time")
+    return time.time()
+
+
+schedule_cache = ScheduleCache()
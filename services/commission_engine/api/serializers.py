@@ -1,5 +1,7 @@
+from decimal import Decimal
+from django.db import transaction
 from rest_framework import serializers
-from .models import CommissionRate, CommissionTransaction
+from .models import CommissionRate, CommissionSchedule, CommissionTier, CommissionTransaction
 
 class CommissionRateSerializer(serializers.ModelSerializer):
     class Meta:
@@ -29,4 +31,61 @@ class CommissionTransactionSerializer(serializers.ModelSerializer):
             'created_at',
             'paid_at'
         ]
-        read_only_fields = ['created_at', 'paid_at'] 
\ No newline at end of file
+        read_only_fields = ['created_at', 'paid_at'] 
+
+class CommissionTierSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = CommissionTier
+        fields = ['min_amount', 'rate']
+
+    def validate_min_amount(self, value):
+        if value < 0:
+            raise serializers.ValidationError("min_amount cannot be negative")
+        return value
+
+    def validate_rate(self, value):
+        if not Decimal('0') <= value <= Decimal('100'):
+            raise serializers.ValidationError("rate must be a percentage between 0 and 100")
+        return value
+
+class CommissionScheduleSerializer(serializers.ModelSerializer):
+    tiers = CommissionTierSerializer(many=True)
+
+    class Meta:
+        model = CommissionSchedule
+        fields = [
+            'id',
+            'agent_id',
+            'transaction_type',
+            'provider',
+            'effective_from',
+            'tiers',
+            'created_at'
+        ]
+        read_only_fields = ['id', 'created_at']
+
+    def validate_tiers(self, tiers):
+        if not tiers:
+            raise serializers.ValidationError("A schedule needs at least one tier")
+        bounds = [tier['min_amount'] for tier in tiers]
+        if len(set(bounds)) != len(bounds):
+            raise serializers.ValidationError("Tiers must have distinct min_amount values")
+        return sorted(tiers, key=lambda tier: tier['min_amount'])
+
+    def create(self, validated_data):
+        tiers = validated_data.pop('tiers')
+        with transaction.atomic():
+            schedule = CommissionSchedule.objects.create(**validated_data)
+            CommissionTier.objects.bulk_create([CommissionTier(schedule=schedule, **tier) for tier in tiers])
+        return schedule
+
+class CommissionSummaryQuerySerializer(serializers.Serializer):
+    agent_id = serializers.CharField(max_length=100)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+    group_by = serializers.ChoiceField(choices=['day', 'month'], default='day')
+
+    def validate(self, attrs):
+        if attrs.get('date_from') and attrs.get('date_to') and attrs['date_from'] > attrs['date_to']:
+            raise serializers.ValidationError("date_from must not be after date_to")
+        return attrs
@@ -0,0 +1,172 @@
+import logging
+from decimal import Decimal
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+from .models import (
+    AgentPayout, CommissionTransaction, PayoutBatch, PayoutBatchStatus, PayoutStatus, TransactionStatus,
+    TransactionType,
+)
+from .rollups import RollupDeltas
+
+logger = logging.getLogger(__name__)
+
+SETTLED_EVENT = 'commission.settled'
+
+_PAY_SQL = """
+    UPDATE {table}
+    SET status = %s, paid_at = %s, payout_id = %s
+    WHERE id = ANY(%s) AND status = %s
+    RETURNING commission_amount, transaction_amount, transaction_type, created_at
+"""
+
+
+def open_batch(cutoff, batch_size: int = 1000) -> tuple:
+    """
+    Return (batch, created): the open payout batch, or a new one for the
+    commissions still PENDING that were created before cutoff. A new batch
+    gets one AgentPayout per agent from a single grouped query. While a
+    batch is open no other is created, so a settlement interrupted by a
+    crash is resumed instead of paid twice.
+    """
+    with transaction.atomic():
+        # Serialises concurrent callers until commit; the mode conflicts
+        # with itself but not with readers
+        with connection.cursor() as cursor:
+            cursor.execute(f"LOCK TABLE {PayoutBatch._meta.db_table} IN SHARE ROW EXCLUSIVE MODE")
+        batch = PayoutBatch.objects.filter(status=PayoutBatchStatus.OPEN).first()
+        if batch is not None:
+            return batch, False
+
+        batch = PayoutBatch.objects.create(cutoff=cutoff)
+        totals = (
+            CommissionTransaction.objects
+            .filter(status=TransactionStatus.PENDING, created_at__lt=cutoff)
+            .values('agent_id')
+            .annotate(commission_count=Count('id'), total_amount=Sum('commission_amount'))
+            .order_by('agent_id')
+        )
+        payouts = [
+            AgentPayout(
+                batch=batch,
+                agent_id=row['agent_id'],
+                commission_count=row['commission_count'],
+                total_amount=row['total_amount']
+            )
+            for row in totals.iterator(chunk_size=5000)
+        ]
+        AgentPayout.objects.bulk_create(payouts, batch_size=batch_size)
+        batch.agent_count = len(payouts)
+        batch.commission_count = sum(payout.commission_count for payout in payouts)
+        batch.total_amount = sum((payout.total_amount for payout in payouts), Decimal('0.00'))
+        batch.save(update_fields=['agent_count', 'commission_count', 'total_amount'])
+
+    logger.info(
+        f"Opened payout batch {batch.pk} up to {cutoff}: {batch.agent_count} agents, "
+        f"{batch.commission_count} commissions, {batch.total_amount}"
+    )
+    return batch, True
+
+
+def settle_next(batch: PayoutBatch, publisher, chunk_size: int = 1000):
+    """
+    Settle the next unsettled agent of the batch and return its payout, or
+    None when none is left to claim.
+
+    The payout row is claimed with SKIP LOCKED, so any number of workers
+    can settle a batch side by side. The agent's PENDING commissions are
+    marked PAID in chunked UPDATE ... WHERE id = ANY(...) statements, and
+    the payout is settled with what they actually add up to, all in one
+    database transaction: a crash leaves the agent unsettled, and the
+    next run settles it from scratch. The commission.settled event is
+    published before the commit, as everywhere else in this service.
+    """
+    with transaction.atomic():
+        payout = (
+            AgentPayout.objects.select_for_update(skip_locked=True)
+            .filter(batch=batch, status=PayoutStatus.PENDING)
+            .order_by('id')
+            .first()
+        )
+        if payout is None:
+            return None
+
+        ids = list(
+            CommissionTransaction.objects.filter(
+                agent_id=payout.agent_id,
+                status=TransactionStatus.PENDING,
+                created_at__lt=batch.cutoff
+            ).order_by('id').values_list('id', flat=True)
+        )
+        now = timezone.now()
+        count = 0
+        total = Decimal('0.00')
+        rollups = RollupDeltas()
+        with connection.cursor() as cursor:
+            for start in range(0, len(ids), chunk_size):
+                # Rows paid meanwhile through mark_as_paid are skipped by the
+                # status condition and left out of the total
+                cursor.execute(
+                    _PAY_SQL.format(table=CommissionTransaction._meta.db_table),
+                    [
+                        TransactionStatus.PAID.name, now, payout.pk,
+                        ids[start:start + chunk_size], TransactionStatus.PENDING.name
+                    ]
+                )
+                paid = cursor.fetchall()
+                count += len(paid)
+                for commission_amount, transaction_amount, transaction_type, created_at in paid:
+                    total += commission_amount
+                    rollups.move(
+                        payout.agent_id, created_at, TransactionType[transaction_type],
+                        TransactionStatus.PENDING, TransactionStatus.PAID, transaction_amount, commission_amount
+                    )
+        rollups.apply()
+
+        payout.status = PayoutStatus.SETTLED
+        payout.commission_count = count
+        payout.total_amount = total
+        payout.settled_at = now
+        payout.save(update_fields=['status', 'commission_count', 'total_amount', 'settled_at'])
+
+        publisher.publish_event(SETTLED_EVENT, {
+            'payout_id': payout.pk,
+            'batch_id': batch.pk,
+            'agent_id': payout.agent_id,
+            'commission_count': count,
+            'total_amount': str(total),
+            'settled_at': now.isoformat()
+        })
+
+    logger.info(f"Settled payout {payout.pk} of agent {payout.agent_id}: {count} commissions, {total}")
+    return payout
+
+
+def complete_batch(batch: PayoutBatch) -> bool:
+    """
+    Close the batch with the totals actually paid once every agent is
+    settled; returns whether it was closed
+    """
+    with transaction.atomic():
+        batch = PayoutBatch.objects.select_for_update().get(pk=batch.pk)
+        if batch.status == PayoutBatchStatus.COMPLETED:
+            return True
+        if AgentPayout.objects.filter(batch=batch, status=PayoutStatus.PENDING).exists():
+            return False
+        totals = AgentPayout.objects.filter(batch=batch).aggregate(
+            agent_count=Count('id'),
+            commission_count=Sum('commission_count'),
+            total_amount=Sum('total_amount')
+        )
+        batch.status = PayoutBatchStatus.COMPLETED
+        batch.agent_count = totals['agent_count']
+        batch.commission_count = totals['commission_count'] or 0
+        batch.total_amount = totals['total_amount'] or Decimal('0.00')
+        batch.completed_at = timezone.now()
+        batch.save(update_fields=['status', 'agent_count', 'commission_count', 'total_amount', 'completed_at'])
+
+    logger.info(
+        f"Completed payout batch {batch.pk}: {batch.agent_count} agents, "
+        f"{batch.commission_count} commissions, {batch.total_amount}"
+    )
+    return True
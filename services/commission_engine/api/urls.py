@@ -1,10 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import CommissionRateViewSet, CommissionTransactionViewSet
+from .views import (
+    CommissionRateViewSet, CommissionScheduleViewSet, CommissionSummaryViewSet, CommissionTransactionViewSet,
+)
 
 router = DefaultRouter()
 router.register(r'commission-rates', CommissionRateViewSet)
 router.register(r'commission-records', CommissionTransactionViewSet)
+router.register(r'commission-schedules', CommissionScheduleViewSet)
+router.register(r'commission-summary', CommissionSummaryViewSet, basename='commission-summary')
 
 urlpatterns = [
     path('', include(router.urls)),
@@ -1,13 +1,46 @@
+import logging
 from django.shortcuts import render
-from rest_framework import viewsets, status
+from rest_framework import mixins, viewsets, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.core.cache import cache
-from .models import CommissionRate, CommissionTransaction
-from .serializers import CommissionRateSerializer, CommissionTransactionSerializer
-from django.conf import settings
+from decimal import Decimal
+from django.db import transaction as db_transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+from .models import (
+    CommissionRate, CommissionRollup, CommissionSchedule, CommissionTransaction, RollupGranularity, TransactionStatus,
+)
+from .mq.publisher import EventPublisher
+from .rates import RATE_CHANGED_EVENT, rate_changed_payload
+from .rollups import RollupDeltas
+from .serializers import (
+    CommissionRateSerializer, CommissionScheduleSerializer, CommissionSummaryQuerySerializer,
+    CommissionTransactionSerializer,
+)
+from .pagination import KeysetPagination
+
+logger = logging.getLogger(__name__)
+
+
+def publish_rate_changed(payload: dict) -> None:
+    """
+    Tell every consumer to drop its copy of the agent's rates, once the
+    change is committed
+    """
+    def publish():
+        publisher = None
+        try:
+            publisher = EventPublisher()
+            publisher.publish_event(RATE_CHANGED_EVENT, payload)
+        except Exception as e:
+            logger.error(f"Failed to publish {RATE_CHANGED_EVENT} for agent {payload['agent_id']}: {str(e)}")
+        finally:
+            if publisher is not None:
+                publisher.close()
+
+    db_transaction.on_commit(publish)
 
-# Create your views here.
 
 class CommissionRateViewSet(viewsets.ModelViewSet):
     queryset = CommissionRate.objects.all()
@@ -23,32 +56,59 @@ class CommissionRateViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         instance = serializer.save()
-        # Cache the commission rate
-        cache_key = f'commission_rate_{instance.agent_id}'
-        cache.set(cache_key, instance, timeout=settings.CACHE_TTL)
+        publish_rate_changed(rate_changed_payload(instance))
 
     def perform_update(self, serializer):
         instance = serializer.save()
-        # Update cache
-        cache_key = f'commission_rate_{instance.agent_id}'
-        cache.set(cache_key, instance, timeout=settings.CACHE_TTL)
+        publish_rate_changed(rate_changed_payload(instance))
+
+    def perform_destroy(self, instance):
+        agent_id = instance.agent_id
+        instance.delete()
+        publish_rate_changed({'agent_id': agent_id})
 
     @action(detail=True, methods=['post'])
     def toggle_eligibility(self, request, agent_id=None):
         commission_rate = self.get_object()
         commission_rate.is_eligible = not commission_rate.is_eligible
         commission_rate.save()
-        
-        # Update cache
-        cache_key = f'commission_rate_{agent_id}'
-        cache.set(cache_key, commission_rate, timeout=settings.CACHE_TTL)
-        
+        publish_rate_changed(rate_changed_payload(commission_rate))
+
         return Response(self.get_serializer(commission_rate).data)
 
+class CommissionScheduleViewSet(mixins.CreateModelMixin,
+                                mixins.ListModelMixin,
+                                mixins.RetrieveModelMixin,
+                                mixins.DestroyModelMixin,
+                                viewsets.GenericViewSet):
+    """
+    Tiered rate schedule versions. Versions are never edited: a change is a
+    new version with a later effective_from.
+    """
+    queryset = CommissionSchedule.objects.prefetch_related('tiers')
+    serializer_class = CommissionScheduleSerializer
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        agent_id = self.request.query_params.get('agent_id')
+        if agent_id:
+            queryset = queryset.filter(agent_id=agent_id)
+        return queryset
+
+    def perform_create(self, serializer):
+        instance = serializer.save()
+        publish_rate_changed({'agent_id': instance.agent_id})
+
+    def perform_destroy(self, instance):
+        agent_id = instance.agent_id
+        instance.delete()
+        publish_rate_changed({'agent_id': agent_id})
+
 class CommissionTransactionViewSet(viewsets.ModelViewSet):
     queryset = CommissionTransaction.objects.all()
     serializer_class = CommissionTransactionSerializer
     lookup_field = 'transaction_id'
+    pagination_class = KeysetPagination
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -57,15 +117,108 @@ class CommissionTransactionViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(agent_id=agent_id)
         return queryset
 
+    # Every change is mirrored in the commission rollups
+    def perform_create(self, serializer):
+        with db_transaction.atomic():
+            instance = serializer.save()
+            rollups = RollupDeltas()
+            rollups.add_commission(instance)
+            rollups.apply()
+
+    def perform_update(self, serializer):
+        with db_transaction.atomic():
+            previous = CommissionTransaction.objects.select_for_update().get(pk=serializer.instance.pk)
+            instance = serializer.save()
+            rollups = RollupDeltas()
+            rollups.add_commission(previous, -1)
+            rollups.add_commission(instance)
+            rollups.apply()
+
+    def perform_destroy(self, instance):
+        with db_transaction.atomic():
+            instance = CommissionTransaction.objects.select_for_update().get(pk=instance.pk)
+            instance.delete()
+            rollups = RollupDeltas()
+            rollups.add_commission(instance, -1)
+            rollups.apply()
+
     @action(detail=True, methods=['post'])
     def mark_as_paid(self, request, transaction_id=None):
         transaction = self.get_object()
-        if transaction.status != CommissionTransaction.Status.PENDING:
+        with db_transaction.atomic():
+            # Conditional, so a commission a settlement run is paying
+            # meanwhile is not paid twice
+            paid = CommissionTransaction.objects.filter(
+                pk=transaction.pk, status=TransactionStatus.PENDING
+            ).update(status=TransactionStatus.PAID, paid_at=timezone.now())
+            if paid:
+                rollups = RollupDeltas()
+                rollups.move(
+                    transaction.agent_id, transaction.created_at, transaction.transaction_type,
+                    TransactionStatus.PENDING, TransactionStatus.PAID,
+                    transaction.transaction_amount, transaction.commission_amount
+                )
+                rollups.apply()
+        if not paid:
             return Response(
                 {'error': 'Only pending transactions can be marked as paid'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
-        transaction.status = CommissionTransaction.Status.PAID
-        transaction.save()
+
+        transaction.refresh_from_db()
         return Response(self.get_serializer(transaction).data)
+
+class CommissionSummaryViewSet(viewsets.ViewSet):
+    """
+    An agent's commissions summed per day (or month), transaction type and
+    status, read from the commission rollups. Days of compacted months come
+    back as one row per month with granularity MONTH, included when the
+    first of the month is in range.
+    """
+
+    def list(self, request):
+        query = CommissionSummaryQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        params = query.validated_data
+
+        rollups = CommissionRollup.objects.filter(agent_id=params['agent_id'])
+        if params.get('date_from'):
+            rollups = rollups.filter(period__gte=params['date_from'])
+        if params.get('date_to'):
+            rollups = rollups.filter(period__lte=params['date_to'])
+
+        if params['group_by'] == 'month':
+            rows = rollups.annotate(bucket=TruncMonth('period')).values('bucket', 'transaction_type', 'status')
+        else:
+            rows = rollups.annotate(bucket=F('period')).values('bucket', 'granularity', 'transaction_type', 'status')
+        rows = rows.annotate(
+            count=Sum('commission_count'),
+            transaction_total=Sum('transaction_amount'),
+            commission_total=Sum('commission_amount')
+        ).filter(count__gt=0).order_by('bucket', 'transaction_type', 'status')
+
+        results = []
+        totals = {}
+        for row in rows:
+            granularity = row.get('granularity', RollupGranularity.MONTH)
+            results.append({
+                'period': row['bucket'],
+                'granularity': granularity.name,
+                'transaction_type': row['transaction_type'].name,
+                'status': row['status'].name,
+                'count': row['count'],
+                'transaction_amount': row['transaction_total'],
+                'commission_amount': row['commission_total'],
+            })
+            total = totals.setdefault(
+                row['status'].name, {'count': 0, 'commission_amount': Decimal('0.00')}
+            )
+            total['count'] += row['count']
+            total['commission_amount'] += row['commission_total']
+
+        return Response({
+            'agent_id': params['agent_id'],
+            'group_by': params['group_by'],
+            'totals': totals,
+            'results': results,
+        })
@@ -107,6 +107,27 @@ CACHES = {
 # Cache time to live is 15 minutes
 CACHE_TTL = 60 * 15
 
+# Seconds between full reloads of a consumer's in-process rate table;
+# commission_rate.changed events keep it current in between
+COMMISSION_RATE_TABLE_REFRESH = int(os.getenv('COMMISSION_RATE_TABLE_REFRESH', 600))
+
+# Processed-event inbox (api.inbox): seconds a processed event id stays in
+# the cache that answers most redeliveries, and days its row is kept for
+# the rest; purge_processed_events deletes older rows
+INBOX_CACHE_TTL = int(os.getenv('INBOX_CACHE_TTL', 86400))
+INBOX_RETENTION_DAYS = int(os.getenv('INBOX_RETENTION_DAYS', 14))
+
+# Batched commission recording (api.mq.batch): up to COMMISSION_BATCH_SIZE
+# wallet events are recorded per database transaction, waiting at most
+# COMMISSION_BATCH_WINDOW_MS to fill a batch; 0 or 1 records them one by one
+COMMISSION_BATCH_SIZE = int(os.getenv('COMMISSION_BATCH_SIZE', 0))
+COMMISSION_BATCH_WINDOW_MS = int(os.getenv('COMMISSION_BATCH_WINDOW_MS', 50))
+
+# Commission rollups (api.rollups) keep daily rows for the current month
+# and this many before it; compact_commission_rollups folds older days
+# into monthly rows
+COMMISSION_ROLLUP_DAILY_MONTHS = int(os.getenv('COMMISSION_ROLLUP_DAILY_MONTHS', 3))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Transaction
+from .models import Transaction, OutboxEvent
 
 @admin.register(Transaction)
 class TransactionAdmin(admin.ModelAdmin):
@@ -13,4 +13,13 @@ class TransactionAdmin(admin.ModelAdmin):
 
     def get_provider(self, obj):
         return obj.get_provider_display()
-    get_provider.short_description = 'Provider' 
\ No newline at end of file
+    get_provider.short_description = 'Provider'
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    list_display = ('id', 'routing_key', 'aggregate_id', 'attempts', 'created_at', 'published_at')
+    list_filter = ('routing_key',)
+    search_fields = ('aggregate_id',)
+    readonly_fields = ('created_at', 'published_at')
+    ordering = ('-id',)
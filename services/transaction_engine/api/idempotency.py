@@ -0,0 +1,174 @@
+import hashlib
+import logging
+from datetime import timedelta
+from functools import wraps
+from typing import Optional
+import orjson
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_CACHE_PREFIX = 'idempotency:'
+MAX_KEY_LENGTH = 255
+
+
+def idempotency_cache_key(agent_id, key: str) -> str:
+    return f"{IDEMPOTENCY_CACHE_PREFIX}{agent_id}:{hashlib.sha256(key.encode()).hexdigest()}"
+
+
+def idempotent(view):
+    """
+    Make a viewset action replayable with an Idempotency-Key header. The
+    first request with a key runs the view and stores its response; retries
+    with the same key get that response back without the view running
+    again. Completed keys are answered from Redis, then from the database.
+
+    The key is claimed in a short transaction of its own and the response
+    stored in another, so no database transaction or lock is held while the
+    view runs, wallet calls included. The claim is a lease of
+    IDEMPOTENCY_WAIT_TIMEOUT seconds: a duplicate arriving meanwhile gets a
+    409 to retry later, and once it lapses without a response, e.g. after
+    a crash, the next retry takes the key over. Server errors are not
+    stored; the claim is dropped so a retry after one runs again.
+    Requests without the header are not affected.
+    """
+    @wraps(view)
+    def wrapper(viewset, request, *args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return view(viewset, request, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return Response(
+                {"error": f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        agent_id = request.user.agent_id
+        request_hash = hashlib.sha256(request.body).hexdigest()
+
+        stored = _get_cached(agent_id, key)
+        if stored is not None:
+            return _replay(stored, request_hash)
+
+        record, claimed = _claim(agent_id, key, request_hash)
+        if not claimed:
+            if record.response_status is not None:
+                stored = _stored_response(record)
+                _cache(agent_id, key, stored)
+                return _replay(stored, request_hash)
+            if record.request_hash != request_hash:
+                return _key_reused()
+            logger.warning(f"Idempotency key {key} of agent {agent_id} still in progress")
+            return Response(
+                {"error": "A request with this Idempotency-Key is still being processed"},
+                status=status.HTTP_409_CONFLICT,
+                headers={'Retry-After': '1'}
+            )
+
+        try:
+            response = view(viewset, request, *args, **kwargs)
+        except Exception:
+            _abandon(record)
+            raise
+        if response.status_code >= 500:
+            # Nothing is kept, so the client's retry runs the view again
+            _abandon(record)
+            return response
+
+        record.response_status = response.status_code
+        record.response_body = response.data
+        record.expires_at = timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        # Matches nothing if the lease lapsed and a retry took the key over
+        stored_rows = IdempotencyKey.objects.filter(pk=record.pk, response_status__isnull=True).update(
+            response_status=record.response_status,
+            response_body=record.response_body,
+            expires_at=record.expires_at
+        )
+        if stored_rows:
+            _cache(agent_id, key, _stored_response(record))
+        else:
+            logger.warning(
+                f"Idempotency key {key} of agent {agent_id} was taken over before its response was stored"
+            )
+        return response
+
+    return wrapper
+
+
+def _claim(agent_id, key: str, request_hash: str) -> tuple:
+    """
+    Return (row, claimed): a new row leased to this request, or the row of
+    an earlier request. A row whose lease or retention has run out is
+    deleted and claimed afresh.
+    """
+    while True:
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    agent_id=agent_id,
+                    key=key,
+                    request_hash=request_hash,
+                    expires_at=timezone.now() + timedelta(seconds=settings.IDEMPOTENCY_WAIT_TIMEOUT)
+                ), True
+        except IntegrityError:
+            existing = IdempotencyKey.objects.filter(agent_id=agent_id, key=key).first()
+            if existing is None:
+                continue
+            if existing.expires_at > timezone.now():
+                return existing, False
+            # Only the request that deletes the stale row retries the insert
+            IdempotencyKey.objects.filter(pk=existing.pk, expires_at=existing.expires_at).delete()
+
+
+def _abandon(record: IdempotencyKey) -> None:
+    """Drop a claim without a response, unless a retry took it over meanwhile"""
+    try:
+        IdempotencyKey.objects.filter(pk=record.pk, response_status__isnull=True).delete()
+    except Exception as e:
+        logger.error(f"Failed to drop idempotency key {record.key}: {str(e)}")
+
+
+def _stored_response(record: IdempotencyKey) -> dict:
+    return {
+        'request_hash': record.request_hash,
+        'status': record.response_status,
+        'body': orjson.dumps(record.response_body, default=str),
+    }
+
+
+def _replay(stored: dict, request_hash: str):
+    if stored['request_hash'] != request_hash:
+        return _key_reused()
+    response = HttpResponse(stored['body'], status=stored['status'], content_type='application/json')
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _key_reused():
+    return Response(
+        {"error": f"{IDEMPOTENCY_HEADER} was already used for a different request"},
+        status=status.HTTP_422_UNPROCESSABLE_ENTITY
+    )
+
+
+def _get_cached(agent_id, key: str) -> Optional[dict]:
+    try:
+        return cache.get(idempotency_cache_key(agent_id, key))
+    except Exception as e:
+        logger.warning(f"Idempotency cache unavailable: {str(e)}")
+        return None
+
+
+def _cache(agent_id, key: str, stored: dict) -> None:
+    try:
+        cache.set(idempotency_cache_key(agent_id, key), stored, settings.IDEMPOTENCY_KEY_TTL)
+    except Exception as e:
+        logger.warning(f"Idempotency cache unavailable: {str(e)}")
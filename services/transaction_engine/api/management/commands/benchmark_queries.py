@@ -0,0 +1,136 @@
+import json
+import logging
+import re
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from api.models import Transaction, TransactionStatus, TransactionType
+from api.stats import STATS_AGGREGATES, volume_series_queryset
+
+logger = logging.getLogger(__name__)
+
+BENCH_AGENT_PREFIX = 'bench-'
+
+# Rows are generated server side, so millions of them load in one statement.
+# Statuses are skewed like production: mostly successful, a few in flight.
+_SEED_SQL = """
+    INSERT INTO {table} (
+        transaction_id, transaction_type, wallet_provider, bank_provider, amount,
+        agent_id, customer_identifier, status, commission_amount, commission_status,
+        error_message, created_at, updated_at
+    )
+    SELECT
+        gen_random_uuid(),
+        (ARRAY['WALLET_LOAD', 'BANK_DEPOSIT', 'BANK_WITHDRAWAL'])[1 + g %% 3],
+        CASE WHEN g %% 3 = 0 THEN (ARRAY['TELEBIRR', 'MPESA'])[1 + g %% 2] END,
+        CASE WHEN g %% 3 <> 0 THEN (ARRAY['CBE', 'DASHEN', 'AWASH', 'ABYSSINIA'])[1 + g %% 4] END,
+        round((10 + random() * 5000)::numeric, 2),
+        %(prefix)s || (g %% %(agents)s),
+        '2519' || lpad((g %% 100000000)::text, 8, '0'),
+        CASE WHEN g %% 100 < 2 THEN 'INITIATED' WHEN g %% 100 < 10 THEN 'FAILED' ELSE 'SUCCESSFUL' END,
+        0, g %% 100 >= 10, NULL,
+        ts, ts
+    FROM generate_series(1, %(rows)s) AS g,
+         LATERAL (SELECT now() - random() * %(days)s * interval '1 day' AS ts) AS t
+"""
+
+_EXECUTION_TIME = re.compile(r'Execution Time: ([\d.]+) ms')
+
+
+class Command(BaseCommand):
+    help = ('Run EXPLAIN ANALYZE on the hot transaction queries, optionally against a seeded '
+            'dataset; save the timings before a schema change and compare after it')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0,
+                            help='Insert this many synthetic transactions for bench- agents first')
+        parser.add_argument('--agents', type=int, default=2000,
+                            help='Number of synthetic agents the seeded rows are spread over')
+        parser.add_argument('--days', type=int, default=365,
+                            help='Seeded rows are spread over this many past days')
+        parser.add_argument('--agent', help='Agent whose queries are explained (default: a seeded agent)')
+        parser.add_argument('--save', help='Write the timings to this JSON file')
+        parser.add_argument('--compare', help='Timings saved by an earlier run, shown next to this one')
+        parser.add_argument('--plans', action='store_true', help='Print the full plans')
+        parser.add_argument('--cleanup', action='store_true',
+                            help='Delete the seeded transactions and exit')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Benchmarks need the PostgreSQL database')
+
+        if options['cleanup']:
+            deleted, _ = Transaction.objects.filter(agent_id__startswith=BENCH_AGENT_PREFIX).delete()
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} seeded transactions'))
+            return
+
+        if options['seed']:
+            self._seed(options['seed'], options['agents'], options['days'])
+
+        agent_id = options['agent'] or f"{BENCH_AGENT_PREFIX}1"
+        baseline = {}
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)
+
+        timings = {}
+        for name, queryset in self._queries(agent_id):
+            plan = queryset.explain(analyze=True, buffers=True)
+            match = _EXECUTION_TIME.search(plan)
+            timings[name] = float(match.group(1)) if match else None
+
+            line = f'{name:<28} {self._ms(timings[name]):>12}'
+            if name in baseline:
+                line += f'   before {self._ms(baseline[name]):>12}'
+            self.stdout.write(line)
+            if options['plans']:
+                self.stdout.write(plan + '\n')
+
+        if options['save']:
+            with open(options['save'], 'w') as f:
+                json.dump(timings, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Timings saved to {options['save']}"))
+
+    def _seed(self, rows: int, agents: int, days: int) -> None:
+        self.stdout.write(f'Seeding {rows} transactions over {agents} agents...')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                _SEED_SQL.format(table=Transaction._meta.db_table),
+                {'prefix': BENCH_AGENT_PREFIX, 'agents': agents, 'rows': rows, 'days': days}
+            )
+            # Fresh statistics, or the planner judges the new rows by the old ones
+            cursor.execute(f'ANALYZE {Transaction._meta.db_table}')
+        logger.info(f"Seeded {rows} benchmark transactions")
+
+    @staticmethod
+    def _queries(agent_id: str) -> list:
+        """The queries behind the transaction endpoints and background jobs, as built there"""
+        now = timezone.now()
+        mine = Transaction.objects.filter(agent_id=agent_id)
+        newest_first = ('-created_at', '-transaction_id')
+        month = mine.filter(created_at__gte=now - timedelta(days=30), created_at__lt=now)
+
+        # A keyset page halfway through the agent's history
+        middle = mine.order_by(*newest_first).values_list('created_at', flat=True)[mine.count() // 2:][:1]
+        deep_page = mine.filter(created_at__lt=next(iter(middle), now)).order_by(*newest_first)[:11]
+
+        return [
+            ('history_first_page', mine.order_by(*newest_first)[:11]),
+            ('history_deep_page', deep_page),
+            ('history_by_status', mine.filter(status=TransactionStatus.FAILED).order_by(*newest_first)[:11]),
+            ('history_by_type', mine.filter(transaction_type=TransactionType.BANK_WITHDRAWAL)
+                .order_by(*newest_first)[:11]),
+            ('stats_last_30_days', month.values('agent_id').annotate(**STATS_AGGREGATES).order_by()),
+            ('stats_by_status', mine.filter(status=TransactionStatus.SUCCESSFUL)
+                .values('agent_id').annotate(**STATS_AGGREGATES).order_by()),
+            ('daily_volume_series', volume_series_queryset(month, 'day')),
+            ('stale_initiated_sweep', Transaction.objects.filter(
+                status=TransactionStatus.INITIATED, created_at__lt=now - timedelta(minutes=15)
+            ).order_by('created_at')[:500]),
+        ]
+
+    @staticmethod
+    def _ms(value) -> str:
+        return f'{value:.3f} ms' if value is not None else 'n/a'
+
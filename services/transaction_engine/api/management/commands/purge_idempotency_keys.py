@@ -0,0 +1,29 @@
+import logging
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Delete idempotency keys past their expiry'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Keys deleted per statement')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        purged = 0
+        while True:
+            ids = list(
+                IdempotencyKey.objects.filter(expires_at__lt=now)
+                .values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            deleted, _ = IdempotencyKey.objects.filter(id__in=ids).delete()
+            purged += deleted
+            logger.info(f"Purged {purged} expired idempotency keys")
+
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} expired idempotency keys'))
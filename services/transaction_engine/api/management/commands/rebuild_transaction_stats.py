@@ -0,0 +1,80 @@
+import logging
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, Q, Sum
+from api.models import AgentTransactionStats, Transaction, TransactionStatus
+
+logger = logging.getLogger(__name__)
+
+ZERO = Decimal('0.00')
+
+class Command(BaseCommand):
+    help = 'Recompute per-agent transaction stats from the transactions table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Agents rebuilt per database transaction')
+        parser.add_argument('--agent', action='append', dest='agents',
+                            help='Only rebuild this agent (repeatable)')
+
+    def handle(self, *args, **options):
+        agents = Transaction.objects.order_by('agent_id').values_list('agent_id', flat=True).distinct()
+        if options['agents']:
+            agents = agents.filter(agent_id__in=options['agents'])
+
+        rebuilt = 0
+        last_agent = None
+        while True:
+            chunk = agents.filter(agent_id__gt=last_agent) if last_agent is not None else agents
+            chunk = list(chunk[:options['chunk_size']])
+            if not chunk:
+                break
+            last_agent = chunk[-1]
+            self._rebuild(chunk)
+            rebuilt += len(chunk)
+            logger.info(f"Rebuilt transaction stats for {rebuilt} agents")
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt transaction stats for {rebuilt} agents'))
+
+    @staticmethod
+    def _rebuild(agent_ids: list) -> None:
+        with transaction.atomic(), connection.cursor() as cursor:
+            # Every stats delta is written with a change to the transactions
+            # table. A SHARE lock waits for the changes in progress and holds
+            # off new ones until commit, so the sums below are exact and no
+            # upsert, not even the first of a new (agent, type) pair, can
+            # land between them and the rewrite
+            cursor.execute(f"LOCK TABLE {Transaction._meta.db_table} IN SHARE MODE")
+            rows = (
+                Transaction.objects.filter(agent_id__in=agent_ids)
+                .values('agent_id', 'transaction_type')
+                .annotate(
+                    initiated_count=Count('pk', filter=Q(status=TransactionStatus.INITIATED)),
+                    initiated_amount=Sum('amount', filter=Q(status=TransactionStatus.INITIATED)),
+                    successful_count=Count('pk', filter=Q(status=TransactionStatus.SUCCESSFUL)),
+                    successful_amount=Sum('amount', filter=Q(status=TransactionStatus.SUCCESSFUL)),
+                    failed_count=Count('pk', filter=Q(status=TransactionStatus.FAILED)),
+                    failed_amount=Sum('amount', filter=Q(status=TransactionStatus.FAILED)),
+                    commission_earned=Sum(
+                        'commission_amount',
+                        filter=Q(status=TransactionStatus.SUCCESSFUL, commission_status=True)
+                    ),
+                )
+                .order_by()
+            )
+            AgentTransactionStats.objects.filter(agent_id__in=agent_ids).delete()
+            AgentTransactionStats.objects.bulk_create([
+                AgentTransactionStats(
+                    agent_id=row['agent_id'],
+                    transaction_type=row['transaction_type'],
+                    initiated_count=row['initiated_count'],
+                    initiated_amount=row['initiated_amount'] or ZERO,
+                    successful_count=row['successful_count'],
+                    successful_amount=row['successful_amount'] or ZERO,
+                    failed_count=row['failed_count'],
+                    failed_amount=row['failed_amount'] or ZERO,
+                    commission_earned=row['commission_earned'] or ZERO
+                )
+                for row in rows
+            ])
@@ -0,0 +1,70 @@
+import signal
+import logging
+import threading
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.conf import settings
+from api.mq.client import RabbitMQClient
+from api.mq.confirms import ConfirmPublisher
+from api.outbox import relay_batch
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Relay pending outbox events to RabbitMQ with publisher confirms'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._shutdown_event = threading.Event()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Maximum events claimed and published per batch')
+        parser.add_argument('--interval', type=float, default=1.0,
+                            help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--max-attempts', type=int, default=10,
+                            help='Publish attempts before a transaction is marked failed')
+        parser.add_argument('--confirm-timeout', type=float, default=5.0,
+                            help='Seconds to wait for a broker confirm; claimed rows stay locked meanwhile')
+        parser.add_argument('--once', action='store_true',
+                            help='Drain the outbox once and exit')
+
+    def handle(self, *args, **options):
+        def signal_handler(signum, frame):
+            self.stdout.write(self.style.WARNING('\nStopping outbox relay...'))
+            self._shutdown_event.set()
+
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
+
+        # A publisher of its own that never retries, so that a timed-out
+        # event is only published again by the relay's next batch
+        publisher = ConfirmPublisher(
+            RabbitMQClient().parameters,
+            window=settings.RABBITMQ_CONFIRM_WINDOW,
+            confirm_timeout=options['confirm_timeout'],
+            max_attempts=1
+        )
+        publisher.start()
+        self.stdout.write(self.style.SUCCESS('Outbox relay started'))
+
+        try:
+            while not self._shutdown_event.is_set():
+                try:
+                    close_old_connections()
+                    published = relay_batch(
+                        publisher,
+                        batch_size=options['batch_size'],
+                        max_attempts=options['max_attempts']
+                    )
+                except Exception as e:
+                    logger.error(f"Outbox relay batch failed: {str(e)}")
+                    published = 0
+
+                if published < options['batch_size']:
+                    if options['once']:
+                        break
+                    self._shutdown_event.wait(options['interval'])
+        finally:
+            publisher.stop()
+            self.stdout.write(self.style.SUCCESS('Outbox relay stopped'))
@@ -66,6 +66,10 @@ class Command(BaseCommand):
             {
                 'queue': 'transaction_completion_events',
                 'callback': EventHandler.handle_transaction_completed
+            },
+            {
+                'queue': 'transaction_auth_events',
+                'callback': EventHandler.handle_profile_changed
             }
         ]
 
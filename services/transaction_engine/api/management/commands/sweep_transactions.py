@@ -0,0 +1,76 @@
+import signal
+import logging
+import threading
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from api.sweeper import sweep_batch
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Republish, fail or complete transactions stuck in INITIATED'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._shutdown_event = threading.Event()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Transactions claimed per database transaction')
+        parser.add_argument('--interval', type=float, default=60.0,
+                            help='Seconds to sleep between passes')
+        parser.add_argument('--stale-after', type=int, default=settings.TRANSACTION_SWEEP_AFTER,
+                            help='Seconds in INITIATED before a transaction is swept')
+        parser.add_argument('--fail-after', type=int, default=settings.TRANSACTION_SWEEP_FAIL_AFTER,
+                            help='Seconds in INITIATED before a transaction is failed')
+        parser.add_argument('--max-republish', type=int, default=settings.TRANSACTION_SWEEP_MAX_REPUBLISH,
+                            help='Times the initiated event is republished before a transaction is failed')
+        parser.add_argument('--once', action='store_true',
+                            help='Make one pass and exit')
+
+    def handle(self, *args, **options):
+        def signal_handler(signum, frame):
+            self.stdout.write(self.style.WARNING('\nStopping transaction sweeper...'))
+            self._shutdown_event.set()
+
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
+
+        self.stdout.write(self.style.SUCCESS('Transaction sweeper started'))
+        while not self._shutdown_event.is_set():
+            republished, failed, completed = self._sweep(options)
+            if republished or failed or completed:
+                logger.info(
+                    f"Sweep pass republished {republished}, failed {failed} and completed {completed} transactions"
+                )
+            if options['once']:
+                break
+            self._shutdown_event.wait(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS('Transaction sweeper stopped'))
+
+    def _sweep(self, options) -> tuple:
+        """One pass over the stuck transactions, a chunk at a time"""
+        republished = failed = completed = 0
+        position = None
+        while not self._shutdown_event.is_set():
+            try:
+                close_old_connections()
+                claimed, chunk_republished, chunk_failed, chunk_completed, position = sweep_batch(
+                    options['stale_after'],
+                    options['fail_after'],
+                    options['max_republish'],
+                    batch_size=options['batch_size'],
+                    after=position
+                )
+            except Exception as e:
+                logger.error(f"Transaction sweep batch failed: {str(e)}")
+                break
+
+            republished += chunk_republished
+            failed += chunk_failed
+            completed += chunk_completed
+            if claimed < options['batch_size']:
+                break
+        return republished, failed, completed
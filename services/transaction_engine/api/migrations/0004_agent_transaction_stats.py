@@ -0,0 +1,36 @@
+# Generated by Django 4.2.9 on 2026-10-17 03:25
+
+import api.models
+from decimal import Decimal
+from django.db import migrations, models
+import enumchoicefield.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_outboxevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AgentTransactionStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('agent_id', models.CharField(max_length=50)),
+                ('transaction_type', enumchoicefield.fields.EnumChoiceField(enum_class=api.models.TransactionType, max_length=15)),
+                ('initiated_count', models.BigIntegerField(default=0)),
+                ('initiated_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18)),
+                ('successful_count', models.BigIntegerField(default=0)),
+                ('successful_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18)),
+                ('failed_count', models.BigIntegerField(default=0)),
+                ('failed_amount', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18)),
+                ('commission_earned', models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=18)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='agenttransactionstats',
+            constraint=models.UniqueConstraint(fields=('agent_id', 'transaction_type'), name='agent_stats_type_uniq'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.2.9 on 2026-10-17 03:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0004_agent_transaction_stats'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='api_transac_agent_i_e39f8b_idx',
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['agent_id', 'created_at', 'transaction_id'], name='txn_agent_created_idx'),
+        ),
+    ]
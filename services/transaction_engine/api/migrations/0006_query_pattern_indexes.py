@@ -0,0 +1,30 @@
+# Generated by Django 4.2.9 on 2026-10-17 03:29
+
+import api.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_agent_created_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='transaction',
+            name='api_transac_status_0f4e6a_idx',
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['agent_id', 'status', 'created_at'], name='txn_agent_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['agent_id', 'transaction_type', 'created_at'], name='txn_agent_type_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(condition=models.Q(('status', api.models.TransactionStatus(1))), fields=['created_at'], name='txn_initiated_created_idx'),
+        ),
+    ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.core.serializers.json import DjangoJSONEncoder
 from enumchoicefield import ChoiceEnum, EnumChoiceField
 from decimal import Decimal
 
@@ -53,8 +54,15 @@ class Transaction(models.Model):
     class Meta:
         ordering = ['-created_at']
         indexes = [
-            models.Index(fields=['agent_id']),
-            models.Index(fields=['status']),
+            # Serves the agent filter and keyset pages of an agent's history
+            models.Index(fields=['agent_id', 'created_at', 'transaction_id'], name='txn_agent_created_idx'),
+            # History and stats filtered by status or type
+            models.Index(fields=['agent_id', 'status', 'created_at'], name='txn_agent_status_created_idx'),
+            models.Index(fields=['agent_id', 'transaction_type', 'created_at'], name='txn_agent_type_created_idx'),
+            # Transactions still in flight, for the sweeper and recovery jobs;
+            # stays small however large the table grows
+            models.Index(fields=['created_at'], name='txn_initiated_created_idx',
+                         condition=models.Q(status=TransactionStatus.INITIATED)),
             models.Index(fields=['created_at']),
         ]
 
@@ -65,4 +73,90 @@ class Transaction(models.Model):
         """Returns the display name of the provider based on transaction type"""
         if self.transaction_type == TransactionType.WALLET_LOAD:
             return self.wallet_provider.value if self.wallet_provider else None
-        return self.bank_provider.value if self.bank_provider else None 
\ No newline at end of file
+        return self.bank_provider.value if self.bank_provider else None
+
+
+class OutboxEvent(models.Model):
+    """
+    An event written in the same database transaction as the state change it
+    describes. The relay_outbox command publishes pending rows with confirms
+    and stamps published_at, so no event is lost if the broker is down.
+    """
+    routing_key = models.CharField(max_length=100)
+    aggregate_id = models.CharField(max_length=100)  # transaction_id of the event
+    payload = models.JSONField()
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    published_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(
+                fields=['id'],
+                name='outbox_pending_idx',
+                condition=models.Q(published_at__isnull=True)
+            ),
+            models.Index(fields=['aggregate_id']),
+        ]
+
+    def __str__(self):
+        return f"{self.routing_key} - {self.aggregate_id}"
+
+
+class AgentTransactionStats(models.Model):
+    """
+    Running totals of an agent's transactions of one type, updated in the
+    same database transaction as every status change (see api.stats), so the
+    stats endpoint reads a few rows instead of scanning the agent's history.
+    The rebuild_transaction_stats command recomputes them from scratch.
+    """
+    agent_id = models.CharField(max_length=50)
+    transaction_type = EnumChoiceField(TransactionType)
+    initiated_count = models.BigIntegerField(default=0)
+    initiated_amount = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'))
+    successful_count = models.BigIntegerField(default=0)
+    successful_amount = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'))
+    failed_count = models.BigIntegerField(default=0)
+    failed_amount = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'))
+    # Commission on successful transactions whose commission was recorded
+    commission_earned = models.DecimalField(max_digits=18, decimal_places=2, default=Decimal('0.00'))
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['agent_id', 'transaction_type'], name='agent_stats_type_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Stats {self.agent_id} - {self.transaction_type.value}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    The response to a request made with an Idempotency-Key header, replayed
+    for any retry with the same key (see api.idempotency). The row is
+    inserted when the request claims its key, without a response and with
+    expires_at as the lease of the claim, and completed once the request
+    has answered.
+    """
+    agent_id = models.CharField(max_length=50)
+    key = models.CharField(max_length=255)
+    # SHA-256 of the request body, so a key reused for another request is refused
+    request_hash = models.CharField(max_length=64)
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_body = models.JSONField(encoder=DjangoJSONEncoder, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['agent_id', 'key'], name='idempotency_agent_key_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['expires_at'], name='idempotency_expires_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.agent_id} - {self.key}"
@@ -3,7 +3,9 @@ import json
 import logging
 from django.conf import settings
 from functools import wraps
-from typing import Callable, Any
+from typing import Callable, Any, Optional
+from concurrent.futures import Future
+from .confirms import get_confirm_publisher
 
 logger = logging.getLogger(__name__)
 
@@ -80,6 +82,15 @@ class RabbitMQClient:
                     queue='transaction_completion_events',
                     durable=True
                 )
+                self.channel.exchange_declare(
+                    exchange='user_events',
+                    exchange_type='topic',
+                    durable=True
+                )
+                self.channel.queue_declare(
+                    queue='transaction_auth_events',
+                    durable=True
+                )
                 
                 # Bind queues to exchanges with logging
                 logger.info("Binding transaction_status_events queue")
@@ -94,6 +105,13 @@ class RabbitMQClient:
                     queue='transaction_completion_events',
                     routing_key='transaction.completed'
                 )
+                logger.info("Binding transaction_auth_events queue")
+                for routing_key in ('user.updated', 'user.deleted', 'agent.updated'):
+                    self.channel.queue_bind(
+                        exchange='user_events',
+                        queue='transaction_auth_events',
+                        routing_key=routing_key
+                    )
                 
                 # Set QoS
                 self.channel.basic_qos(prefetch_count=1)
@@ -162,6 +180,16 @@ class RabbitMQClient:
                         "OPEN" if self.channel and not self.channel.is_closed else "CLOSED")
             raise
 
+    def publish_async(self, routing_key: str, message: dict,
+                      callback: Optional[Callable[[Future], None]] = None) -> Future:
+        """
+        Publish a message without waiting for its broker confirm.
+        Returns a Future that resolves when the confirm arrives; unconfirmed
+        messages are retried by the process-wide confirm publisher.
+        """
+        logger.debug("Queueing %s for confirmed publish", routing_key)
+        return get_confirm_publisher().publish(routing_key, message, callback=callback)
+
     def consume(self, queue_name: str, callback):
         """
         Start consuming messages from a queue
@@ -0,0 +1,359 @@
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import Callable, Optional
+import pika
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class PublishError(Exception):
+    """Raised on a publish future when a message could not be confirmed"""
+
+
+class _Pending:
+    """A message waiting to be published or confirmed"""
+    __slots__ = ('routing_key', 'body', 'future', 'attempts', 'sent_at')
+
+    def __init__(self, routing_key: str, body: bytes):
+        self.routing_key = routing_key
+        self.body = body
+        self.future = Future()
+        self.attempts = 0
+        self.sent_at = None
+
+
+class RetryStore:
+    """
+    Local store for messages that were nacked, timed out or lost with the
+    connection. Entries become due again after a linear backoff.
+    """
+
+    def __init__(self):
+        self._entries = []
+        self._lock = threading.Lock()
+
+    def add(self, entry: _Pending, due: float) -> None:
+        with self._lock:
+            self._entries.append((due, entry))
+
+    def pop_due(self, now: float) -> list:
+        with self._lock:
+            due = [entry for at, entry in self._entries if at <= now]
+            self._entries = [(at, entry) for at, entry in self._entries if at > now]
+        return due
+
+    def drain(self) -> list:
+        with self._lock:
+            entries = [entry for _, entry in self._entries]
+            self._entries = []
+        return entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class ConfirmPublisher:
+    """
+    Publishes to one exchange with windowed publisher confirms.
+
+    A background I/O thread owns an asynchronous SelectConnection. publish()
+    only enqueues and returns a Future; the I/O thread assigns delivery tag
+    sequence numbers and resolves futures as (possibly multiple) acks arrive,
+    so callers never wait for a broker round trip per message. At most
+    `window` messages are unresolved at a time, which gives callers
+    backpressure. Nacked, timed-out and connection-lost messages go to the
+    retry store and are republished until `max_attempts` is reached, after
+    which their future fails with PublishError.
+
+    Delivery is at least once. A message whose confirm times out is
+    republished even though the broker may already have queued it, and a
+    late ack for the earlier copy is ignored, so every slow confirm can
+    turn into a duplicate; consumers must deduplicate. Callers that retry
+    on their own, such as the outbox relay, pass max_attempts=1 so that
+    nothing is republished behind their back.
+
+    Future callbacks run on the I/O thread and must not block.
+    """
+
+    SWEEP_INTERVAL = 1  # seconds
+    RECONNECT_DELAY = 5  # seconds
+
+    def __init__(self, parameters: pika.ConnectionParameters, exchange: str = 'transaction_events',
+                 window: int = 1000, confirm_timeout: float = 30, max_attempts: int = 5,
+                 retry_delay: float = 1):
+        self.parameters = parameters
+        self.exchange = exchange
+        self.confirm_timeout = confirm_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retry_store = RetryStore()
+
+        self._slots = threading.BoundedSemaphore(window)
+        self._outbox = deque()
+        self._outbox_lock = threading.Lock()
+        self._in_flight = OrderedDict()  # delivery tag -> _Pending, I/O thread only
+        self._delivery_tag = 0
+        self._connection = None
+        self._channel = None
+        self._ready = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._properties = pika.BasicProperties(
+            delivery_mode=2,  # make message persistent
+            content_type='application/json'
+        )
+
+    # Caller side
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name='ConfirmPublisher', daemon=True)
+        self._thread.start()
+
+    def publish(self, routing_key: str, message: dict, callback: Optional[Callable[[Future], None]] = None,
+                timeout: Optional[float] = None) -> Future:
+        """
+        Queue a message for publishing and return a Future that resolves once
+        the broker confirms it. Blocks only while the confirm window is full.
+        """
+        if self._stopping.is_set():
+            raise PublishError("Publisher is stopped")
+        if not self._slots.acquire(timeout=timeout if timeout is not None else self.confirm_timeout):
+            raise PublishError("Timed out waiting for a slot in the confirm window")
+
+        entry = _Pending(routing_key, json.dumps(message).encode())
+        if callback:
+            entry.future.add_done_callback(callback)
+        with self._outbox_lock:
+            self._outbox.append(entry)
+        self._wake()
+        return entry.future
+
+    def wait_for_confirms(self, futures, timeout: Optional[float] = None) -> list:
+        """Wait for the given futures and return the ones that failed"""
+        deadline = time.monotonic() + (timeout if timeout is not None else self.confirm_timeout)
+        failed = []
+        for future in futures:
+            try:
+                future.result(timeout=max(0, deadline - time.monotonic()))
+            except Exception:
+                failed.append(future)
+        return failed
+
+    def stop(self, timeout: float = 5) -> None:
+        """Stop the I/O thread; anything still unconfirmed fails with PublishError"""
+        self._stopping.set()
+        connection = self._connection
+        if connection is not None:
+            try:
+                connection.ioloop.add_callback_threadsafe(self._close_connection)
+            except Exception as e:
+                logger.debug("Error scheduling publisher shutdown: %s", str(e))
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        error = PublishError("Publisher stopped before the message was confirmed")
+        with self._outbox_lock:
+            pending = list(self._outbox)
+            self._outbox.clear()
+        for entry in pending + list(self._in_flight.values()) + self.retry_store.drain():
+            self._fail(entry, error)
+        self._in_flight.clear()
+
+    def _wake(self) -> None:
+        connection = self._connection
+        if connection is not None and self._ready.is_set():
+            try:
+                connection.ioloop.add_callback_threadsafe(self._flush)
+            except Exception:
+                # The connection is going away; the outbox is flushed on reconnect
+                pass
+
+    # I/O thread
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self._connection = pika.SelectConnection(
+                    self.parameters,
+                    on_open_callback=self._on_connection_open,
+                    on_open_error_callback=self._on_connection_open_error,
+                    on_close_callback=self._on_connection_closed
+                )
+                self._connection.ioloop.start()
+            except Exception as e:
+                logger.error("Confirm publisher I/O loop failed: %s", str(e))
+            if not self._stopping.is_set():
+                self._stopping.wait(self.RECONNECT_DELAY)
+        self._connection = None
+
+    def _on_connection_open(self, connection) -> None:
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_open_error(self, connection, error) -> None:
+        logger.error("Confirm publisher could not connect to RabbitMQ: %s", str(error))
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason) -> None:
+        self._ready.clear()
+        self._channel = None
+        if self._in_flight:
+            logger.warning("Connection closed with %s unconfirmed messages: %s", len(self._in_flight), reason)
+            for entry in self._in_flight.values():
+                self._retry(entry, f"Connection closed: {reason}")
+            self._in_flight.clear()
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel) -> None:
+        self._channel = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.exchange_declare(
+            exchange=self.exchange,
+            exchange_type='topic',
+            durable=True,
+            callback=self._on_exchange_declared
+        )
+
+    def _on_channel_closed(self, channel, reason) -> None:
+        logger.warning("Confirm publisher channel closed: %s", reason)
+        self._close_connection()
+
+    def _on_exchange_declared(self, frame) -> None:
+        self._channel.confirm_delivery(
+            ack_nack_callback=self._on_delivery_confirmation,
+            callback=self._on_confirm_mode
+        )
+
+    def _on_confirm_mode(self, frame) -> None:
+        self._delivery_tag = 0
+        self._ready.set()
+        logger.info("Confirm publisher ready on exchange %s", self.exchange)
+        self._flush()
+        self._connection.ioloop.call_later(self.SWEEP_INTERVAL, self._sweep)
+
+    def _close_connection(self) -> None:
+        self._ready.clear()
+        if self._connection is not None and not (self._connection.is_closing or self._connection.is_closed):
+            self._connection.close()
+
+    def _flush(self) -> None:
+        while self._ready.is_set():
+            with self._outbox_lock:
+                if not self._outbox:
+                    return
+                entry = self._outbox.popleft()
+            try:
+                self._channel.basic_publish(
+                    exchange=self.exchange,
+                    routing_key=entry.routing_key,
+                    body=entry.body,
+                    properties=self._properties
+                )
+            except Exception as e:
+                logger.error("Failed to publish %s: %s", entry.routing_key, str(e))
+                with self._outbox_lock:
+                    self._outbox.appendleft(entry)
+                return
+            self._delivery_tag += 1
+            entry.sent_at = time.monotonic()
+            self._in_flight[self._delivery_tag] = entry
+
+    def _on_delivery_confirmation(self, frame) -> None:
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        if method.multiple:
+            tags = []
+            for tag in self._in_flight:
+                if tag > method.delivery_tag:
+                    break
+                tags.append(tag)
+        else:
+            tags = [method.delivery_tag]
+
+        for tag in tags:
+            entry = self._in_flight.pop(tag, None)
+            if entry is None:
+                # Already given up on by the timeout sweep
+                continue
+            if acked:
+                self._resolve(entry)
+            else:
+                self._retry(entry, "Message nacked by broker")
+
+    def _sweep(self) -> None:
+        if not self._ready.is_set():
+            return
+        now = time.monotonic()
+        while self._in_flight:
+            tag, entry = next(iter(self._in_flight.items()))
+            if now - entry.sent_at < self.confirm_timeout:
+                break
+            del self._in_flight[tag]
+            self._retry(entry, "Timed out waiting for broker confirm")
+
+        due = self.retry_store.pop_due(now)
+        if due:
+            logger.info("Republishing %s messages from the retry store", len(due))
+            with self._outbox_lock:
+                self._outbox.extend(due)
+        self._flush()
+        self._connection.ioloop.call_later(self.SWEEP_INTERVAL, self._sweep)
+
+    def _retry(self, entry: _Pending, reason: str) -> None:
+        entry.attempts += 1
+        if entry.attempts >= self.max_attempts:
+            logger.error("Giving up on %s after %s attempts: %s", entry.routing_key, entry.attempts, reason)
+            self._fail(entry, PublishError(reason))
+            return
+        logger.warning("Retrying %s (attempt %s): %s", entry.routing_key, entry.attempts + 1, reason)
+        self.retry_store.add(entry, time.monotonic() + self.retry_delay * entry.attempts)
+
+    def _resolve(self, entry: _Pending) -> None:
+        if entry.future.done():
+            return
+        self._slots.release()
+        entry.future.set_result(None)
+
+    def _fail(self, entry: _Pending, error: Exception) -> None:
+        if entry.future.done():
+            return
+        self._slots.release()
+        entry.future.set_exception(error)
+
+
+def log_publish_result(routing_key: str, transaction_id) -> Callable[[Future], None]:
+    """Build a future callback that logs messages which were never confirmed"""
+    def callback(future: Future) -> None:
+        error = future.exception()
+        if error is not None:
+            logger.error("Failed to publish %s for transaction %s: %s", routing_key, transaction_id, str(error))
+    return callback
+
+
+_publisher = None
+_publisher_lock = threading.Lock()
+
+
+def get_confirm_publisher() -> ConfirmPublisher:
+    """Return the process-wide confirm publisher, starting it on first use"""
+    global _publisher
+    if _publisher is None:
+        with _publisher_lock:
+            if _publisher is None:
+                from .client import RabbitMQClient
+                publisher = ConfirmPublisher(
+                    RabbitMQClient().parameters,
+                    window=getattr(settings, 'RABBITMQ_CONFIRM_WINDOW', 1000),
+                    confirm_timeout=getattr(settings, 'RABBITMQ_CONFIRM_TIMEOUT', 30),
+                    max_attempts=getattr(settings, 'RABBITMQ_PUBLISH_MAX_ATTEMPTS', 5)
+                )
+                publisher.start()
+                _publisher = publisher
+    return _publisher
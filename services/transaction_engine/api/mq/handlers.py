@@ -2,10 +2,13 @@ import json
 import logging
 import uuid
 from typing import Any, Dict
-from django.core.cache import cache
 from ..models import Transaction, TransactionStatus
 from .client import RabbitMQClient
 from ..processors import TransactionProcessor
+from ..outbox import enqueue_transaction_initiated
+from ..tokens import profile_cache
+from ..transaction_cache import invalidate_transaction
+from .. import stats
 from django.db import transaction
 
 logger = logging.getLogger(__name__)
@@ -14,29 +17,17 @@ class TransactionEventHandler:
     def __init__(self):
         self.mq_client = RabbitMQClient()
         self.max_retries = 3
-        self.retry_delay = 5000  # milliseconds
         self.processor = TransactionProcessor()
 
     def publish_transaction_initiated(self, transaction: Transaction) -> None:
         """
-        Publish transaction initiated event
+        Queue the transaction initiated event in the outbox.
+        The relay_outbox command publishes it with confirms and retries.
         """
-        message = {
-            'transaction_id': str(transaction.transaction_id),
-            'transaction_type': transaction.transaction_type.name,
-            'amount': str(transaction.amount),
-            'agent_id': str(transaction.agent_id),
-            'customer_identifier': transaction.customer_identifier,
-            'provider': transaction.get_provider_display()
-        }
-        
         try:
-            self.mq_client.publish(
-                routing_key='transaction.initiated',
-                message=message
-            )
+            enqueue_transaction_initiated(transaction)
         except Exception as e:
-            logger.error(f"Failed to publish transaction initiated event: {str(e)}")
+            logger.error(f"Failed to queue transaction initiated event: {str(e)}")
             self._handle_publish_failure(transaction)
 
     def handle_transaction_initiated(self, ch: Any, method: Any, properties: Any, body: bytes) -> None:
@@ -75,8 +66,7 @@ class TransactionEventHandler:
             transaction.save()
 
             # Clear cache
-            cache_key = f"transaction_{transaction_id}"
-            cache.delete(cache_key)
+            invalidate_transaction(transaction.agent_id, transaction.transaction_id)
 
             # Acknowledge message
             ch.basic_ack(delivery_tag=method.delivery_tag)
@@ -104,8 +94,7 @@ class TransactionEventHandler:
             transaction.save()
 
             # Clear cache
-            cache_key = f"transaction_{transaction_id}"
-            cache.delete(cache_key)
+            invalidate_transaction(transaction.agent_id, transaction.transaction_id)
 
             # Acknowledge message
             ch.basic_ack(delivery_tag=method.delivery_tag)
@@ -118,26 +107,20 @@ class TransactionEventHandler:
             logger.error(f"Error processing transaction failed event: {str(e)}")
             self._handle_event_failure(ch, method, properties, body)
 
-    def _handle_publish_failure(self, transaction: Transaction) -> None:
+    def _handle_publish_failure(self, tx: Transaction) -> None:
         """
-        Handle failure to publish event
+        Handle failure to queue an event. Without an outbox row nothing will
+        ever publish the event, so fail the transaction rather than leave it
+        stuck in INITIATED.
         """
-        retry_count = cache.get(f"retry_publish_{transaction.transaction_id}", 0)
-        
-        if retry_count < self.max_retries:
-            cache.set(
-                f"retry_publish_{transaction.transaction_id}",
-                retry_count + 1,
-                timeout=self.retry_delay
-            )
-            # In a real implementation, we would use Celery or similar to retry
-            # For now, we'll just log it
-            logger.info(f"Scheduled retry {retry_count + 1} for transaction {transaction.transaction_id}")
-        else:
-            transaction.status = TransactionStatus.FAILED
-            transaction.error_message = "Failed to publish transaction event"
-            transaction.save()
-            logger.error(f"Max retries reached for publishing transaction {transaction.transaction_id}")
+        with transaction.atomic():
+            before = stats.contribution(tx)
+            tx.status = TransactionStatus.FAILED
+            tx.error_message = "Failed to publish transaction event"
+            tx.save()
+            stats.record_change(tx, before)
+            invalidate_transaction(tx.agent_id, tx.transaction_id)
+        logger.error(f"Marked transaction {tx.transaction_id} as failed, event could not be queued")
 
     def _handle_event_failure(self, ch: Any, method: Any, properties: Any, body: bytes) -> None:
         """
@@ -191,13 +174,14 @@ class TransactionEventHandler:
                     )
                     
                     # Update transaction status
+                    before = stats.contribution(tx)
                     tx.status = TransactionStatus.FAILED
                     tx.error_message = error_message
                     tx.save()
+                    stats.record_change(tx, before)
                     
                     # Clear cache
-                    cache_key = f"transaction_{transaction_id}"
-                    cache.delete(cache_key)
+                    invalidate_transaction(tx.agent_id, tx.transaction_id)
                     
                     logger.info(f"Updated transaction {transaction_id} status to FAILED")
                     ch.basic_ack(delivery_tag=method.delivery_tag)
@@ -236,15 +220,16 @@ class TransactionEventHandler:
                     )
                     
                     # Update transaction status and commission info
+                    before = stats.contribution(tx)
                     tx.status = TransactionStatus.SUCCESSFUL
                     if commission_amount:
                         tx.commission_amount = commission_amount
                         tx.commission_status = commission_status
                     tx.save()
+                    stats.record_change(tx, before)
                     
                     # Clear cache
-                    cache_key = f"transaction_{transaction_id}"
-                    cache.delete(cache_key)
+                    invalidate_transaction(tx.agent_id, tx.transaction_id)
                     
                     logger.info(f"Updated transaction {transaction_id} status to SUCCESSFUL")
                     ch.basic_ack(delivery_tag=method.delivery_tag)
@@ -255,4 +240,24 @@ class TransactionEventHandler:
                 
         except Exception as e:
             logger.error(f"Error handling transaction.completed event: {str(e)}")
-            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False) 
\ No newline at end of file
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+
+    @staticmethod
+    def handle_profile_changed(ch, method, properties, body):
+        """
+        Handle user.updated, user.deleted and agent.updated events
+        Drops the cached profile so the next request reloads it
+        """
+        try:
+            data = json.loads(body)
+            user_id = data.get('user_id')
+            if user_id is None:
+                logger.error(f"No user_id in {method.routing_key} event")
+                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+                return
+            profile_cache.invalidate(user_id)
+            logger.info(f"Invalidated cached profile for user {user_id} on {method.routing_key}")
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+        except Exception as e:
+            logger.error(f"Error handling {method.routing_key} event: {str(e)}")
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
@@ -0,0 +1,150 @@
+import logging
+from collections import Counter
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from .models import OutboxEvent, Transaction, TransactionStatus
+from .transaction_cache import invalidate_transactions
+from .stats import apply_deltas, status_change
+
+logger = logging.getLogger(__name__)
+
+
+def transaction_initiated_payload(tx: Transaction) -> dict:
+    """Message body of the transaction.initiated event"""
+    provider = tx.wallet_provider or tx.bank_provider
+    return {
+        'transaction_id': str(tx.transaction_id),
+        'transaction_type': tx.transaction_type.name,
+        'amount': str(tx.amount),
+        'agent_id': str(tx.agent_id),
+        'customer_identifier': tx.customer_identifier,
+        'provider': tx.get_provider_display(),
+        'provider_code': provider.name if provider else None,
+        'initiated_at': tx.created_at.isoformat() if tx.created_at else None,
+        'status': TransactionStatus.INITIATED.name
+    }
+
+
+def enqueue_event(routing_key: str, aggregate_id: str, payload: dict) -> OutboxEvent:
+    """
+    Write an event to the outbox. Call inside the same atomic block as the
+    change the event describes so both commit or neither does.
+    """
+    return OutboxEvent.objects.create(
+        routing_key=routing_key,
+        aggregate_id=str(aggregate_id),
+        payload=payload
+    )
+
+
+def enqueue_transaction_initiated(tx: Transaction) -> OutboxEvent:
+    return enqueue_event('transaction.initiated', tx.transaction_id, transaction_initiated_payload(tx))
+
+
+def relay_batch(publisher, batch_size: int = 500, max_attempts: int = 10) -> int:
+    """
+    Publish one batch of pending outbox events and return how many were sent.
+
+    Rows are claimed with SKIP LOCKED so several relays can run side by side.
+    Every event in the batch is published before any confirm is awaited, so
+    the batch costs one confirm window rather than one round trip per event.
+
+    The relay is the only retrier: publisher must not retry on its own
+    (max_attempts=1), and every future is waited for until the publisher
+    has settled it, so a row is only published again once its previous
+    copy was nacked, lost or timed out. The rows stay locked for at most
+    the publisher's confirm_timeout.
+    """
+    with transaction.atomic():
+        events = list(
+            OutboxEvent.objects.select_for_update(skip_locked=True)
+            .filter(published_at__isnull=True, attempts__lt=max_attempts)
+            .order_by('id')[:batch_size]
+        )
+        if not events:
+            return 0
+
+        futures = {publisher.publish(event.routing_key, event.payload): event for event in events}
+        # The publisher fails a future confirm_timeout after the send, on its
+        # next sweep at the latest
+        failed = set(publisher.wait_for_confirms(
+            futures, timeout=publisher.confirm_timeout + 2 * publisher.SWEEP_INTERVAL
+        ))
+
+        published_ids = [event.id for future, event in futures.items() if future not in failed]
+        if published_ids:
+            OutboxEvent.objects.filter(id__in=published_ids).update(published_at=timezone.now())
+
+        if failed:
+            failed_events = [futures[future] for future in failed]
+            error = next((str(f.exception(timeout=0)) for f in failed if f.done()), "Timed out waiting for confirm")
+            OutboxEvent.objects.filter(id__in=[event.id for event in failed_events]).update(
+                attempts=F('attempts') + 1,
+                last_error=error
+            )
+            exhausted = [event for event in failed_events if event.attempts + 1 >= max_attempts]
+            if exhausted:
+                fail_undeliverable(exhausted)
+            logger.warning("Outbox relay: %s of %s events not confirmed", len(failed), len(events))
+
+    logger.info("Outbox relay published %s events", len(published_ids))
+    return len(published_ids)
+
+
+def fail_undeliverable(events) -> None:
+    """
+    Settle transactions whose initiated event exhausted its publish attempts
+    with the wallet, as the sweeper does: a copy may still have reached it.
+    Those the wallet cannot be asked about stay INITIATED for the sweeper.
+    """
+    from .sweeper import settle
+
+    initiated = [event for event in events if event.routing_key == 'transaction.initiated']
+    transaction_ids = [event.aggregate_id for event in initiated]
+    if not transaction_ids:
+        return
+    with transaction.atomic():
+        failing = list(
+            Transaction.objects.select_for_update()
+            .filter(transaction_id__in=transaction_ids, status=TransactionStatus.INITIATED)
+        )
+        failed, completed = settle(failing, "Failed to publish transaction event")
+    logger.error(
+        "Settled transactions after exhausting publish attempts: %s failed, %s completed", failed, completed
+    )
+
+
+def fail_transactions(rows, error_message: str) -> int:
+    """
+    Mark INITIATED transactions as failed in one statement, with their stats
+    deltas and cache invalidation. rows are (transaction_id, agent_id,
+    transaction_type, amount) of transactions locked by the caller's atomic
+    block. Returns how many were updated.
+    """
+    return _finish_transactions(rows, TransactionStatus.FAILED, error_message=error_message)
+
+
+def complete_transactions(rows) -> int:
+    """As fail_transactions(), for INITIATED transactions the wallet applied"""
+    return _finish_transactions(rows, TransactionStatus.SUCCESSFUL)
+
+
+def _finish_transactions(rows, status: TransactionStatus, **fields) -> int:
+    if not rows:
+        return 0
+    updated = Transaction.objects.filter(
+        transaction_id__in=[row[0] for row in rows]
+    ).update(
+        status=status,
+        updated_at=timezone.now(),
+        **fields
+    )
+    deltas = {}
+    for _, agent_id, transaction_type, amount in rows:
+        deltas.setdefault((agent_id, transaction_type.name), Counter()).update(
+            status_change(TransactionStatus.INITIATED, status, amount)
+        )
+    apply_deltas(deltas)
+    invalidate_transactions((agent_id, transaction_id) for transaction_id, agent_id, _, _ in rows)
+    return updated
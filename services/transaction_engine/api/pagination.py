@@ -0,0 +1,101 @@
+import base64
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Newest-first pagination on (created_at, tiebreak) that seeks instead of
+    counting and skipping rows: each page is one index range scan on
+    (agent_id, created_at, tiebreak) however deep it is, and rows inserted
+    meanwhile never shift later pages. The opaque cursor of the next page
+    is returned in `next`; there is no total count.
+    """
+    page_size = api_settings.PAGE_SIZE or 10
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    tiebreak = 'transaction_id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.next_position = None
+
+        queryset = queryset.order_by('-created_at', f'-{self.tiebreak}')
+        position = self.decode_cursor(request)
+        if position is not None:
+            created_at, key = position
+            # The first condition bounds the index scan, the second skips the
+            # rows at created_at that were on earlier pages
+            try:
+                queryset = queryset.filter(created_at__lte=created_at).exclude(
+                    Q(created_at=created_at) & Q(**{f'{self.tiebreak}__gte': key})
+                )
+            except (ValidationError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+
+        rows = list(queryset[:self.page_size + 1])
+        if len(rows) > self.page_size:
+            rows = rows[:self.page_size]
+            last = rows[-1]
+            self.next_position = (last.created_at, getattr(last, self.tiebreak))
+        return rows
+
+    def get_page_size(self, request) -> int:
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            created_at, key = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii').split('|', 1)
+            created_at = parse_datetime(created_at)
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None or not key:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, key
+
+    @staticmethod
+    def encode_cursor(position) -> str:
+        created_at, key = position
+        return base64.urlsafe_b64encode(f'{created_at.isoformat()}|{key}'.encode('ascii')).decode('ascii')
+
+    def get_next_cursor(self):
+        return self.encode_cursor(self.next_position) if self.next_position else None
+
+    def get_next_link(self):
+        cursor = self.get_next_cursor()
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'next_cursor': self.get_next_cursor(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'next_cursor': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
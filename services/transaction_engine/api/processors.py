@@ -1,9 +1,11 @@
 import logging
 from decimal import Decimal
 from django.db import transaction
-from django.core.cache import cache
 from .models import Transaction, TransactionStatus
+from .transaction_cache import invalidate_transaction
+from . import stats
 from .mq.client import RabbitMQClient
+from .mq.confirms import log_publish_result
 
 logger = logging.getLogger(__name__)
 
@@ -29,6 +31,7 @@ class TransactionProcessor:
                 if tx.status != TransactionStatus.INITIATED:
                     logger.warning(f"Transaction {transaction_id} is not in INITIATED state")
                     return
+                before = stats.contribution(tx)
 
                 # Calculate commission (1% for demo)
                 commission_amount = tx.amount * self.commission_rate
@@ -44,20 +47,21 @@ class TransactionProcessor:
                 tx.commission_amount = commission_amount
                 tx.commission_status = True
                 tx.save()
+                stats.record_change(tx, before)
 
                 # Clear cache
-                cache_key = f"transaction_{transaction_id}"
-                cache.delete(cache_key)
+                invalidate_transaction(tx.agent_id, tx.transaction_id)
 
                 # Publish success event
                 try:
-                    self.mq_client.publish(
+                    self.mq_client.publish_async(
                         routing_key='transaction.completed',
                         message={
                             'transaction_id': str(transaction_id),
                             'commission_amount': str(commission_amount),
                             'commission_status': True
-                        }
+                        },
+                        callback=log_publish_result('transaction.completed', transaction_id)
                     )
                 except Exception as e:
                     logger.error(f"Failed to publish completion event: {str(e)}")
@@ -81,22 +85,24 @@ class TransactionProcessor:
         try:
             with transaction.atomic():
                 tx = Transaction.objects.select_for_update().get(transaction_id=transaction_id)
+                before = stats.contribution(tx)
                 tx.status = TransactionStatus.FAILED
                 tx.error_message = error_message
                 tx.save()
+                stats.record_change(tx, before)
 
                 # Clear cache
-                cache_key = f"transaction_{transaction_id}"
-                cache.delete(cache_key)
+                invalidate_transaction(tx.agent_id, tx.transaction_id)
 
                 # Publish failure event
                 try:
-                    self.mq_client.publish(
+                    self.mq_client.publish_async(
                         routing_key='transaction.failed',
                         message={
                             'transaction_id': str(transaction_id),
                             'error_message': error_message
-                        }
+                        },
+                        callback=log_publish_result('transaction.failed', transaction_id)
                     )
                 except Exception as e:
                     logger.error(f"Failed to publish failure event: {str(e)}")
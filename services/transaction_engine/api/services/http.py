@@ -0,0 +1,279 @@
+import time
+import random
+import logging
+import threading
+from bisect import bisect_left
+from concurrent.futures import Future
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Methods that are safe to send twice
+RETRYABLE_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class CircuitOpenError(requests.RequestException):
+    """Raised without touching the network while a service's breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Opens after `failure_threshold` consecutive failures and rejects calls
+    for `reset_timeout` seconds. After that a single trial call is let
+    through (half-open); its outcome closes or re-opens the breaker.
+    """
+
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            now = time.monotonic()
+            expired = now - self._opened_at >= self.reset_timeout
+            if self.state == self.OPEN and expired:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            # A trial that never reported back is replaced after reset_timeout
+            if self.state == self.HALF_OPEN and (not self._trial_in_flight or expired):
+                self._trial_in_flight = True
+                self._opened_at = now
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self) -> bool:
+        """Count a failure; returns True if this opened the breaker"""
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                opened = self.state != self.OPEN
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._trial_in_flight = False
+                return opened
+            return False
+
+
+class HttpMetrics:
+    """Per-service request counters and a latency histogram"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._services = {}
+
+    def _service(self, name: str) -> dict:
+        metrics = self._services.get(name)
+        if metrics is None:
+            metrics = self._services[name] = {
+                'requests': 0,
+                'errors': 0,
+                'retries': 0,
+                'short_circuited': 0,
+                'breaker_opened': 0,
+                'latency_buckets': [0] * len(LATENCY_BUCKETS),
+                'latency_sum': 0.0,
+                'latency_count': 0,
+            }
+        return metrics
+
+    def observe(self, name: str, seconds: float, error: bool) -> None:
+        with self._lock:
+            metrics = self._service(name)
+            metrics['requests'] += 1
+            metrics['errors'] += int(error)
+            metrics['latency_sum'] += seconds
+            metrics['latency_count'] += 1
+            index = bisect_left(LATENCY_BUCKETS, seconds)
+            if index < len(LATENCY_BUCKETS):
+                metrics['latency_buckets'][index] += 1
+
+    def increment(self, name: str, counter: str) -> None:
+        with self._lock:
+            self._service(name)[counter] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                name: dict(metrics, latency_buckets=list(metrics['latency_buckets']))
+                for name, metrics in self._services.items()
+            }
+
+    def render(self, breakers: dict) -> str:
+        """Prometheus text exposition format"""
+        lines = []
+        for name, metrics in sorted(self.snapshot().items()):
+            label = f'service="{name}"'
+            for counter in ('requests', 'errors', 'retries', 'short_circuited', 'breaker_opened'):
+                lines.append(f'interservice_http_{counter}_total{{{label}}} {metrics[counter]}')
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, metrics['latency_buckets']):
+                cumulative += count
+                lines.append(f'interservice_http_latency_seconds_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'interservice_http_latency_seconds_bucket{{{label},le="+Inf"}} {metrics["latency_count"]}')
+            lines.append(f'interservice_http_latency_seconds_sum{{{label}}} {metrics["latency_sum"]:.6f}')
+            lines.append(f'interservice_http_latency_seconds_count{{{label}}} {metrics["latency_count"]}')
+        for name, breaker in sorted(breakers.items()):
+            lines.append(f'interservice_http_breaker_open{{service="{name}"}} {int(breaker.state != CircuitBreaker.CLOSED)}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = HttpMetrics()
+
+
+class ServiceClient:
+    """
+    HTTP client for one downstream service.
+
+    Requests share a keep-alive connection pool, always carry connect and
+    read timeouts, and idempotent ones are retried on connection errors,
+    timeouts and 5xx responses with full-jitter exponential backoff. A
+    circuit breaker fails fast with CircuitOpenError while the service is
+    down instead of tying up workers on calls that will time out.
+    """
+
+    def __init__(self, name: str, base_url: str, connect_timeout: float = 2, read_timeout: float = 5,
+                 retries: int = 2, backoff: float = 0.2, max_backoff: float = 2, pool_size: int = 20,
+                 failure_threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.base_url = (base_url or '').rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _sleep_before_retry(self, attempt: int) -> None:
+        time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt))))
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        method = method.upper()
+        kwargs.setdefault('timeout', self.timeout)
+        attempts = 1 + (self.retries if method in RETRYABLE_METHODS else 0)
+        url = f"{self.base_url}{path}"
+
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                metrics.increment(self.name, 'short_circuited')
+                raise CircuitOpenError(f"Circuit open for {self.name} service")
+            if attempt:
+                metrics.increment(self.name, 'retries')
+
+            started = time.monotonic()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                metrics.observe(self.name, time.monotonic() - started, error=True)
+                self._record_failure()
+                if attempt == attempts - 1:
+                    raise
+                logger.warning(f"{self.name} service call {method} {path} failed, retrying: {str(e)}")
+                self._sleep_before_retry(attempt)
+                continue
+
+            failed = response.status_code >= 500
+            metrics.observe(self.name, time.monotonic() - started, error=failed)
+            if not failed:
+                self.breaker.record_success()
+                return response
+            self._record_failure()
+            if attempt == attempts - 1:
+                return response
+            logger.warning(f"{self.name} service returned {response.status_code} for {method} {path}, retrying")
+            self._sleep_before_retry(attempt)
+
+    def _record_failure(self) -> None:
+        if self.breaker.record_failure():
+            metrics.increment(self.name, 'breaker_opened')
+            logger.error(f"Circuit opened for {self.name} service")
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request('POST', path, **kwargs)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key: the first caller runs the
+    function, callers that arrive while it is in flight wait for and share
+    its result (or exception) instead of issuing their own request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(name: str, base_url: str) -> ServiceClient:
+    """Return the process-wide client for a service, creating it on first use"""
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                config = getattr(settings, 'INTER_SERVICE_HTTP', {})
+                client = _clients[name] = ServiceClient(
+                    name,
+                    base_url,
+                    connect_timeout=config.get('CONNECT_TIMEOUT', 2),
+                    read_timeout=config.get('READ_TIMEOUT', 5),
+                    retries=config.get('RETRIES', 2),
+                    backoff=config.get('BACKOFF', 0.2),
+                    pool_size=config.get('POOL_SIZE', 20),
+                    failure_threshold=config.get('BREAKER_FAILURES', 5),
+                    reset_timeout=config.get('BREAKER_RESET', 30)
+                )
+    return client
+
+
+def render_metrics() -> str:
+    return metrics.render({name: client.breaker for name, client in _clients.items()})
@@ -1,26 +1,148 @@
 import logging
-import requests
 from decimal import Decimal
 from django.conf import settings
+from .http import CircuitOpenError, SingleFlight, get_client
 
 logger = logging.getLogger(__name__)
 
+# Shared by every client in the process so concurrent lookups coalesce
+_balance_lookups = SingleFlight()
+
+
+class WalletNotFound(Exception):
+    """Raised when the agent has no wallet"""
+
+
+class WalletUnavailable(Exception):
+    """Raised when the wallet service could not give an answer"""
+
+
 class WalletServiceClient:
     """
     Client for interacting with the Wallet Service
     """
     
     def __init__(self):
-        self.base_url = settings.WALLET_SERVICE_URL
-        
-    def check_balance(self, agent_id: str, amount: Decimal, auth_token: str) -> tuple[bool, str]:
+        self.http = get_client('wallet', settings.WALLET_SERVICE_URL)
+        self.service_key = settings.INTERNAL_SERVICE_KEY
+
+    def _internal_headers(self) -> dict:
+        return {'X-Service-Key': self.service_key}
+
+    def get_balance(self, agent_id: str) -> Decimal:
+        """
+        Available balance of an agent's wallet (balance less active holds)
+        over the internal endpoint.
+        Concurrent lookups for the same agent share one request.
+        Raises WalletNotFound or requests.RequestException.
+        """
+        def lookup():
+            response = self.http.get(
+                "/api/internal/wallets/balance/",
+                params={'agent_id': agent_id},
+                headers=self._internal_headers()
+            )
+            if response.status_code == 404:
+                raise WalletNotFound(agent_id)
+            response.raise_for_status()
+            return Decimal(response.json()['available_balance'])
+
+        return _balance_lookups.do(agent_id, lookup)
+
+    def reserve(self, agent_id: str, amount: Decimal, transaction_id: str) -> tuple[bool, str]:
+        """
+        Place a hold on the agent's wallet for the transaction, so the funds
+        are still there when the wallet consumer debits it. Safe to retry:
+        the wallet returns the existing hold for a known transaction_id
+        while it is active for the same agent and amount, and answers 409
+        otherwise.
+        Returns: (reserved, error_message) when the wallet decided. Raises
+        WalletUnavailable otherwise, after releasing any hold the wallet may
+        have placed before the answer was lost.
+        """
+        try:
+            response = self.http.post(
+                "/api/internal/wallets/holds/",
+                json={
+                    'agent_id': agent_id,
+                    'transaction_id': transaction_id,
+                    'amount': str(amount),
+                    'ttl_seconds': settings.WALLET_HOLD_TTL
+                },
+                headers=self._internal_headers()
+            )
+        except CircuitOpenError:
+            # Nothing was sent, so nothing can have been held
+            raise WalletUnavailable("Wallet service is unavailable")
+        except Exception as e:
+            logger.error(f"Error calling wallet service: {str(e)}")
+            self.release(transaction_id)
+            raise WalletUnavailable("Error connecting to wallet service")
+
+        if response.status_code == 201:
+            return True, None
+        if response.status_code == 409:
+            return False, response.json().get('detail')
+        if response.status_code == 404:
+            return False, "Wallet not found"
+        logger.error(f"Wallet service error placing hold: {response.text}")
+        self.release(transaction_id)
+        raise WalletUnavailable("Error reserving wallet balance")
+
+    def release(self, transaction_id: str) -> bool:
+        """
+        Release the hold for a transaction that will not be processed. Best
+        effort: a hold that is not released expires after WALLET_HOLD_TTL.
+        """
+        try:
+            response = self.http.post(
+                "/api/internal/wallets/holds/release/",
+                json={'transaction_id': transaction_id},
+                headers=self._internal_headers()
+            )
+            response.raise_for_status()
+            return response.json()['released']
+        except Exception as e:
+            logger.error(f"Failed to release hold for transaction {transaction_id}: {str(e)}")
+            return False
+
+    def settle(self, transactions: list, reason: str) -> dict:
+        """
+        Ask the wallet whether it applied transactions that are being given
+        up on; transactions are (transaction_id, agent_id) pairs. The wallet
+        fails the ones it has not processed yet, releasing their holds, so
+        none can be applied afterwards. Returns transaction_id ->
+        (applied, reason it was not). Raises requests.RequestException.
+        """
+        response = self.http.post(
+            "/api/internal/wallets/transactions/settle/",
+            json={
+                'transactions': [
+                    {'transaction_id': str(transaction_id), 'agent_id': str(agent_id)}
+                    for transaction_id, agent_id in transactions
+                ],
+                'reason': reason
+            },
+            headers=self._internal_headers()
+        )
+        response.raise_for_status()
+        return {
+            transaction_id: (outcome['applied'], outcome['reason'])
+            for transaction_id, outcome in response.json()['transactions'].items()
+        }
+
+    def check_balance(self, agent_id: str, amount: Decimal, auth_token: str = None) -> tuple[bool, str]:
         """
         Check if an agent has sufficient balance for a transaction
         Returns: (has_sufficient_balance, error_message)
+        Raises WalletUnavailable when the wallet service could not answer.
         """
+        if self.service_key:
+            return self._check_balance_internal(agent_id, amount)
+
         try:
-            response = requests.get(
-                f"{self.base_url}/api/wallets/balance/",
+            response = self.http.get(
+                "/api/wallets/balance/",
                 headers={
                     "Authorization": auth_token
                 }
@@ -28,7 +150,7 @@ class WalletServiceClient:
             
             if response.status_code == 200:
                 data = response.json()
-                current_balance = Decimal(data['balance'])
+                current_balance = Decimal(data.get('available_balance', data['balance']))
                 has_sufficient_balance = current_balance >= amount
                 
                 if has_sufficient_balance:
@@ -39,8 +161,27 @@ class WalletServiceClient:
                 return False, "Wallet not found"
             else:
                 logger.error(f"Wallet service error: {response.text}")
-                return False, "Error checking wallet balance"
-                
+                raise WalletUnavailable("Error checking wallet balance")
+
+        except WalletUnavailable:
+            raise
+        except CircuitOpenError:
+            raise WalletUnavailable("Wallet service is unavailable")
         except Exception as e:
             logger.error(f"Error calling wallet service: {str(e)}")
-            return False, "Error connecting to wallet service" 
\ No newline at end of file
+            raise WalletUnavailable("Error connecting to wallet service")
+
+    def _check_balance_internal(self, agent_id: str, amount: Decimal) -> tuple[bool, str]:
+        try:
+            current_balance = self.get_balance(agent_id)
+        except WalletNotFound:
+            return False, "Wallet not found"
+        except CircuitOpenError:
+            raise WalletUnavailable("Wallet service is unavailable")
+        except Exception as e:
+            logger.error(f"Error calling wallet service: {str(e)}")
+            raise WalletUnavailable("Error connecting to wallet service")
+
+        if current_balance >= amount:
+            return True, None
+        return False, f"Insufficient balance. Required: {amount}, Available: {current_balance}"
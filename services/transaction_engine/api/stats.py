@@ -0,0 +1,206 @@
+import logging
+from collections import Counter
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from django.db import connection
+from django.db.models import CharField, Count, Q, Sum
+from django.db.models.functions import Coalesce, Trunc
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from .models import AgentTransactionStats, Transaction, TransactionStatus
+
+logger = logging.getLogger(__name__)
+
+# Counter columns of AgentTransactionStats for each status
+STATUS_COLUMNS = {
+    TransactionStatus.INITIATED: ('initiated_count', 'initiated_amount'),
+    TransactionStatus.SUCCESSFUL: ('successful_count', 'successful_amount'),
+    TransactionStatus.FAILED: ('failed_count', 'failed_amount'),
+}
+
+COLUMNS = (
+    'initiated_count', 'initiated_amount',
+    'successful_count', 'successful_amount',
+    'failed_count', 'failed_amount',
+    'commission_earned',
+)
+
+_UPSERT_SQL = """
+    INSERT INTO {table} (agent_id, transaction_type, {columns}, updated_at)
+    VALUES {rows}
+    ON CONFLICT (agent_id, transaction_type) DO UPDATE SET
+        {increments},
+        updated_at = EXCLUDED.updated_at
+""".format(
+    table=AgentTransactionStats._meta.db_table,
+    columns=', '.join(COLUMNS),
+    rows='{rows}',
+    increments=',\n        '.join(f'{column} = {AgentTransactionStats._meta.db_table}.{column} + EXCLUDED.{column}'
+                                   for column in COLUMNS)
+)
+
+
+def contribution(tx: Transaction) -> Counter:
+    """What a transaction in its current state adds to its agent's stats"""
+    count_column, amount_column = STATUS_COLUMNS[tx.status]
+    counts = Counter({count_column: 1, amount_column: Decimal(str(tx.amount))})
+    if tx.status == TransactionStatus.SUCCESSFUL and tx.commission_status:
+        counts['commission_earned'] = Decimal(str(tx.commission_amount or 0))
+    return counts
+
+
+def status_change(old_status, new_status, amount) -> Counter:
+    """Delta of moving a transaction of amount from old_status to new_status"""
+    old_count, old_amount = STATUS_COLUMNS[old_status]
+    new_count, new_amount = STATUS_COLUMNS[new_status]
+    delta = Counter({new_count: 1, new_amount: amount})
+    delta.subtract({old_count: 1, old_amount: amount})
+    return delta
+
+
+def record_change(tx: Transaction, before: Counter = None) -> None:
+    """
+    Bring the agent's stats up to date after tx was created (before=None)
+    or changed; before is contribution(tx) taken ahead of the change. Call
+    inside the atomic block that saves tx.
+    """
+    delta = contribution(tx)
+    delta.subtract(before or Counter())
+    apply_deltas({(tx.agent_id, tx.transaction_type.name): delta})
+
+
+def apply_deltas(deltas: dict) -> None:
+    """
+    Add {(agent_id, transaction_type name): Counter of column deltas} to the
+    stats rows in one upsert. Rows are written in key order so concurrent
+    callers cannot deadlock.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if any(delta.values())}
+    if not deltas:
+        return
+
+    params = []
+    for (agent_id, transaction_type), delta in sorted(deltas.items()):
+        params.extend([agent_id, transaction_type])
+        params.extend(delta.get(column, 0) for column in COLUMNS)
+    row = '(' + ', '.join(['%s'] * (2 + len(COLUMNS))) + ', now())'
+    with connection.cursor() as cursor:
+        cursor.execute(_UPSERT_SQL.format(rows=', '.join([row] * len(deltas))), params)
+
+
+# Every figure of the stats endpoint in a single pass over the rows
+STATS_AGGREGATES = {
+    'total_transactions': Count('pk'),
+    'total_amount': Sum('amount'),
+    'successful_transactions': Count('pk', filter=Q(status=TransactionStatus.SUCCESSFUL)),
+    'successful_amount': Sum('amount', filter=Q(status=TransactionStatus.SUCCESSFUL)),
+    'failed_transactions': Count('pk', filter=Q(status=TransactionStatus.FAILED)),
+    'pending_transactions': Count('pk', filter=Q(status=TransactionStatus.INITIATED)),
+    'total_commission_earned': Sum(
+        'commission_amount',
+        filter=Q(status=TransactionStatus.SUCCESSFUL, commission_status=True)
+    ),
+}
+
+# Series granularity -> (Trunc kind, default window, longest window)
+BUCKETS = {
+    'hour': ('hour', timedelta(days=2), timedelta(days=31)),
+    'day': ('day', timedelta(days=30), timedelta(days=366)),
+}
+
+
+def _parse_bound(value: str, end: bool):
+    """ISO datetime, or a date meaning its start (or, for end, the next day's start)"""
+    try:
+        day = parse_date(value)
+        parsed = parse_datetime(value) if day is None else None
+    except ValueError:
+        raise ValueError(f"Invalid date: {value}")
+    if day is not None:
+        parsed = datetime.combine(day + timedelta(days=1) if end else day, time.min)
+    elif parsed is None:
+        raise ValueError(f"Invalid date: {value}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def parse_window(params) -> dict:
+    """
+    Read from/to/bucket query parameters into {'start', 'end', 'bucket'},
+    or None when none are given. The window is [start, end). Raises
+    ValueError on bad input.
+    """
+    start, end, bucket = params.get('from'), params.get('to'), params.get('bucket')
+    if not (start or end or bucket):
+        return None
+    if bucket and bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of: {', '.join(BUCKETS)}")
+
+    end = _parse_bound(end, end=True) if end else None
+    start = _parse_bound(start, end=False) if start else None
+    if bucket:
+        _, default_span, max_span = BUCKETS[bucket]
+        end = end or timezone.now()
+        start = start or end - default_span
+        if end - start > max_span:
+            raise ValueError(f"{bucket} buckets cover at most {max_span.days} days")
+    if start and end and start >= end:
+        raise ValueError("from must be before to")
+    return {'start': start, 'end': end, 'bucket': bucket}
+
+
+def summarize(queryset) -> dict:
+    """The stats endpoint's figures for queryset, in one query"""
+    totals = queryset.aggregate(**STATS_AGGREGATES)
+    zero = Decimal('0.00')
+    return {
+        'total_transactions': totals['total_transactions'],
+        'total_amount': str(totals['total_amount'] or zero),
+        'successful_transactions': totals['successful_transactions'],
+        'successful_amount': str(totals['successful_amount'] or zero),
+        'failed_transactions': totals['failed_transactions'],
+        'pending_transactions': totals['pending_transactions'],
+        'total_commission_earned': str(totals['total_commission_earned'] or zero),
+    }
+
+
+def volume_series_queryset(queryset, bucket: str):
+    """The grouped query behind volume_series, unevaluated"""
+    kind = BUCKETS[bucket][0]
+    return (
+        queryset
+        .annotate(
+            bucket=Trunc('created_at', kind),
+            provider=Coalesce('wallet_provider', 'bank_provider', output_field=CharField())
+        )
+        .values('bucket', 'transaction_type', 'provider')
+        .annotate(
+            count=Count('pk'),
+            amount=Sum('amount'),
+            successful_count=Count('pk', filter=Q(status=TransactionStatus.SUCCESSFUL)),
+            successful_amount=Sum('amount', filter=Q(status=TransactionStatus.SUCCESSFUL)),
+        )
+        .order_by('bucket', 'transaction_type', 'provider')
+    )
+
+
+def volume_series(queryset, bucket: str) -> list:
+    """
+    Transaction count and amount per time bucket, type and provider, in one
+    grouped query. Buckets without transactions are left out.
+    """
+    rows = volume_series_queryset(queryset, bucket)
+    zero = Decimal('0.00')
+    return [
+        {
+            'bucket': row['bucket'].isoformat(),
+            'transaction_type': row['transaction_type'].name,
+            'provider': row['provider'],
+            'count': row['count'],
+            'amount': str(row['amount'] or zero),
+            'successful_count': row['successful_count'],
+            'successful_amount': str(row['successful_amount'] or zero),
+        }
+        for row in rows
+    ]
@@ -0,0 +1,128 @@
+import logging
+from datetime import timedelta
+from django.db import transaction
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from .models import OutboxEvent, Transaction, TransactionStatus
+from .outbox import complete_transactions, fail_transactions, transaction_initiated_payload
+from .services.wallet import WalletServiceClient
+
+logger = logging.getLogger(__name__)
+
+STUCK_ERROR_MESSAGE = "Transaction was not completed in time"
+
+
+def sweep_batch(stale_after: int, fail_after: int, max_republish: int,
+                batch_size: int = 500, after: tuple = None) -> tuple:
+    """
+    Settle one chunk of transactions stuck in INITIATED for over stale_after
+    seconds, oldest first from the (created_at, transaction_id) position
+    after. Returns (claimed, republished, failed, completed, position of the
+    last row claimed), the position being None when nothing was left.
+
+    Rows are claimed with SKIP LOCKED, so several sweepers can run side by
+    side and a transaction being completed meanwhile is left alone. A stuck
+    transaction whose initiated event is still waiting in the outbox belongs
+    to the relay. Otherwise its initiated event is written to the outbox
+    again stale_after seconds after its last publish, or failed once it was
+    republished max_republish times. Anything older than fail_after seconds
+    is failed outright.
+
+    Before failing, the wallet is asked whether it applied the transaction:
+    applied ones are completed instead, and the rest are failed by the
+    wallet too, releasing their holds, so a late delivery cannot move the
+    balance of a failed transaction. While the wallet cannot be reached
+    nothing is failed; the transactions stay INITIATED for the next sweep.
+    """
+    now = timezone.now()
+    stale_before = now - timedelta(seconds=stale_after)
+    fail_before = now - timedelta(seconds=fail_after)
+
+    with transaction.atomic():
+        stuck = (
+            Transaction.objects.select_for_update(skip_locked=True)
+            .filter(status=TransactionStatus.INITIATED, created_at__lt=stale_before)
+            .order_by('created_at', 'transaction_id')
+        )
+        if after is not None:
+            created_at, transaction_id = after
+            stuck = stuck.filter(
+                Q(created_at__gt=created_at) | Q(created_at=created_at, transaction_id__gt=transaction_id)
+            )
+        stuck = list(stuck[:batch_size])
+        if not stuck:
+            return 0, 0, 0, 0, None
+
+        published = {
+            row['aggregate_id']: row
+            for row in OutboxEvent.objects.filter(
+                routing_key='transaction.initiated',
+                aggregate_id__in=[str(tx.transaction_id) for tx in stuck]
+            ).values('aggregate_id').annotate(
+                events=Count('id'),
+                pending=Count('id', filter=Q(published_at__isnull=True)),
+                last_published_at=Max('published_at')
+            ).order_by()
+        }
+
+        republish, failing = [], []
+        for tx in stuck:
+            history = published.get(str(tx.transaction_id), {'events': 0, 'pending': 0, 'last_published_at': None})
+            last_published_at = history['last_published_at']
+            if tx.created_at < fail_before:
+                failing.append(tx)
+            elif history['pending'] or (last_published_at and last_published_at >= stale_before):
+                continue
+            elif history['events'] > max_republish:
+                failing.append(tx)
+            else:
+                republish.append(tx)
+
+        OutboxEvent.objects.bulk_create([
+            OutboxEvent(
+                routing_key='transaction.initiated',
+                aggregate_id=str(tx.transaction_id),
+                payload=transaction_initiated_payload(tx)
+            )
+            for tx in republish
+        ])
+        failed, completed = settle(failing)
+
+    if republish or failing:
+        logger.warning(
+            f"Sweeper republished {len(republish)}, failed {failed} and completed {completed} "
+            f"of {len(stuck)} stuck transactions"
+        )
+    last = stuck[-1]
+    return len(stuck), len(republish), failed, completed, (last.created_at, last.transaction_id)
+
+
+def settle(failing: list, error_message: str = STUCK_ERROR_MESSAGE) -> tuple:
+    """
+    Complete the locked transactions the wallet applied and fail the rest,
+    with the wallet's reason when it failed them itself and error_message
+    otherwise; returns (failed, completed)
+    """
+    if not failing:
+        return 0, 0
+    try:
+        outcomes = WalletServiceClient().settle(
+            [(tx.transaction_id, tx.agent_id) for tx in failing], error_message
+        )
+    except Exception as e:
+        logger.error(f"Cannot settle {len(failing)} stuck transactions with the wallet: {str(e)}")
+        return 0, 0
+
+    applied, reasons = [], {}
+    for tx in failing:
+        outcome = outcomes.get(str(tx.transaction_id))
+        if outcome is None:
+            continue
+        row = (tx.transaction_id, tx.agent_id, tx.transaction_type, tx.amount)
+        if outcome[0]:
+            applied.append(row)
+        else:
+            reasons.setdefault(outcome[1] or error_message, []).append(row)
+
+    failed = sum(fail_transactions(rows, reason) for reason, rows in reasons.items())
+    return failed, complete_transactions(applied)
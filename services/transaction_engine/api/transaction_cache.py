@@ -0,0 +1,69 @@
+import logging
+from typing import Iterable, Optional
+import orjson
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+TRANSACTION_CACHE_PREFIX = 'transaction:'
+
+# Left in place of an invalidated entry; cache_transaction() only adds
+# missing keys, so it cannot overwrite the marker with an older read
+_INVALIDATED = b''
+
+
+def transaction_cache_key(agent_id, transaction_id) -> str:
+    """Keys are scoped by agent, so a hit can only serve the owner's own transaction"""
+    return f"{TRANSACTION_CACHE_PREFIX}{agent_id}:{transaction_id}"
+
+
+def get_cached_transaction(agent_id, transaction_id) -> Optional[bytes]:
+    """JSON body of a cached transaction, or None on a miss"""
+    try:
+        return cache.get(transaction_cache_key(agent_id, transaction_id)) or None
+    except Exception as e:
+        logger.warning(f"Transaction cache unavailable: {str(e)}")
+        return None
+
+
+def cache_transaction(agent_id, transaction_id, data: dict) -> bytes:
+    """
+    Encode serialized transaction data once and cache the bytes, so hits are
+    served without touching the model or the serializer. Returns the body.
+    Nothing is cached while the transaction is cached already or was
+    invalidated less than TRANSACTION_CACHE_INVALIDATED_TTL seconds ago.
+    """
+    body = orjson.dumps(data, default=str)
+    try:
+        cache.add(transaction_cache_key(agent_id, transaction_id), body, settings.TRANSACTION_CACHE_TTL)
+    except Exception as e:
+        logger.warning(f"Transaction cache unavailable: {str(e)}")
+    return body
+
+
+def invalidate_transactions(transactions: Iterable[tuple]) -> None:
+    """
+    Drop cached (agent_id, transaction_id) pairs. Inside an atomic block this
+    waits for commit. Waiting alone does not stop a read that loaded the row
+    before the commit from caching it again afterwards, so each entry is
+    replaced by a marker for TRANSACTION_CACHE_INVALIDATED_TTL seconds
+    instead of deleted; only a read stalled for longer than that between its
+    query and its cache write can still cache the old row.
+    """
+    keys = [transaction_cache_key(agent_id, transaction_id) for agent_id, transaction_id in transactions]
+    if not keys:
+        return
+
+    def invalidate():
+        try:
+            cache.set_many(dict.fromkeys(keys, _INVALIDATED), settings.TRANSACTION_CACHE_INVALIDATED_TTL)
+        except Exception as e:
+            logger.warning(f"Transaction cache unavailable: {str(e)}")
+
+    transaction.on_commit(invalidate)
+
+
+def invalidate_transaction(agent_id, transaction_id) -> None:
+    invalidate_transactions([(agent_id, transaction_id)])
@@ -1,23 +1,36 @@
 import uuid
 import logging
+from collections import Counter
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from django.core.cache import cache
-from django.db.models import Q, Sum, Count
-from .models import Transaction, TransactionType, TransactionStatus
+from django.db import transaction as db_transaction
+from .models import (
+    AgentTransactionStats, BankProvider, Transaction, TransactionType, TransactionStatus, WalletProvider,
+)
 from .serializers import TransactionSerializer, TransactionListSerializer
-from .mq.client import RabbitMQClient
-from .services.wallet import WalletServiceClient
+from .pagination import KeysetPagination
+from .outbox import enqueue_transaction_initiated
+from .idempotency import idempotent
+from .transaction_cache import cache_transaction, get_cached_transaction, invalidate_transaction
+from . import stats as transaction_stats
+from .services.wallet import WalletServiceClient, WalletUnavailable
 from decimal import Decimal
+from django.http import HttpResponse
+from .services.http import render_metrics
 
 logger = logging.getLogger(__name__)
 
+# Transaction types the wallet service debits from the agent's float
+WALLET_DEBIT_TYPES = (TransactionType.WALLET_LOAD, TransactionType.BANK_DEPOSIT)
+
 class TransactionViewSet(viewsets.ModelViewSet):
     permission_classes = [IsAuthenticated]
     serializer_class = TransactionSerializer
     queryset = Transaction.objects.all()
+    pagination_class = KeysetPagination
 
     def get_serializer_class(self):
         if self.action == 'list':
@@ -26,9 +39,11 @@ class TransactionViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """
-        Filter transactions by agent_id from the authenticated user
+        Filter transactions by agent_id from the authenticated user.
+        The status, type and provider filters take enum names; an unknown
+        name is a 400.
         """
-        queryset = Transaction.objects.filter(agent_id=self.request.user.id)
+        queryset = Transaction.objects.filter(agent_id=self.request.user.agent_id)
         
         # Apply filters if provided
         status = self.request.query_params.get('status', None)
@@ -36,19 +51,31 @@ class TransactionViewSet(viewsets.ModelViewSet):
         provider = self.request.query_params.get('provider', None)
 
         if status:
-            queryset = queryset.filter(status=status)
+            queryset = queryset.filter(status=self._enum_param('status', TransactionStatus, status))
         if transaction_type:
-            queryset = queryset.filter(transaction_type=transaction_type)
+            queryset = queryset.filter(transaction_type=self._enum_param('type', TransactionType, transaction_type))
         if provider:
-            queryset = queryset.filter(
-                Q(wallet_provider=provider) | Q(bank_provider=provider)
-            )
+            if provider in WalletProvider.__members__:
+                queryset = queryset.filter(wallet_provider=WalletProvider[provider])
+            elif provider in BankProvider.__members__:
+                queryset = queryset.filter(bank_provider=BankProvider[provider])
+            else:
+                raise ValidationError({'provider': [f"Invalid provider {provider}"]})
 
         return queryset.order_by('-created_at')
 
+    @staticmethod
+    def _enum_param(name: str, enum, value: str):
+        try:
+            return enum[value]
+        except KeyError:
+            raise ValidationError({name: [f"Invalid {name} {value}"]})
+
+    @idempotent
     def create(self, request, *args, **kwargs):
         """
-        Create a new transaction and publish initiated event
+        Create a new transaction and publish initiated event. With an
+        Idempotency-Key header a retry replays the original response.
         """
         try:
             # Generate transaction_id
@@ -70,22 +97,41 @@ class TransactionViewSet(viewsets.ModelViewSet):
                 logger.error(f"Serializer validation errors: {serializer.errors}")
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-            # Check balance for non-credit transactions
-            transaction_type = data.get('transaction_type')
-            if transaction_type not in [TransactionType.WALLET_LOAD.value, TransactionType.BANK_DEPOSIT.value]:
-                wallet_client = WalletServiceClient()
-                has_balance, error_message = wallet_client.check_balance(
-                    agent_id=request.user.agent_id,
-                    amount=serializer.validated_data['amount'],
-                    auth_token=request.headers.get('Authorization')
-                )
+            # Wallet loads and bank deposits debit the agent's float; reserve
+            # the amount now so the wallet consumer cannot find it spent by
+            # the time it applies the transaction. Bank withdrawals credit
+            # the float and need no funds.
+            transaction_type = serializer.validated_data['transaction_type']
+            wallet_client = WalletServiceClient()
+            reserved = False
+            if transaction_type in WALLET_DEBIT_TYPES:
+                amount = serializer.validated_data['amount']
+                try:
+                    if wallet_client.service_key:
+                        reserved, error_message = wallet_client.reserve(request.user.agent_id, amount, transaction_id)
+                        has_balance = reserved
+                    else:
+                        has_balance, error_message = wallet_client.check_balance(
+                            agent_id=request.user.agent_id,
+                            amount=amount,
+                            auth_token=request.headers.get('Authorization')
+                        )
+                except WalletUnavailable as e:
+                    # No answer about the balance; nothing is recorded so
+                    # the client can retry
+                    return Response(
+                        {"error": "Wallet service is unavailable", "detail": str(e)},
+                        status=status.HTTP_503_SERVICE_UNAVAILABLE
+                    )
                 
                 if not has_balance:
                     # Create failed transaction record
-                    transaction = serializer.save(
-                        status=TransactionStatus.FAILED,
-                        error_message=error_message
-                    )
+                    with db_transaction.atomic():
+                        transaction = serializer.save(
+                            status=TransactionStatus.FAILED,
+                            error_message=error_message
+                        )
+                        transaction_stats.record_change(transaction)
                     return Response(
                         {
                             "error": "Insufficient balance",
@@ -96,44 +142,18 @@ class TransactionViewSet(viewsets.ModelViewSet):
                     )
 
             try:
-                # Create transaction
-                transaction = serializer.save()
-                logger.info(f"Transaction created successfully: {transaction.transaction_id}")
-                
-                # Publish event
-                try:
-                    with RabbitMQClient() as mq_client:
-                        mq_client.publish(
-                            routing_key='transaction.initiated',
-                            message={
-                                'transaction_id': str(transaction.transaction_id),
-                                'transaction_type': transaction.transaction_type.name,
-                                'amount': str(transaction.amount),
-                                'agent_id': str(transaction.agent_id),
-                                'customer_identifier': transaction.customer_identifier,
-                                'provider': transaction.get_provider_display(),
-                                'status': TransactionStatus.INITIATED.name
-                            }
-                        )
-                        logger.info("Transaction initiated event published successfully")
-                except Exception as e:
-                    logger.error(f"Failed to publish transaction event: {str(e)}")
-                    # Don't fail the request if event publishing fails
-                    # We might want to implement a retry mechanism here
-
-                # Cache transaction
-                try:
-                    cache_key = f"transaction_{transaction.transaction_id}"
-                    cache.set(cache_key, transaction, timeout=3600)  # 1 hour
-                    logger.info(f"Transaction cached with key: {cache_key}")
-                except Exception as e:
-                    logger.error(f"Failed to cache transaction: {str(e)}")
-                    # Don't fail the request if caching fails
-
-                return Response(serializer.data, status=status.HTTP_201_CREATED)
-            
+                # Create transaction and its initiated event atomically; the
+                # outbox relay publishes the event so the request never waits
+                # on the broker
+                with db_transaction.atomic():
+                    transaction = serializer.save()
+                    enqueue_transaction_initiated(transaction)
+                    transaction_stats.record_change(transaction)
             except Exception as e:
+                # Rolled back, so nothing will ever capture the hold
                 logger.error(f"Failed to save transaction: {str(e)}")
+                if reserved:
+                    wallet_client.release(transaction_id)
                 return Response(
                     {
                         "error": "Failed to save transaction",
@@ -141,6 +161,12 @@ class TransactionViewSet(viewsets.ModelViewSet):
                     },
                     status=status.HTTP_500_INTERNAL_SERVER_ERROR
                 )
+            logger.info(f"Transaction created successfully: {transaction.transaction_id}")
+
+            # Cache the response body for retrieve
+            cache_transaction(transaction.agent_id, transaction.transaction_id, serializer.data)
+
+            return Response(serializer.data, status=status.HTTP_201_CREATED)
 
         except Exception as e:
             logger.error(f"Unexpected error in create transaction: {str(e)}")
@@ -152,18 +178,37 @@ class TransactionViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    def perform_update(self, serializer):
+        with db_transaction.atomic():
+            # The row as it is now, locked so a consumer cannot change its
+            # status between the delta and the save
+            serializer.instance = Transaction.objects.select_for_update().get(pk=serializer.instance.pk)
+            before = transaction_stats.contribution(serializer.instance)
+            transaction = serializer.save()
+            transaction_stats.record_change(transaction, before)
+            invalidate_transaction(transaction.agent_id, transaction.transaction_id)
+
+    def perform_destroy(self, instance):
+        with db_transaction.atomic():
+            instance = Transaction.objects.select_for_update().get(pk=instance.pk)
+            removed = Counter()
+            removed.subtract(transaction_stats.contribution(instance))
+            transaction_stats.apply_deltas({(instance.agent_id, instance.transaction_type.name): removed})
+            invalidate_transaction(instance.agent_id, instance.transaction_id)
+            instance.delete()
+
     def retrieve(self, request, *args, **kwargs):
         """
-        Get transaction details with cache support
+        Get transaction details with cache support. The cache holds the
+        encoded response body per agent, so a hit is returned as is.
         """
         transaction_id = kwargs.get('pk')
-        cache_key = f"transaction_{transaction_id}"
+        agent_id = request.user.agent_id
 
         # Try to get from cache first
-        transaction = cache.get(cache_key)
-        if transaction:
-            serializer = self.get_serializer(transaction)
-            return Response(serializer.data)
+        body = get_cached_transaction(agent_id, transaction_id)
+        if body is not None:
+            return HttpResponse(body, content_type='application/json')
 
         # If not in cache, get from database
         try:
@@ -171,9 +216,9 @@ class TransactionViewSet(viewsets.ModelViewSet):
             serializer = self.get_serializer(transaction)
             
             # Cache for future requests
-            cache.set(cache_key, transaction, timeout=3600)  # 1 hour
+            body = cache_transaction(agent_id, transaction_id, serializer.data)
             
-            return Response(serializer.data)
+            return HttpResponse(body, content_type='application/json')
         except Transaction.DoesNotExist:
             return Response(
                 {"error": "Transaction not found"},
@@ -183,29 +228,37 @@ class TransactionViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """
-        Get transaction statistics for the authenticated agent
+        Get transaction statistics for the authenticated agent.
+
+        Takes the list filters (status, type, provider), a from/to window
+        (ISO dates or datetimes) and bucket=hour|day for a volume series per
+        type and provider. Without status, provider or a window the figures
+        come from the precomputed per-type totals.
         """
         try:
-            queryset = self.get_queryset()
-            
-            # Calculate statistics
-            stats = {
-                'total_transactions': queryset.count(),
-                'total_amount': str(queryset.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')),
-                'successful_transactions': queryset.filter(status=TransactionStatus.SUCCESSFUL).count(),
-                'successful_amount': str(
-                    queryset.filter(status=TransactionStatus.SUCCESSFUL)
-                    .aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-                ),
-                'failed_transactions': queryset.filter(status=TransactionStatus.FAILED).count(),
-                'pending_transactions': queryset.filter(status=TransactionStatus.INITIATED).count(),
-                'total_commission_earned': str(
-                    queryset.filter(
-                        status=TransactionStatus.SUCCESSFUL,
-                        commission_status=True
-                    ).aggregate(total=Sum('commission_amount'))['total'] or Decimal('0.00')
-                )
-            }
+            window = transaction_stats.parse_window(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if window is None and not any(request.query_params.get(name) for name in ('status', 'provider')):
+            return self._precomputed_stats(request)
+
+        # Raises ValidationError, a 400, for unknown filter values
+        queryset = self.get_queryset().order_by()
+        try:
+            if window and window['start']:
+                queryset = queryset.filter(created_at__gte=window['start'])
+            if window and window['end']:
+                queryset = queryset.filter(created_at__lt=window['end'])
+
+            stats = transaction_stats.summarize(queryset)
+            if window and window['bucket']:
+                stats.update({
+                    'from': window['start'].isoformat(),
+                    'to': window['end'].isoformat(),
+                    'bucket': window['bucket'],
+                    'series': transaction_stats.volume_series(queryset, window['bucket'])
+                })
             
             return Response(stats)
         except Exception as e:
@@ -215,6 +268,35 @@ class TransactionViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    def _precomputed_stats(self, request):
+        rows = AgentTransactionStats.objects.filter(agent_id=request.user.agent_id)
+        transaction_type = request.query_params.get('type')
+        if transaction_type:
+            try:
+                rows = rows.filter(transaction_type=TransactionType[transaction_type])
+            except KeyError:
+                return Response(
+                    {"error": f"Invalid transaction type {transaction_type}"},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        totals = Counter()
+        for row in rows:
+            for column in transaction_stats.COLUMNS:
+                totals[column] += getattr(row, column)
+
+        return Response({
+            'total_transactions': totals['initiated_count'] + totals['successful_count'] + totals['failed_count'],
+            'total_amount': str(
+                totals['initiated_amount'] + totals['successful_amount'] + totals['failed_amount'] or Decimal('0.00')
+            ),
+            'successful_transactions': totals['successful_count'],
+            'successful_amount': str(totals['successful_amount'] or Decimal('0.00')),
+            'failed_transactions': totals['failed_count'],
+            'pending_transactions': totals['initiated_count'],
+            'total_commission_earned': str(totals['commission_earned'] or Decimal('0.00'))
+        })
+
     @action(detail=False, methods=['get'])
     def providers(self, request):
         """
@@ -249,4 +331,9 @@ class TransactionViewSet(viewsets.ModelViewSet):
         Get list of available transaction types
         """
         types = [{"id": t.value, "name": t.value} for t in TransactionType]
-        return Response(types) 
\ No newline at end of file
+        return Response(types) 
+
+
+def http_metrics(request):
+    """Inter-service HTTP client metrics in Prometheus text format"""
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4')
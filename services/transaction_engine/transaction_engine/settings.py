@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 from dotenv import load_dotenv
+from corsheaders.defaults import default_headers
 
 # Load environment variables
 load_dotenv()
@@ -84,6 +85,20 @@ CACHES = {
     }
 }
 
+# Seconds a transaction's serialized representation stays in the cache;
+# status changes invalidate it earlier
+TRANSACTION_CACHE_TTL = int(os.getenv('TRANSACTION_CACHE_TTL', 3600))
+
+# Seconds an invalidated transaction cannot be cached again, so a read
+# that loaded the row before the change committed cannot cache it back
+TRANSACTION_CACHE_INVALIDATED_TTL = int(os.getenv('TRANSACTION_CACHE_INVALIDATED_TTL', 30))
+
+# Seconds the response to an Idempotency-Key is kept for replay, and
+# seconds a request's claim on its key lasts before a retry may take it
+# over; the claim must cover a create's wallet call with its retries
+IDEMPOTENCY_KEY_TTL = int(os.getenv('IDEMPOTENCY_KEY_TTL', 86400))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv('IDEMPOTENCY_WAIT_TIMEOUT', 30))
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -117,6 +132,8 @@ CORS_ALLOW_ALL_ORIGINS = DEBUG  # Set to False in production
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",  # React frontend
 ]
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+CORS_EXPOSE_HEADERS = ['idempotent-replayed']
 
 # REST Framework settings
 REST_FRAMEWORK = {
@@ -139,12 +156,57 @@ RABBITMQ = {
     'VIRTUAL_HOST': '/'
 }
 
+# Windowed publisher confirms
+RABBITMQ_CONFIRM_WINDOW = int(os.getenv('RABBITMQ_CONFIRM_WINDOW', 1000))
+RABBITMQ_CONFIRM_TIMEOUT = float(os.getenv('RABBITMQ_CONFIRM_TIMEOUT', 30))
+RABBITMQ_PUBLISH_MAX_ATTEMPTS = int(os.getenv('RABBITMQ_PUBLISH_MAX_ATTEMPTS', 5))
+
 # Service URLs
 USER_MANAGEMENT_SERVICE_URL = os.getenv('USER_MANAGEMENT_SERVICE_URL')
 WALLET_SERVICE_URL = os.getenv('WALLET_SERVICE_URL')
 COMMISSION_SERVICE_URL = os.getenv('COMMISSION_SERVICE_URL')
 NOTIFICATION_SERVICE_URL = os.getenv('NOTIFICATION_SERVICE_URL')
 
+# Shared key for service-to-service endpoints, sent as X-Service-Key
+INTERNAL_SERVICE_KEY = os.getenv('INTERNAL_SERVICE_KEY')
+
+# Seconds a balance hold placed at transaction creation stays reserved in
+# the wallet service; must cover outbox relay and consumer lag
+WALLET_HOLD_TTL = int(os.getenv('WALLET_HOLD_TTL', 900))
+
+# sweep_transactions: seconds a transaction may stay INITIATED before its
+# initiated event is republished, how often it is republished, and seconds
+# after which it is failed instead
+TRANSACTION_SWEEP_AFTER = int(os.getenv('TRANSACTION_SWEEP_AFTER', 900))
+TRANSACTION_SWEEP_MAX_REPUBLISH = int(os.getenv('TRANSACTION_SWEEP_MAX_REPUBLISH', 3))
+TRANSACTION_SWEEP_FAIL_AFTER = int(os.getenv('TRANSACTION_SWEEP_FAIL_AFTER', 3600))
+
+# Inter-service HTTP calls (api.services.http): timeouts in seconds, retries
+# for idempotent requests, keep-alive pool size per service, and a circuit
+# breaker that opens after BREAKER_FAILURES consecutive failures for
+# BREAKER_RESET seconds
+INTER_SERVICE_HTTP = {
+    'CONNECT_TIMEOUT': float(os.getenv('HTTP_CONNECT_TIMEOUT', 2)),
+    'READ_TIMEOUT': float(os.getenv('HTTP_READ_TIMEOUT', 5)),
+    'RETRIES': int(os.getenv('HTTP_RETRIES', 2)),
+    'BACKOFF': float(os.getenv('HTTP_BACKOFF', 0.2)),
+    'POOL_SIZE': int(os.getenv('HTTP_POOL_SIZE', 20)),
+    'BREAKER_FAILURES': int(os.getenv('HTTP_BREAKER_FAILURES', 5)),
+    'BREAKER_RESET': float(os.getenv('HTTP_BREAKER_RESET', 30)),
+}
+
+# Local token verification. Must match SIMPLE_JWT's SIGNING_KEY in
+# user_management; when unset every request is validated over HTTP.
+JWT_SIGNING_KEY = os.getenv('JWT_SIGNING_KEY')
+JWT_ALGORITHM = os.getenv('JWT_ALGORITHM', 'HS256')
+
+# Profiles (role, agent_id) of authenticated users: an in-process LRU of
+# AUTH_PROFILE_CACHE_SIZE entries for AUTH_PROFILE_LOCAL_TTL seconds in
+# front of Redis for AUTH_PROFILE_CACHE_TTL seconds
+AUTH_PROFILE_CACHE_SIZE = int(os.getenv('AUTH_PROFILE_CACHE_SIZE', 10000))
+AUTH_PROFILE_LOCAL_TTL = float(os.getenv('AUTH_PROFILE_LOCAL_TTL', 30))
+AUTH_PROFILE_CACHE_TTL = int(os.getenv('AUTH_PROFILE_CACHE_TTL', 300))
+
 # Logging Configuration
 LOGGING = {
     'version': 1,
@@ -1,6 +1,7 @@
 import json
 import pika
 from django.conf import settings
+from django.db import transaction
 import logging
 
 logger = logging.getLogger(__name__)
@@ -71,4 +72,20 @@ class RabbitMQClient:
             logger.info(f"Published event: {routing_key} - {data}")
         except Exception as e:
             logger.error(f"Error publishing event: {str(e)}")
-            raise 
\ No newline at end of file
+            raise
+
+
+def publish_user_event(routing_key: str, data: dict) -> None:
+    """
+    Publish a user_events message once the current database transaction
+    commits. Failures are logged rather than raised, the change itself
+    already succeeded.
+    """
+    def publish():
+        try:
+            with RabbitMQClient() as client:
+                client.publish_event(routing_key=routing_key, data=data)
+        except Exception as e:
+            logger.error(f"Failed to publish {routing_key} event: {str(e)}")
+
+    transaction.on_commit(publish)
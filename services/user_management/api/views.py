@@ -19,6 +19,7 @@ from .serializers import (
     EmailVerificationSerializer, CustomTokenObtainPairSerializer
 )
 from .permissions import IsAdmin, IsOwnerOrAdmin
+from .mq.client import publish_user_event
 from rest_framework.permissions import AllowAny
 from rest_framework_simplejwt.views import TokenObtainPairView
 from rest_framework_simplejwt.tokens import RefreshToken
@@ -60,11 +61,21 @@ class UserViewSet(viewsets.ModelViewSet):
         logger.info(f"New user created: {user.email}")
         self.send_verification_email(user)
 
+    def perform_update(self, serializer):
+        user = serializer.save()
+        publish_user_event('user.updated', {'user_id': user.id})
+
+    def perform_destroy(self, instance):
+        user_id = instance.id
+        instance.delete()
+        publish_user_event('user.deleted', {'user_id': user_id})
+
     @action(detail=True, methods=['post'], permission_classes=[IsAdmin])
     def verify(self, request, pk=None):
         user = self.get_object()
         user.is_verified = True
         user.save()
+        publish_user_event('user.updated', {'user_id': user.id})
         logger.info(f"User verified by admin: {user.email}")
         return Response({'status': 'user verified'})
 
@@ -175,11 +186,29 @@ class AgentViewSet(viewsets.ModelViewSet):
         response_serializer = AgentSerializer(agent)
         return Response(response_serializer.data, status=status.HTTP_201_CREATED)
 
+    def perform_update(self, serializer):
+        agent = serializer.save()
+        self._publish_agent_updated(agent)
+
+    def perform_destroy(self, instance):
+        user_id, agent_id = instance.user_id, instance.agent_id
+        instance.delete()
+        publish_user_event('agent.updated', {'user_id': user_id, 'agent_id': agent_id, 'status': None})
+
+    @staticmethod
+    def _publish_agent_updated(agent):
+        publish_user_event('agent.updated', {
+            'user_id': agent.user_id,
+            'agent_id': agent.agent_id,
+            'status': agent.status
+        })
+
     @action(detail=True, methods=['post'], permission_classes=[IsAdmin])
     def activate(self, request, pk=None):
         agent = self.get_object()
         agent.status = 'ACTIVE'
         agent.save()
+        self._publish_agent_updated(agent)
         logger.info(f"Agent activated: {agent.agent_id}")
         return Response({'status': 'agent activated'})
 
@@ -188,6 +217,7 @@ class AgentViewSet(viewsets.ModelViewSet):
         agent = self.get_object()
         agent.status = 'SUSPENDED'
         agent.save()
+        self._publish_agent_updated(agent)
         logger.info(f"Agent suspended: {agent.agent_id}")
         return Response({'status': 'agent suspended'})
 
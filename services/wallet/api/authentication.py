@@ -1,19 +1,22 @@
+import hmac
 import logging
 import requests
 from django.conf import settings
 from rest_framework import authentication, exceptions
 from rest_framework.request import Request
+from .tokens import TokenError, authenticate_token
 
 logger = logging.getLogger(__name__)
 
 class UserManagementAuthentication(authentication.BaseAuthentication):
     """
-    Custom authentication class that validates JWT tokens with the User Management Service
+    Custom authentication class that validates JWT tokens issued by the User Management Service.
+    Tokens are verified locally and profiles come from a cache, see api.tokens.
     """
     
     def authenticate(self, request: Request):
         """
-        Authenticate the request by validating the JWT token with the User Management Service
+        Authenticate the request by validating the JWT token
         """
         # Get the Authorization header
         auth_header = request.META.get('HTTP_AUTHORIZATION')
@@ -27,44 +30,62 @@ class UserManagementAuthentication(authentication.BaseAuthentication):
                 raise exceptions.AuthenticationFailed('Invalid token header')
             
             token = auth_parts[1]
-            
-            # Validate token with User Management Service
-            response = requests.get(
-                f"{settings.USER_SERVICE_URL}/api/users/me/",
-                headers={'Authorization': f'Bearer {token}'}
-            )
-            
-            if response.status_code == 200:
-                user_data = response.json()
-                # Create a simple user object with required attributes
-                user = type('User', (), {
-                    'id': user_data['id'],
-                    'is_authenticated': True,
-                    'is_active': user_data.get('is_active', True),
-                    'is_staff': user_data.get('is_staff', False),
-                    'is_superuser': user_data.get('is_superuser', False),
-                })()
+            profile = authenticate_token(token)
+
+            # Create a simple user object with required attributes
+            user = type('User', (), {
+                'id': profile['id'],
+                'is_authenticated': True,
+                'is_active': profile.get('is_active', True),
+                'is_staff': profile.get('is_staff', False),
+                'is_superuser': profile.get('is_superuser', False),
+            })()
+
+            if not profile.get('agent_id'):
+                logger.error(f"Agent profile not found or missing agent_id for user {profile['id']}")
+                raise exceptions.AuthenticationFailed('Agent ID not found in user profile')
 
-                # Get agent_id from agent_profile
-                agent_profile = user_data.get('agent_profile', {})
-                if not agent_profile or not agent_profile.get('agent_id'):
-                    logger.error(f"Agent profile not found or missing agent_id. User data: {user_data}")
-                    raise exceptions.AuthenticationFailed('Agent ID not found in user profile')
+            # Create an auth object that includes agent_id
+            auth = type('Auth', (), {
+                'agent_id': profile['agent_id'],
+                'token': token
+            })()
 
-                # Create an auth object that includes agent_id
-                auth = type('Auth', (), {
-                    'agent_id': agent_profile['agent_id'],
-                    'token': token
-                })()
+            return (user, auth)
 
-                return (user, auth)
-            else:
-                logger.error(f"Token validation failed: {response.status_code} - {response.text}")
-                raise exceptions.AuthenticationFailed('Invalid token')
-                
+        except exceptions.AuthenticationFailed:
+            raise
+        except TokenError as e:
+            logger.info(f"Token validation failed: {str(e)}")
+            raise exceptions.AuthenticationFailed('Invalid token')
         except requests.RequestException as e:
             logger.error(f"Error validating token with User Management Service: {str(e)}")
             raise exceptions.AuthenticationFailed('Error validating token')
         except Exception as e:
             logger.error(f"Unexpected error in authentication: {str(e)}")
-            raise exceptions.AuthenticationFailed('Authentication failed') 
\ No newline at end of file
+            raise exceptions.AuthenticationFailed('Authentication failed')
+
+
+class InternalServiceAuthentication(authentication.BaseAuthentication):
+    """
+    Authenticates calls from other platform services by the shared
+    INTERNAL_SERVICE_KEY in the X-Service-Key header. No user is involved,
+    so no call to the User Management Service is made.
+    """
+
+    def authenticate(self, request: Request):
+        key = request.META.get('HTTP_X_SERVICE_KEY')
+        if not key:
+            return None
+        if not settings.INTERNAL_SERVICE_KEY or not hmac.compare_digest(key, settings.INTERNAL_SERVICE_KEY):
+            raise exceptions.AuthenticationFailed('Invalid service key')
+
+        service = type('Service', (), {
+            'id': None,
+            'is_authenticated': True,
+            'is_internal_service': True,
+        })()
+        return (service, None)
+
+    def authenticate_header(self, request: Request):
+        return 'X-Service-Key'
@@ -0,0 +1,192 @@
+import json
+import logging
+from typing import Iterable
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from .models import ProcessedEvent, Wallet, WalletLedgerEntry
+from .mq.publisher import EventPublisher
+
+logger = logging.getLogger(__name__)
+
+INBOX_CACHE_PREFIX = 'inbox:'
+
+# Consumers whose side effects must happen once per event; both apply at
+# most one balance change per transaction, so the event id is the
+# transaction_id
+TRANSACTION_INITIATED = 'wallet.transaction.initiated'
+COMMISSION_RECORDED = 'wallet.commission.recorded'
+
+_RECORD_SQL = """
+    INSERT INTO {table} (consumer, event_id, processed_at)
+    VALUES {rows}
+    ON CONFLICT (consumer, event_id) DO NOTHING
+    RETURNING event_id
+"""
+
+_STORE_RESULTS_SQL = """
+    UPDATE {table} AS processed
+    SET result = results.result::jsonb
+    FROM (VALUES {rows}) AS results (event_id, result)
+    WHERE processed.consumer = %s AND processed.event_id = results.event_id
+"""
+
+
+def inbox_cache_key(consumer: str, event_id) -> str:
+    return f"{INBOX_CACHE_PREFIX}{consumer}:{event_id}"
+
+
+def cached_results(consumer: str, event_ids: Iterable) -> dict:
+    """
+    The events the cache knows to be processed, as event_id -> the result
+    event stored for it, or None when its handling published none. A miss
+    is not conclusive; record() decides inside the transaction.
+    """
+    keys = {inbox_cache_key(consumer, event_id): event_id for event_id in event_ids}
+    if not keys:
+        return {}
+    try:
+        return {
+            keys[key]: _as_event(value.get('result') if isinstance(value, dict) else None)
+            for key, value in cache.get_many(list(keys)).items()
+        }
+    except Exception as e:
+        logger.warning(f"Inbox cache unavailable: {str(e)}")
+        return {}
+
+
+def stored_results(consumer: str, event_ids: Iterable) -> dict:
+    """Result events stored with already processed events, as event_id -> event or None"""
+    return {
+        event_id: _as_event(result)
+        for event_id, result in ProcessedEvent.objects.filter(
+            consumer=consumer, event_id__in=[str(event_id) for event_id in event_ids]
+        ).values_list('event_id', 'result')
+    }
+
+
+def store_results(consumer: str, results: dict) -> None:
+    """
+    Store the (exchange, routing_key, message) event each fresh event's
+    handling published with its inbox row, in one statement. Call in the
+    transaction that recorded them, so a redelivery can publish it again.
+    """
+    results = {str(event_id): event for event_id, event in results.items() if event is not None}
+    if not results:
+        return
+
+    params = []
+    for event_id, event in sorted(results.items()):
+        params.extend([event_id, json.dumps(list(event))])
+    params.append(consumer)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _STORE_RESULTS_SQL.format(
+                table=ProcessedEvent._meta.db_table,
+                rows=', '.join(['(%s, %s)'] * len(results))
+            ),
+            params
+        )
+
+    transaction.on_commit(lambda: _remember(consumer, results))
+
+
+def record(consumer: str, event_id) -> bool:
+    """
+    Record the event as processed; True the first time, False for a
+    redelivery. Call inside the atomic block that applies its side effects,
+    before applying them.
+    """
+    return str(event_id) in record_many(consumer, [event_id])
+
+
+def record_many(consumer: str, event_ids: Iterable) -> set:
+    """
+    Record events as processed in one statement and return the ids seen for
+    the first time. Ids are inserted in sorted order so concurrent callers
+    cannot deadlock; a concurrent caller inserting the same id waits for
+    this transaction and then finds it recorded. Once committed, all the ids
+    are cached so their redeliveries are turned away without a query.
+    """
+    event_ids = sorted({str(event_id) for event_id in event_ids})
+    if not event_ids:
+        return set()
+
+    params = []
+    for event_id in event_ids:
+        params.extend([consumer, event_id])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            _RECORD_SQL.format(
+                table=ProcessedEvent._meta.db_table,
+                rows=', '.join(['(%s, %s, now())'] * len(event_ids))
+            ),
+            params
+        )
+        fresh = {row[0] for row in cursor.fetchall()}
+
+    transaction.on_commit(lambda: _remember(consumer, dict.fromkeys(event_ids)))
+    return fresh
+
+
+def settle_initiated(transactions: dict, reason: str) -> dict:
+    """
+    Settle the transaction.initiated events of transactions the transaction
+    engine is giving up on; transactions maps transaction_id -> agent_id.
+    Returns transaction_id -> (applied, reason it was not).
+
+    A transaction not processed yet is recorded as failed with reason and
+    its hold released, in one database transaction, so a late delivery of
+    its event is replayed as transaction.failed instead of moving the
+    balance. One being processed is waited for by record_many(). One
+    already processed is applied unless its handling published
+    transaction.failed; events processed before results were stored are
+    looked up in the ledger.
+    """
+    transactions = {str(transaction_id): agent_id for transaction_id, agent_id in transactions.items()}
+    outcomes = {}
+    with transaction.atomic():
+        fresh = record_many(TRANSACTION_INITIATED, transactions)
+        Wallet.objects.release_holds(sorted(fresh))
+        store_results(TRANSACTION_INITIATED, {
+            transaction_id: EventPublisher.transaction_failed_event(transaction_id, transactions[transaction_id], reason)
+            for transaction_id in fresh
+        })
+        outcomes.update((transaction_id, (False, reason)) for transaction_id in fresh)
+
+        stored = stored_results(TRANSACTION_INITIATED, [
+            transaction_id for transaction_id in transactions if transaction_id not in fresh
+        ])
+        ledger = set(
+            WalletLedgerEntry.objects.filter(
+                transaction_id__in=[transaction_id for transaction_id, event in stored.items() if event is None],
+                source_event='transaction.initiated'
+            ).values_list('transaction_id', flat=True)
+        )
+        for transaction_id, event in stored.items():
+            if event is None:
+                applied = transaction_id in ledger
+                outcomes[transaction_id] = (applied, None if applied else reason)
+            else:
+                _, routing_key, message = event
+                failed = routing_key == 'transaction.failed'
+                outcomes[transaction_id] = (not failed, message.get('reason') if failed else None)
+    return outcomes
+
+
+def _as_event(result):
+    return tuple(result) if result else None
+
+
+def _remember(consumer: str, results: dict) -> None:
+    # Runs after the callback of record_many(), so stored results win
+    try:
+        cache.set_many(
+            {
+                inbox_cache_key(consumer, event_id): {'result': list(event) if event else None}
+                for event_id, event in results.items()
+            },
+            settings.INBOX_CACHE_TTL
+        )
+    except Exception as e:
+        logger.warning(f"Inbox cache unavailable: {str(e)}")
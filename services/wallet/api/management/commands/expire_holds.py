@@ -0,0 +1,51 @@
+import signal
+import logging
+import threading
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from api.models import Wallet
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Release balance holds that have passed their TTL'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._shutdown_event = threading.Event()
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Maximum holds expired per statement')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds to sleep when no hold has expired')
+        parser.add_argument('--once', action='store_true',
+                            help='Expire what is due once and exit')
+
+    def handle(self, *args, **options):
+        def signal_handler(signum, frame):
+            self.stdout.write(self.style.WARNING('\nStopping hold expiry...'))
+            self._shutdown_event.set()
+
+        signal.signal(signal.SIGINT, signal_handler)
+        signal.signal(signal.SIGTERM, signal_handler)
+
+        self.stdout.write(self.style.SUCCESS('Hold expiry started'))
+        total = 0
+        while not self._shutdown_event.is_set():
+            try:
+                close_old_connections()
+                expired = Wallet.objects.expire_holds(limit=options['batch_size'])
+            except Exception as e:
+                logger.error(f"Hold expiry batch failed: {str(e)}")
+                expired = 0
+
+            if expired:
+                total += expired
+                logger.info(f"Expired {expired} balance holds")
+            if expired < options['batch_size']:
+                if options['once']:
+                    break
+                self._shutdown_event.wait(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Hold expiry stopped, {total} holds expired'))
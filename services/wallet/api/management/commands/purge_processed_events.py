@@ -0,0 +1,33 @@
+import logging
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from api.models import ProcessedEvent
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Delete processed-event inbox rows older than the retention period'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.INBOX_RETENTION_DAYS,
+                            help='Keep rows processed within this many days')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Rows deleted per statement')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        purged = 0
+        while True:
+            ids = list(
+                ProcessedEvent.objects.filter(processed_at__lt=cutoff)
+                .values_list('id', flat=True)[:options['batch_size']]
+            )
+            if not ids:
+                break
+            deleted, _ = ProcessedEvent.objects.filter(id__in=ids).delete()
+            purged += deleted
+            logger.info(f"Purged {purged} processed events")
+
+        self.stdout.write(self.style.SUCCESS(f'Purged {purged} processed events'))
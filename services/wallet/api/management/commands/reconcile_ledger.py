@@ -0,0 +1,64 @@
+import logging
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Max, Sum
+from api.models import Wallet, WalletLedgerEntry
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Compare ledger sums with Wallet.balance for every wallet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Wallets compared per query')
+        parser.add_argument('--agent', action='append', dest='agents',
+                            help='Only reconcile this agent (repeatable)')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        wallets = Wallet.objects.order_by('id').values_list('id', 'agent_id', 'balance', 'ledger_sequence')
+        if options['agents']:
+            wallets = wallets.filter(agent_id__in=options['agents'])
+
+        checked = mismatched = 0
+        last_id = None
+        while True:
+            # Keyset pagination keeps each chunk an index range scan however
+            # far into the table we are
+            chunk = wallets.filter(id__gt=last_id) if last_id else wallets
+            # Wallets and ledger sums read from one snapshot, so a balance
+            # change committing between the two queries is not a mismatch
+            with transaction.atomic():
+                with connection.cursor() as cursor:
+                    cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY")
+                chunk = list(chunk[:chunk_size])
+                if not chunk:
+                    break
+                totals = {
+                    row['wallet_id']: row
+                    for row in WalletLedgerEntry.objects
+                    .filter(wallet_id__in=[wallet_id for wallet_id, _, _, _ in chunk])
+                    .values('wallet_id')
+                    .annotate(total=Sum(WalletLedgerEntry.signed_amount()), last_sequence=Max('sequence'))
+                    .order_by()
+                }
+            last_id = chunk[-1][0]
+
+            for wallet_id, agent_id, balance, ledger_sequence in chunk:
+                row = totals.get(wallet_id, {})
+                total = row.get('total') or Decimal('0.00')
+                last_sequence = row.get('last_sequence') or 0
+                if total != balance or last_sequence != ledger_sequence:
+                    mismatched += 1
+                    self.stdout.write(self.style.ERROR(
+                        f"Agent {agent_id}: balance={balance}, ledger={total}, "
+                        f"sequence={ledger_sequence}, last entry={last_sequence}"
+                    ))
+            checked += len(chunk)
+            logger.info(f"Reconciled {checked} wallets, {mismatched} mismatched")
+
+        if mismatched:
+            raise CommandError(f"{mismatched} of {checked} wallets do not match their ledger")
+        self.stdout.write(self.style.SUCCESS(f"All {checked} wallets match their ledger"))
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.9 on 2026-10-17 03:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletLedgerEntry',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('agent_id', models.CharField(max_length=50)),
+                ('transaction_id', models.CharField(blank=True, max_length=50, null=True)),
+                ('transaction_type', models.CharField(blank=True, max_length=50, null=True)),
+                ('entry_type', models.CharField(choices=[('CREDIT', 'Credit'), ('DEBIT', 'Debit')], max_length=10)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('balance_after', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='ledger_entries', to='api.wallet')),
+            ],
+            options={
+                'db_table': 'wallet_ledger_entries',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['agent_id', 'id'], name='ledger_agent_idx'), models.Index(fields=['transaction_id'], name='ledger_transaction_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,114 @@
+# Generated by Django 4.2.9 on 2026-10-17 03:16
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Number existing entries per wallet from 2 and give every wallet an
+# OPENING entry at sequence 1 for the balance it had before its first
+# ledger entry, so ledger sums reconcile with Wallet.balance
+BACKFILL_LEDGER_SQL = """
+SET CONSTRAINTS ALL IMMEDIATE;
+
+UPDATE wallet_ledger_entries e
+SET sequence = numbered.sequence + 1
+FROM (
+    SELECT id, row_number() OVER (PARTITION BY wallet_id ORDER BY id) AS sequence
+    FROM wallet_ledger_entries
+) numbered
+WHERE e.id = numbered.id;
+
+INSERT INTO wallet_ledger_entries
+    (wallet_id, agent_id, sequence, source_event, entry_type, amount, balance_after, created_at)
+SELECT w.id, w.agent_id, 1, 'migration', 'OPENING',
+       COALESCE(first_entry.opening, w.balance), COALESCE(first_entry.opening, w.balance), w.created_at
+FROM wallets w
+LEFT JOIN LATERAL (
+    SELECT e.balance_after - CASE WHEN e.entry_type = 'DEBIT' THEN -e.amount ELSE e.amount END AS opening
+    FROM wallet_ledger_entries e
+    WHERE e.wallet_id = w.id
+    ORDER BY e.sequence
+    LIMIT 1
+) first_entry ON true;
+
+UPDATE wallets w
+SET ledger_sequence = (SELECT max(sequence) FROM wallet_ledger_entries e WHERE e.wallet_id = w.id);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_walletledgerentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WalletBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('agent_id', models.CharField(max_length=50)),
+                ('sequence', models.BigIntegerField()),
+                ('balance', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('taken_at', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'wallet_balance_snapshots',
+                'ordering': ['agent_id', 'sequence'],
+            },
+        ),
+        migrations.AlterModelOptions(
+            name='walletledgerentry',
+            options={'ordering': ['agent_id', 'sequence']},
+        ),
+        migrations.RemoveIndex(
+            model_name='walletledgerentry',
+            name='ledger_agent_idx',
+        ),
+        migrations.AddField(
+            model_name='wallet',
+            name='ledger_sequence',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='walletledgerentry',
+            name='sequence',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='walletledgerentry',
+            name='source_event',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='walletledgerentry',
+            name='entry_type',
+            field=models.CharField(choices=[('OPENING', 'Opening balance'), ('CREDIT', 'Credit'), ('DEBIT', 'Debit')], max_length=10),
+        ),
+        migrations.RunSQL(
+            BACKFILL_LEDGER_SQL,
+            reverse_sql="DELETE FROM wallet_ledger_entries WHERE entry_type = 'OPENING';",
+        ),
+        migrations.AlterField(
+            model_name='walletledgerentry',
+            name='sequence',
+            field=models.BigIntegerField(),
+        ),
+        migrations.AddIndex(
+            model_name='walletledgerentry',
+            index=models.Index(fields=['agent_id', 'sequence'], name='ledger_agent_sequence_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='walletledgerentry',
+            constraint=models.UniqueConstraint(fields=('wallet', 'sequence'), name='ledger_wallet_sequence_uniq'),
+        ),
+        migrations.AddField(
+            model_name='walletbalancesnapshot',
+            name='wallet',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='snapshots', to='api.wallet'),
+        ),
+        migrations.AddIndex(
+            model_name='walletbalancesnapshot',
+            index=models.Index(fields=['agent_id', 'taken_at'], name='snapshot_agent_taken_idx'),
+        ),
+    ]
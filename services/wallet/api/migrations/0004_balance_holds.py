@@ -0,0 +1,55 @@
+# Generated by Django 4.2.9 on 2026-10-17 03:22
+
+from decimal import Decimal
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_ledger_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BalanceHold',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('agent_id', models.CharField(max_length=50)),
+                ('transaction_id', models.CharField(max_length=50, unique=True)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('status', models.CharField(choices=[('ACTIVE', 'Active'), ('CAPTURED', 'Captured'), ('RELEASED', 'Released'), ('EXPIRED', 'Expired')], default='ACTIVE', max_length=10)),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'db_table': 'balance_holds',
+                'ordering': ['-created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='wallet',
+            name='held_balance',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=15),
+        ),
+        migrations.AddConstraint(
+            model_name='wallet',
+            constraint=models.CheckConstraint(check=models.Q(('held_balance__gte', 0)), name='wallet_held_balance_non_negative'),
+        ),
+        migrations.AddField(
+            model_name='balancehold',
+            name='wallet',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='holds', to='api.wallet'),
+        ),
+        migrations.AddIndex(
+            model_name='balancehold',
+            index=models.Index(fields=['agent_id', 'status'], name='hold_agent_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='balancehold',
+            index=models.Index(condition=models.Q(('status', 'ACTIVE')), fields=['expires_at'], name='hold_active_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.9 on 2026-10-17 03:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_processed_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='processedevent',
+            name='result',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -1,8 +1,338 @@
+from django.conf import settings
 from django.db import models
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, Count, ExpressionWrapper, F, Sum, When
 import uuid
 from decimal import Decimal
+from typing import Optional
 import logging
 
+logger = logging.getLogger(__name__)
+
+
+class InsufficientBalance(ValueError):
+    """Raised when a debit would take a wallet below zero"""
+
+    def __init__(self, required: Decimal, available: Decimal):
+        self.required = required
+        self.available = available
+        super().__init__('Insufficient balance')
+
+
+class HoldConflict(ValueError):
+    """Raised when a transaction already has a hold that cannot be reused"""
+
+    def __init__(self, hold: 'BalanceHold'):
+        self.hold = hold
+        super().__init__(f"Transaction {hold.transaction_id} already has a {hold.status} hold")
+
+
+# One statement changes the balance, appends the ledger row and, every
+# WALLET_SNAPSHOT_EVERY entries, a balance snapshot. The wallet's row lock
+# is taken by the UPDATE and held until the caller's transaction commits,
+# so callers keep the work after it short. A debit also captures the
+# active hold placed for its transaction, if any, and may spend the funds
+# that hold reserved; other holds on the wallet are not available to it.
+_MUTATION_SQL = """
+    WITH captured AS (
+        UPDATE balance_holds
+        SET status = 'CAPTURED', updated_at = now()
+        WHERE transaction_id = %(hold_transaction_id)s AND agent_id = %(agent_id)s AND status = 'ACTIVE'
+        RETURNING amount
+    ), released AS (
+        SELECT COALESCE(sum(amount), 0) AS amount FROM captured
+    ), updated AS (
+        UPDATE wallets
+        SET balance = balance {operator} %(amount)s,
+            held_balance = held_balance - (SELECT amount FROM released),
+            ledger_sequence = ledger_sequence + 1,
+            updated_at = now()
+        WHERE agent_id = %(agent_id)s {condition}
+        RETURNING id, agent_id, balance, ledger_sequence
+    ), entry AS (
+        INSERT INTO wallet_ledger_entries
+            (wallet_id, agent_id, sequence, transaction_id, transaction_type, source_event,
+             entry_type, amount, balance_after, created_at)
+        SELECT id, agent_id, ledger_sequence, %(transaction_id)s, %(transaction_type)s, %(source_event)s,
+               '{entry_type}', %(amount)s, balance, now()
+        FROM updated
+        RETURNING wallet_id, agent_id, sequence, balance_after, created_at
+    ), snapshot AS (
+        INSERT INTO wallet_balance_snapshots (wallet_id, agent_id, sequence, balance, taken_at)
+        SELECT wallet_id, agent_id, sequence, balance_after, created_at
+        FROM entry
+        WHERE mod(sequence, %(snapshot_every)s) = 0
+    )
+    SELECT balance FROM updated
+"""
+
+_DEBIT_SQL = _MUTATION_SQL.format(
+    operator='-',
+    condition='AND balance - held_balance + (SELECT amount FROM released) >= %(amount)s',
+    entry_type='DEBIT'
+)
+# Charges such as commissions are owed whatever other transactions have
+# reserved, so only the balance itself bounds them
+_DEBIT_IGNORING_HOLDS_SQL = _MUTATION_SQL.format(
+    operator='-',
+    condition='AND balance >= %(amount)s',
+    entry_type='DEBIT'
+)
+_CREDIT_SQL = _MUTATION_SQL.format(operator='+', condition='', entry_type='CREDIT')
+
+# Reserve funds: raise the wallet's held_balance if enough is available and
+# record the hold, in one statement
+_PLACE_HOLD_SQL = """
+    WITH updated AS (
+        UPDATE wallets
+        SET held_balance = held_balance + %(amount)s, updated_at = now()
+        WHERE agent_id = %(agent_id)s AND balance - held_balance >= %(amount)s
+        RETURNING id, agent_id, balance - held_balance AS available
+    ), hold AS (
+        INSERT INTO balance_holds
+            (id, wallet_id, agent_id, transaction_id, amount, status, expires_at, created_at, updated_at)
+        SELECT %(id)s, id, agent_id, %(transaction_id)s, %(amount)s, 'ACTIVE',
+               now() + %(ttl)s * interval '1 second', now(), now()
+        FROM updated
+        RETURNING expires_at, created_at
+    )
+    SELECT updated.id, hold.expires_at, hold.created_at, updated.available FROM hold, updated
+"""
+
+# End active holds and give their amounts back to the wallets' available
+# balance; {selection} yields the ids of the holds to end
+_END_HOLDS_SQL = """
+    WITH ended AS (
+        UPDATE balance_holds
+        SET status = %(status)s, updated_at = now()
+        WHERE id IN ({selection}) AND status = 'ACTIVE'
+        RETURNING wallet_id, amount
+    ), totals AS (
+        SELECT wallet_id, sum(amount) AS amount FROM ended GROUP BY wallet_id
+    ), adjusted AS (
+        UPDATE wallets
+        SET held_balance = wallets.held_balance - totals.amount, updated_at = now()
+        FROM totals
+        WHERE wallets.id = totals.wallet_id
+    )
+    SELECT count(*) FROM ended
+"""
+
+_RELEASE_HOLD_SQL = _END_HOLDS_SQL.format(
+    selection='SELECT id FROM balance_holds WHERE transaction_id = %(transaction_id)s'
+)
+_RELEASE_HOLDS_SQL = _END_HOLDS_SQL.format(
+    selection='SELECT id FROM balance_holds WHERE transaction_id = ANY(%(transaction_ids)s)'
+)
+# Oldest expired holds first; SKIP LOCKED lets several sweepers run at once
+_EXPIRE_HOLDS_SQL = _END_HOLDS_SQL.format(selection="""
+    SELECT id FROM balance_holds
+    WHERE status = 'ACTIVE' AND expires_at <= now()
+    ORDER BY expires_at
+    LIMIT %(limit)s
+    FOR UPDATE SKIP LOCKED
+""")
+
+
+def snapshot_every() -> int:
+    return max(1, getattr(settings, 'WALLET_SNAPSHOT_EVERY', 100))
+
+
+class WalletManager(models.Manager):
+    """
+    Balance mutations as single conditional UPDATE ... RETURNING statements.
+    No SELECT ... FOR UPDATE is needed: the database applies the change
+    against the current row, so concurrent debits cannot overdraw.
+    """
+
+    def _mutate(self, sql: str, agent_id: str, amount: Decimal, transaction_id: str = None,
+                transaction_type: str = None, source_event: str = None, hold_transaction_id: str = None):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, {
+                'agent_id': agent_id,
+                'amount': amount,
+                'transaction_id': transaction_id,
+                'transaction_type': transaction_type,
+                'source_event': source_event,
+                'hold_transaction_id': hold_transaction_id,
+                'snapshot_every': snapshot_every(),
+            })
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def open(self, agent_id: str, balance: Decimal, source_event: str = None) -> 'Wallet':
+        """Create a wallet together with the ledger entry for its opening balance"""
+        with transaction.atomic():
+            wallet = self.create(agent_id=agent_id, balance=balance, ledger_sequence=1, is_active=True)
+            WalletLedgerEntry.objects.create(
+                wallet=wallet,
+                agent_id=agent_id,
+                sequence=1,
+                source_event=source_event,
+                entry_type=WalletLedgerEntry.EntryType.OPENING,
+                amount=balance,
+                balance_after=balance
+            )
+        return wallet
+
+    def _available(self, agent_id: str) -> Decimal:
+        """Available balance of the agent's wallet; raises Wallet.DoesNotExist"""
+        available = self.filter(agent_id=agent_id).values_list(
+            ExpressionWrapper(F('balance') - F('held_balance'), output_field=models.DecimalField(max_digits=15, decimal_places=2)),
+            flat=True
+        ).first()
+        if available is None:
+            raise self.model.DoesNotExist(f"No wallet for agent {agent_id}")
+        return available
+
+    def _balance(self, agent_id: str) -> Decimal:
+        """Balance of the agent's wallet; raises Wallet.DoesNotExist"""
+        balance = self.filter(agent_id=agent_id).values_list('balance', flat=True).first()
+        if balance is None:
+            raise self.model.DoesNotExist(f"No wallet for agent {agent_id}")
+        return balance
+
+    def debit(self, agent_id: str, amount: Decimal, transaction_id: str = None,
+              transaction_type: str = None, source_event: str = None,
+              hold_transaction_id: str = None, ignore_holds: bool = False) -> Decimal:
+        """
+        Subtract amount from the agent's wallet and return the new balance.
+        With hold_transaction_id the active hold placed for that transaction
+        is captured in the same statement. With ignore_holds the debit is
+        bounded by the balance alone and may spend funds held for other
+        transactions.
+        Raises InsufficientBalance or Wallet.DoesNotExist.
+        """
+        # The hold capture and the wallet update are separate sub-statements,
+        # so a refused debit must be rolled back to leave the hold active
+        with transaction.atomic():
+            balance = self._mutate(_DEBIT_IGNORING_HOLDS_SQL if ignore_holds else _DEBIT_SQL, agent_id, amount,
+                                   transaction_id, transaction_type, source_event, hold_transaction_id)
+            if balance is None:
+                # Nothing was updated; find out why
+                available = self._balance(agent_id) if ignore_holds else self._available(agent_id)
+                logger.debug("Insufficient balance for agent %s: required=%s, available=%s", agent_id, amount, available)
+                raise InsufficientBalance(amount, available)
+        logger.debug("Debited %s from agent %s, balance %s", amount, agent_id, balance)
+        return balance
+
+    def credit(self, agent_id: str, amount: Decimal, transaction_id: str = None,
+               transaction_type: str = None, source_event: str = None) -> Decimal:
+        """
+        Add amount to the agent's wallet and return the new balance.
+        Raises Wallet.DoesNotExist.
+        """
+        balance = self._mutate(_CREDIT_SQL, agent_id, amount, transaction_id, transaction_type, source_event)
+        if balance is None:
+            raise self.model.DoesNotExist(f"No wallet for agent {agent_id}")
+        logger.debug("Credited %s to agent %s, balance %s", amount, agent_id, balance)
+        return balance
+
+    def place_hold(self, agent_id: str, amount: Decimal, transaction_id: str, ttl: int) -> tuple:
+        """
+        Reserve amount on the agent's wallet for transaction_id for ttl
+        seconds and return (hold, available balance left). Placing a hold
+        for a transaction that already has one returns the existing hold if
+        it is still ACTIVE for the same agent and amount.
+        Raises InsufficientBalance, HoldConflict or Wallet.DoesNotExist.
+        """
+        existing = BalanceHold.objects.filter(transaction_id=transaction_id).first()
+        if existing is not None:
+            return self._reuse_hold(existing, agent_id, amount)
+
+        hold_id = uuid.uuid4()
+        try:
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.execute(_PLACE_HOLD_SQL, {
+                    'id': hold_id,
+                    'agent_id': agent_id,
+                    'transaction_id': transaction_id,
+                    'amount': amount,
+                    'ttl': ttl,
+                })
+                row = cursor.fetchone()
+        except IntegrityError:
+            # A concurrent request placed the hold for this transaction first
+            existing = BalanceHold.objects.get(transaction_id=transaction_id)
+            return self._reuse_hold(existing, agent_id, amount)
+
+        if row is None:
+            available = self._available(agent_id)
+            logger.debug("Cannot hold %s for agent %s: available=%s", amount, agent_id, available)
+            raise InsufficientBalance(amount, available)
+
+        wallet_id, expires_at, created_at, available = row
+        hold = BalanceHold(
+            id=hold_id,
+            wallet_id=wallet_id,
+            agent_id=agent_id,
+            transaction_id=transaction_id,
+            amount=amount,
+            status=BalanceHold.Status.ACTIVE,
+            expires_at=expires_at,
+            created_at=created_at,
+            updated_at=created_at
+        )
+        logger.debug("Held %s for transaction %s on agent %s, available %s", amount, transaction_id, agent_id, available)
+        return hold, available
+
+    def _reuse_hold(self, hold: 'BalanceHold', agent_id: str, amount: Decimal) -> tuple:
+        if hold.status != BalanceHold.Status.ACTIVE or hold.agent_id != str(agent_id) or hold.amount != amount:
+            raise HoldConflict(hold)
+        return hold, self._available(hold.agent_id)
+
+    def release_hold(self, transaction_id: str) -> bool:
+        """Release the active hold for transaction_id; False if there was none"""
+        with connection.cursor() as cursor:
+            cursor.execute(_RELEASE_HOLD_SQL, {
+                'status': BalanceHold.Status.RELEASED,
+                'transaction_id': transaction_id,
+            })
+            return cursor.fetchone()[0] > 0
+
+    def release_holds(self, transaction_ids: list) -> int:
+        """Release the active holds of several transactions in one statement and return how many"""
+        if not transaction_ids:
+            return 0
+        with connection.cursor() as cursor:
+            cursor.execute(_RELEASE_HOLDS_SQL, {
+                'status': BalanceHold.Status.RELEASED,
+                'transaction_ids': list(transaction_ids),
+            })
+            return cursor.fetchone()[0]
+
+    def expire_holds(self, limit: int = 500) -> int:
+        """Expire up to limit holds past their TTL and return how many"""
+        with connection.cursor() as cursor:
+            cursor.execute(_EXPIRE_HOLDS_SQL, {
+                'status': BalanceHold.Status.EXPIRED,
+                'limit': limit,
+            })
+            return cursor.fetchone()[0]
+
+    def balance_at(self, agent_id: str, timestamp) -> Optional[Decimal]:
+        """
+        Balance of the agent's wallet as of timestamp: the nearest snapshot
+        taken at or before it, plus the ledger entries between the two.
+        Returns None if the wallet did not exist yet.
+        """
+        snapshot = (
+            WalletBalanceSnapshot.objects
+            .filter(agent_id=agent_id, taken_at__lte=timestamp)
+            .order_by('-sequence')
+            .values('sequence', 'balance')
+            .first()
+        )
+        entries = WalletLedgerEntry.objects.filter(agent_id=agent_id, created_at__lte=timestamp)
+        if snapshot:
+            entries = entries.filter(sequence__gt=snapshot['sequence'])
+        totals = entries.aggregate(delta=Sum(WalletLedgerEntry.signed_amount()), count=Count('id'))
+        if not snapshot and not totals['count']:
+            return None
+        base = snapshot['balance'] if snapshot else Decimal('0.00')
+        return base + (totals['delta'] or Decimal('0.00'))
+
+
 class Wallet(models.Model):
     """
     Represents an agent's wallet for managing float balance.
@@ -11,35 +341,176 @@ class Wallet(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     agent_id = models.CharField(max_length=50, unique=True)
     balance = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
+    # Sum of the wallet's active holds, kept in step with balance_holds
+    held_balance = models.DecimalField(max_digits=15, decimal_places=2, default=Decimal('0.00'))
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    # Number of ledger entries written for this wallet
+    ledger_sequence = models.BigIntegerField(default=0)
+
+    objects = WalletManager()
 
     class Meta:
         db_table = 'wallets'
         ordering = ['-created_at']
+        constraints = [
+            models.CheckConstraint(check=models.Q(held_balance__gte=0), name='wallet_held_balance_non_negative'),
+        ]
 
     def __str__(self):
         return f"Wallet {self.id} - Agent {self.agent_id}"
 
-    def update_balance(self, amount: Decimal, is_credit: bool) -> None:
+    @property
+    def available_balance(self) -> Decimal:
+        """Balance not reserved by active holds"""
+        return self.balance - self.held_balance
+
+    def update_balance(self, amount: Decimal, is_credit: bool, transaction_id: str = None,
+                       transaction_type: str = None, source_event: str = None) -> None:
         """
         Update wallet balance
         :param amount: Amount to add or subtract
         :param is_credit: True for credit (add), False for debit (subtract)
         """
-        logger = logging.getLogger(__name__)
-        logger.info(f"Updating wallet {self.id} balance: Current={self.balance}, Amount={amount}, Operation={'credit' if is_credit else 'debit'}")
-        
         if is_credit:
-            self.balance += amount
-            logger.info(f"Credited amount {amount}. New balance: {self.balance}")
+            self.balance = Wallet.objects.credit(self.agent_id, amount, transaction_id, transaction_type, source_event)
         else:
-            if self.balance < amount:
-                logger.error(f"Insufficient balance: Required={amount}, Available={self.balance}")
-                raise ValueError('Insufficient balance')
-            self.balance -= amount
-            logger.info(f"Debited amount {amount}. New balance: {self.balance}")
-        
-        self.save()
-        logger.info(f"Wallet balance updated and saved successfully. Final balance: {self.balance}") 
\ No newline at end of file
+            self.balance = Wallet.objects.debit(self.agent_id, amount, transaction_id, transaction_type, source_event)
+
+
+class WalletLedgerEntry(models.Model):
+    """
+    Append-only record of every balance change, written in the same
+    statement as the change itself. Entries are numbered per wallet by
+    sequence and balance_after is the wallet balance once the entry was
+    applied. Each wallet starts with an OPENING entry for its initial balance.
+    """
+    class EntryType(models.TextChoices):
+        OPENING = 'OPENING', 'Opening balance'
+        CREDIT = 'CREDIT', 'Credit'
+        DEBIT = 'DEBIT', 'Debit'
+
+    id = models.BigAutoField(primary_key=True)
+    wallet = models.ForeignKey(Wallet, on_delete=models.PROTECT, related_name='ledger_entries')
+    agent_id = models.CharField(max_length=50)
+    sequence = models.BigIntegerField()
+    transaction_id = models.CharField(max_length=50, null=True, blank=True)
+    transaction_type = models.CharField(max_length=50, null=True, blank=True)
+    source_event = models.CharField(max_length=100, null=True, blank=True)
+    entry_type = models.CharField(max_length=10, choices=EntryType.choices)
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    balance_after = models.DecimalField(max_digits=15, decimal_places=2)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'wallet_ledger_entries'
+        ordering = ['agent_id', 'sequence']
+        constraints = [
+            models.UniqueConstraint(fields=['wallet', 'sequence'], name='ledger_wallet_sequence_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['agent_id', 'sequence'], name='ledger_agent_sequence_idx'),
+            models.Index(fields=['transaction_id'], name='ledger_transaction_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.entry_type} {self.amount} - Agent {self.agent_id}"
+
+    @property
+    def delta(self) -> Decimal:
+        return -self.amount if self.entry_type == self.EntryType.DEBIT else self.amount
+
+    @classmethod
+    def signed_amount(cls):
+        """Expression for delta, for use in aggregates"""
+        return Case(
+            When(entry_type=cls.EntryType.DEBIT, then=-F('amount')),
+            default=F('amount'),
+            output_field=models.DecimalField(max_digits=15, decimal_places=2)
+        )
+
+
+class WalletBalanceSnapshot(models.Model):
+    """
+    Wallet balance after every WALLET_SNAPSHOT_EVERY-th ledger entry, so
+    historical balances need only a short range scan of the ledger.
+    """
+    id = models.BigAutoField(primary_key=True)
+    wallet = models.ForeignKey(Wallet, on_delete=models.PROTECT, related_name='snapshots')
+    agent_id = models.CharField(max_length=50)
+    sequence = models.BigIntegerField()
+    balance = models.DecimalField(max_digits=15, decimal_places=2)
+    taken_at = models.DateTimeField()
+
+    class Meta:
+        db_table = 'wallet_balance_snapshots'
+        ordering = ['agent_id', 'sequence']
+        indexes = [
+            models.Index(fields=['agent_id', 'taken_at'], name='snapshot_agent_taken_idx'),
+        ]
+
+    def __str__(self):
+        return f"Snapshot {self.sequence} - Agent {self.agent_id}: {self.balance}"
+
+
+class BalanceHold(models.Model):
+    """
+    Funds reserved on a wallet for a transaction that has not been applied
+    yet. While ACTIVE the amount is counted in Wallet.held_balance and is
+    not available to other debits. The debit for the transaction captures
+    the hold; a release or the expiry sweep hands the amount back.
+    """
+    class Status(models.TextChoices):
+        ACTIVE = 'ACTIVE', 'Active'
+        CAPTURED = 'CAPTURED', 'Captured'
+        RELEASED = 'RELEASED', 'Released'
+        EXPIRED = 'EXPIRED', 'Expired'
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    wallet = models.ForeignKey(Wallet, on_delete=models.PROTECT, related_name='holds')
+    agent_id = models.CharField(max_length=50)
+    transaction_id = models.CharField(max_length=50, unique=True)
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.ACTIVE)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'balance_holds'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['agent_id', 'status'], name='hold_agent_status_idx'),
+            models.Index(fields=['expires_at'], name='hold_active_expiry_idx',
+                         condition=models.Q(status='ACTIVE')),
+        ]
+
+    def __str__(self):
+        return f"Hold {self.amount} for {self.transaction_id} - Agent {self.agent_id} ({self.status})"
+
+
+class ProcessedEvent(models.Model):
+    """
+    A message whose side effects were applied, recorded in the same
+    database transaction as them (see api.inbox), so a redelivery of it is
+    recognised and acknowledged without being applied again. result holds
+    the event its handling published, as [exchange, routing_key, message],
+    which a redelivery publishes again in case it was lost.
+    """
+    consumer = models.CharField(max_length=100)
+    event_id = models.CharField(max_length=100)
+    processed_at = models.DateTimeField(auto_now_add=True)
+    result = models.JSONField(null=True, blank=True)
+
+    class Meta:
+        db_table = 'processed_events'
+        constraints = [
+            models.UniqueConstraint(fields=['consumer', 'event_id'], name='processed_event_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['processed_at'], name='processed_event_at_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.consumer} - {self.event_id}"
@@ -0,0 +1,336 @@
+import json
+import logging
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from django.utils import timezone
+from ..models import BalanceHold, Wallet, WalletLedgerEntry, WalletBalanceSnapshot, snapshot_every
+from .publisher import EventPublisher
+from .. import inbox
+
+logger = logging.getLogger(__name__)
+
+BALANCE_EVENTS = ('transaction.initiated', 'commission.recorded')
+
+# Inbox consumer that deduplicates each balance event
+INBOX_CONSUMERS = {
+    'transaction.initiated': inbox.TRANSACTION_INITIATED,
+    'commission.recorded': inbox.COMMISSION_RECORDED,
+}
+
+
+class _Mutation:
+    """One balance change requested by a delivery"""
+    __slots__ = ('delivery_tag', 'event', 'transaction_id', 'agent_id', 'amount',
+                 'is_credit', 'transaction_type', 'provider', 'initiated_at', 'outcome', 'balance_after')
+
+    def __init__(self, delivery_tag, event, transaction_id, agent_id, amount, is_credit, transaction_type,
+                 provider=None, initiated_at=None):
+        self.delivery_tag = delivery_tag
+        self.event = event
+        self.transaction_id = transaction_id
+        self.agent_id = agent_id
+        self.amount = amount
+        self.is_credit = is_credit
+        self.transaction_type = transaction_type
+        self.provider = provider
+        self.initiated_at = initiated_at
+        self.outcome = None  # 'applied', 'insufficient', 'no_wallet' or 'duplicate'
+        self.balance_after = None
+
+
+class BatchBalanceHandler:
+    """
+    Applies a batch of transaction.initiated and commission.recorded events.
+
+    All wallets touched by the batch are locked with one SELECT ... FOR UPDATE
+    and each gets a single UPDATE with its net balance. Mutations are replayed
+    in delivery order against a running balance, so exactly the events that
+    would overdraw are turned down; a transaction debit may spend the hold
+    placed for it, which it captures, and one turned down releases that
+    hold. Applied mutations get their ledger rows in one bulk INSERT. Result
+    events go out in one broker round trip and the batch is acked with a
+    single multiple=True ack.
+
+    Redeliveries of events already applied are acked without being applied
+    again: the inbox cache turns most of them away before the transaction,
+    and the inbox rows written in it catch the rest. Either way the result
+    event stored with the inbox row is published again, in case the first
+    one was lost after the commit.
+    """
+
+    def __init__(self, fallback):
+        # Called as fallback(ch, method, properties, body, event) for
+        # deliveries that are not balance mutations or when a batch fails
+        self.fallback = fallback
+
+    def handle(self, ch, deliveries: list, event_type) -> None:
+        mutations = []
+        settled = set()
+
+        for method, properties, body in deliveries:
+            event = event_type(method, properties)
+            if event not in BALANCE_EVENTS:
+                self.fallback(ch, method, properties, body, event)
+                settled.add(method.delivery_tag)
+                continue
+
+            mutation = self._parse(method.delivery_tag, event, body)
+            if mutation is None:
+                ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+                settled.add(method.delivery_tag)
+            elif mutation.outcome == 'skip':
+                # Status other than INITIATED, acked with the batch
+                continue
+            else:
+                mutations.append(mutation)
+
+        processed = {
+            event: inbox.cached_results(
+                consumer, [mutation.transaction_id for mutation in mutations if mutation.event == event]
+            )
+            for event, consumer in INBOX_CONSUMERS.items()
+        }
+        replays = [result for cached in processed.values() for result in cached.values() if result is not None]
+        redelivered = len(mutations)
+        # Acked with the batch
+        mutations = [mutation for mutation in mutations if mutation.transaction_id not in processed[mutation.event]]
+        redelivered -= len(mutations)
+
+        try:
+            results = self._apply(mutations, replays)
+        except Exception as e:
+            logger.error(f"Batch of {len(mutations)} balance events failed, retrying one by one: {str(e)}")
+            for method, properties, body in deliveries:
+                if method.delivery_tag not in settled:
+                    self.fallback(ch, method, properties, body, event_type(method, properties))
+            return
+
+        # Settle individual rejections first; the multiple ack below then
+        # covers everything else that is still outstanding in this batch
+        for mutation in mutations:
+            if mutation.outcome == 'no_wallet':
+                ch.basic_reject(delivery_tag=mutation.delivery_tag, requeue=False)
+                settled.add(mutation.delivery_tag)
+
+        pending = [method.delivery_tag for method, _, _ in deliveries if method.delivery_tag not in settled]
+        if pending:
+            ch.basic_ack(delivery_tag=max(pending), multiple=True)
+        logger.info(
+            f"Applied batch: {results['applied']} applied, {results['insufficient']} insufficient, "
+            f"{results['no_wallet']} without wallet, {results['duplicate'] + redelivered} redelivered, "
+            f"{len(deliveries)} deliveries"
+        )
+
+    @staticmethod
+    def _parse(delivery_tag, event: str, body: bytes):
+        try:
+            data = json.loads(body)
+            transaction_id = data.get('transaction_id')
+            agent_id = data.get('agent_id')
+            if event == 'transaction.initiated':
+                amount = Decimal(str(data.get('amount', '0')))
+                status = data.get('status')
+                if not all([transaction_id, agent_id, amount, status]):
+                    logger.error(f"Missing required fields in transaction event: {data}")
+                    return None
+                if status in ('SUCCESSFUL', 'FAILED'):
+                    mutation = _Mutation(delivery_tag, event, transaction_id, agent_id, amount, False, None)
+                    mutation.outcome = 'skip'
+                    return mutation
+                if status != 'INITIATED':
+                    logger.warning(f"Unhandled transaction status: {status}")
+                    return None
+                transaction_type = data.get('transaction_type')
+                # Bank withdrawals credit the agent's float, everything else debits it
+                is_credit = transaction_type == 'BANK_WITHDRAWAL'
+                return _Mutation(
+                    delivery_tag, event, transaction_id, agent_id, amount, is_credit, transaction_type,
+                    data.get('provider_code'), data.get('initiated_at')
+                )
+
+            amount = Decimal(str(data.get('commission_amount', '0')))
+            if not all([transaction_id, agent_id, amount]):
+                logger.error(f"Missing required fields in commission.recorded event: {data}")
+                return None
+            return _Mutation(delivery_tag, event, transaction_id, agent_id, amount, False, data.get('transaction_type'))
+        except (ValueError, TypeError, InvalidOperation, AttributeError) as e:
+            logger.error(f"Undecodable balance event: {str(e)}")
+            return None
+
+    def _apply(self, mutations: list, replays: list) -> dict:
+        """Apply the mutations; replays are result events of redeliveries to publish again with the batch's"""
+        results = {'applied': 0, 'insufficient': 0, 'no_wallet': 0, 'duplicate': 0}
+        if not mutations:
+            EventPublisher.publish_batch(replays)
+            return results
+
+        events = list(replays)
+        with transaction.atomic():
+            # Inbox rows first: only the first delivery of each event, in
+            # this batch or any earlier one, is applied
+            for event, consumer in INBOX_CONSUMERS.items():
+                ids = [mutation.transaction_id for mutation in mutations if mutation.event == event]
+                fresh = inbox.record_many(consumer, ids)
+                duplicates = []
+                for mutation in mutations:
+                    if mutation.event != event:
+                        continue
+                    if str(mutation.transaction_id) in fresh:
+                        fresh.discard(str(mutation.transaction_id))
+                    else:
+                        mutation.outcome = 'duplicate'
+                        results['duplicate'] += 1
+                        duplicates.append(mutation.transaction_id)
+                if duplicates:
+                    events.extend(
+                        result for result in inbox.stored_results(consumer, duplicates).values() if result is not None
+                    )
+            mutations = [mutation for mutation in mutations if mutation.outcome is None]
+            if not mutations:
+                EventPublisher.publish_batch(events)
+                return results
+            agent_ids = sorted({mutation.agent_id for mutation in mutations})
+
+            # Holds before wallets, the order the single-message path locks
+            # them in; both in a stable order so concurrent batches cannot
+            # deadlock
+            holds = {
+                hold.transaction_id: hold
+                for hold in BalanceHold.objects.select_for_update().filter(
+                    transaction_id__in=[
+                        mutation.transaction_id for mutation in mutations
+                        if mutation.event == 'transaction.initiated' and not mutation.is_credit
+                    ],
+                    status=BalanceHold.Status.ACTIVE
+                ).order_by('transaction_id')
+            }
+            wallets = {
+                wallet.agent_id: wallet
+                for wallet in Wallet.objects.select_for_update().filter(agent_id__in=agent_ids).order_by('agent_id')
+            }
+            balances = {agent_id: wallet.balance for agent_id, wallet in wallets.items()}
+            held = {agent_id: wallet.held_balance for agent_id, wallet in wallets.items()}
+            captured, released = [], []
+            stored = {consumer: {} for consumer in INBOX_CONSUMERS.values()}
+
+            for mutation in mutations:
+                balance = balances.get(mutation.agent_id)
+                available = None
+                if balance is None:
+                    logger.error(f"No wallet found for agent {mutation.agent_id}")
+                    mutation.outcome = 'no_wallet'
+                elif mutation.is_credit:
+                    mutation.balance_after = balances[mutation.agent_id] = balance + mutation.amount
+                    mutation.outcome = 'applied'
+                else:
+                    hold = holds.get(mutation.transaction_id) if mutation.event == 'transaction.initiated' else None
+                    if hold is not None and hold.agent_id != mutation.agent_id:
+                        hold = None
+                    reserved = hold.amount if hold is not None else 0
+                    # Commissions are bounded by the balance alone, as on the
+                    # single-message path
+                    if mutation.event == 'commission.recorded':
+                        available = balance
+                    else:
+                        available = balance - held[mutation.agent_id] + reserved
+                    if available >= mutation.amount:
+                        mutation.balance_after = balances[mutation.agent_id] = balance - mutation.amount
+                        mutation.outcome = 'applied'
+                        if hold is not None:
+                            held[mutation.agent_id] -= reserved
+                            captured.append(holds.pop(mutation.transaction_id).pk)
+                    else:
+                        mutation.outcome = 'insufficient'
+                        # The transaction fails, so its hold has nothing left to reserve
+                        if hold is not None:
+                            held[mutation.agent_id] -= reserved
+                            released.append(holds.pop(mutation.transaction_id).pk)
+                results[mutation.outcome] += 1
+                event = self._result_event(mutation, available)
+                if event:
+                    events.append(event)
+                    stored[INBOX_CONSUMERS[mutation.event]][mutation.transaction_id] = event
+
+            now = timezone.now()
+            sequences = {agent_id: wallet.ledger_sequence for agent_id, wallet in wallets.items()}
+            entries = []
+            for mutation in mutations:
+                if mutation.outcome != 'applied':
+                    continue
+                sequences[mutation.agent_id] += 1
+                entries.append(WalletLedgerEntry(
+                    wallet=wallets[mutation.agent_id],
+                    agent_id=mutation.agent_id,
+                    sequence=sequences[mutation.agent_id],
+                    transaction_id=mutation.transaction_id,
+                    transaction_type=mutation.transaction_type,
+                    source_event=mutation.event,
+                    entry_type=WalletLedgerEntry.EntryType.CREDIT if mutation.is_credit else WalletLedgerEntry.EntryType.DEBIT,
+                    amount=mutation.amount,
+                    balance_after=mutation.balance_after
+                ))
+
+            for agent_id, balance in balances.items():
+                wallet = wallets[agent_id]
+                if sequences[agent_id] != wallet.ledger_sequence or held[agent_id] != wallet.held_balance:
+                    Wallet.objects.filter(pk=wallet.pk).update(
+                        balance=balance,
+                        held_balance=held[agent_id],
+                        ledger_sequence=sequences[agent_id],
+                        updated_at=now
+                    )
+            if captured:
+                BalanceHold.objects.filter(pk__in=captured).update(status=BalanceHold.Status.CAPTURED, updated_at=now)
+            if released:
+                BalanceHold.objects.filter(pk__in=released).update(status=BalanceHold.Status.RELEASED, updated_at=now)
+            WalletLedgerEntry.objects.bulk_create(entries)
+            every = snapshot_every()
+            WalletBalanceSnapshot.objects.bulk_create([
+                WalletBalanceSnapshot(
+                    wallet=entry.wallet,
+                    agent_id=entry.agent_id,
+                    sequence=entry.sequence,
+                    balance=entry.balance_after,
+                    taken_at=now
+                )
+                for entry in entries if entry.sequence % every == 0
+            ])
+
+            for consumer, consumer_results in stored.items():
+                inbox.store_results(consumer, consumer_results)
+
+            # Publish before commit, as the single-message path does, so a
+            # broker failure rolls the batch back instead of losing events
+            EventPublisher.publish_batch(events)
+
+        return results
+
+    @staticmethod
+    def _result_event(mutation: _Mutation, available):
+        if mutation.event == 'transaction.initiated':
+            if mutation.outcome == 'applied':
+                builder = EventPublisher.wallet_credited_event if mutation.is_credit else EventPublisher.wallet_debited_event
+                return builder(
+                    transaction_id=mutation.transaction_id,
+                    agent_id=mutation.agent_id,
+                    amount=str(mutation.amount),
+                    transaction_type=mutation.transaction_type,
+                    provider=mutation.provider,
+                    initiated_at=mutation.initiated_at
+                )
+            if mutation.outcome == 'insufficient':
+                return EventPublisher.transaction_failed_event(
+                    transaction_id=mutation.transaction_id,
+                    agent_id=mutation.agent_id,
+                    reason=f"Insufficient balance. Required: {mutation.amount}, Available: {available}"
+                )
+            return None
+
+        if mutation.outcome in ('applied', 'insufficient'):
+            # A commission that cannot be collected still completes the transaction
+            return EventPublisher.transaction_completed_event(
+                transaction_id=mutation.transaction_id,
+                commission_amount=str(mutation.amount),
+                commission_status=mutation.outcome == 'applied'
+            )
+        return None
@@ -1,114 +1,366 @@
 import os
-import django
+import json
+import time
 import logging
-from .client import RabbitMQClient
-from .handlers import EventHandler
+import threading
+import functools
+import multiprocessing
+from types import SimpleNamespace
+from concurrent.futures import ProcessPoolExecutor
+import django
 
 # Set up Django environment
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wallet.settings')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wallet_service.settings')
 django.setup()
 
+from .client import RabbitMQClient
+from .handlers import EventHandler
+from .batch import BatchBalanceHandler
+from .pool import close_publisher_pool
+from .sharding import EVENT_HEADER, ShardRouter, shard_for
+
 logger = logging.getLogger(__name__)
 
-class EventConsumer:
+HANDLERS = {
+    'agent.created': EventHandler.handle_agent_created,
+    'transaction.initiated': EventHandler.handle_transaction_event,
+    'commission.recorded': EventHandler.handle_commission_recorded,
+    'user.updated': EventHandler.handle_profile_changed,
+    'user.deleted': EventHandler.handle_profile_changed,
+    'agent.updated': EventHandler.handle_profile_changed,
+}
+
+
+def event_type(method, properties) -> str:
+    """Original routing key of a delivery; shard queues carry it in a header"""
+    headers = getattr(properties, 'headers', None) or {}
+    return headers.get(EVENT_HEADER, method.routing_key)
+
+
+def dispatch(ch, method, properties, body, event: str = None):
+    """Route a delivery to the handler for its event type"""
+    event = event or event_type(method, properties)
+    handler = HANDLERS.get(event)
+    if handler is None:
+        logger.warning(f"No handler for routing key: {event}")
+        ch.basic_ack(delivery_tag=method.delivery_tag)
+        return
+    handler(ch, method, properties, body)
+
+
+class RecordingChannel:
+    """
+    Stands in for the AMQP channel inside a worker process.
+    Records the handler's ack decision so the consumer thread that owns the
+    real channel can apply it.
+    """
+
     def __init__(self):
-        logger.info("Initializing wallet service consumer")
+        self.outcome = None
+
+    def basic_ack(self, delivery_tag, multiple=False):
+        self.outcome = ('ack', False)
+
+    def basic_nack(self, delivery_tag, multiple=False, requeue=True):
+        self.outcome = ('nack', requeue)
+
+    def basic_reject(self, delivery_tag, requeue=True):
+        self.outcome = ('nack', requeue)
+
+
+def _init_worker_process():
+    django.setup()
+
+
+def _dispatch_in_process(routing_key: str, body: bytes):
+    """Run a handler in a partition worker process and return its outcome"""
+    channel = RecordingChannel()
+    method = SimpleNamespace(routing_key=routing_key, delivery_tag=None)
+    try:
+        dispatch(channel, method, None, body, event=routing_key)
+    except Exception as e:
+        logger.error(f"Error processing message on {routing_key}: {str(e)}")
+        channel.outcome = ('nack', False)
+    return channel.outcome or ('nack', False)
+
+
+class EventConsumer:
+    """
+    Consumes one queue on its own connection with a configurable prefetch.
+
+    When partition pools are given, deliveries are fanned out to single-process
+    executors keyed by agent_id, so one agent's events are handled in order
+    while different agents run in parallel. Acks are applied back on this
+    consumer's connection thread. A consumer with role 'router' forwards
+    every delivery to its agent's shard queue instead of handling it.
+
+    With a `batch_size` above one (and no partitions), deliveries are pulled
+    until the batch is full or `batch_window_ms` passes without filling it,
+    and balance events in the batch are applied together.
+    """
+
+    def __init__(self, queue_name: str, config: dict, partitions=None):
+        logger.info(f"Initializing wallet service consumer for {queue_name}")
+        self.queue_name = queue_name
+        self.config = config
+        self.partitions = partitions
+        self.router = ShardRouter(config['shard_count']) if config.get('role') == 'router' else None
+        self.batch_size = config.get('batch_size', 0)
+        self.batch = (
+            BatchBalanceHandler(self._dispatch_one)
+            if self.batch_size > 1 and not self.router and not partitions else None
+        )
         self.client = None
-        self.handler = EventHandler()
-        self.setup_queues()
+        self._in_flight = 0  # partition deliveries awaiting their ack, connection thread only
+        self._stop_requested = threading.Event()
 
     def setup_queues(self):
-        """Declare queues and set up bindings"""
+        """Declare the queue, bind it and register the consumer"""
         try:
-            # Initialize RabbitMQ client
             self.client = RabbitMQClient()
-            self.client.connect()  # Ensure connection is established
-            
-            # Declare exchanges
-            exchanges = {
-                'user_events': ['agent.created'],
-                'transaction_events': ['transaction.initiated'],
-                'commission_events': ['commission.recorded']
-            }
-            
-            for exchange, routing_keys in exchanges.items():
-                self.client.channel.exchange_declare(
+            self.client.connect()
+
+            exchange = self.config['exchange']
+            self.client.channel.exchange_declare(
+                exchange=exchange,
+                exchange_type=self.config.get('exchange_type', 'topic'),
+                durable=True
+            )
+            if self.router:
+                self.router.declare_shards(self.client.channel)
+            self.client.channel.queue_declare(
+                queue=self.queue_name,
+                durable=True,
+                arguments=self.config.get('queue_arguments')
+            )
+            for routing_key in self.config['routing_keys']:
+                self.client.channel.queue_bind(
                     exchange=exchange,
-                    exchange_type='topic',
-                    durable=True
+                    queue=self.queue_name,
+                    routing_key=routing_key
+                )
+
+            prefetch = self.config.get('prefetch', 1)
+            if self.batch:
+                # A batch can only fill up if the broker sends that many unacked
+                prefetch = max(prefetch, self.batch_size)
+            self.client.channel.basic_qos(prefetch_count=prefetch)
+            if not self.batch:
+                self.client.channel.basic_consume(
+                    queue=self.queue_name,
+                    on_message_callback=self._on_message,
+                    auto_ack=False
                 )
-            
-            # Declare queues and bind them
-            for exchange, routing_keys in exchanges.items():
-                for key in routing_keys:
-                    queue_name = key
-                    self.client.channel.queue_declare(queue=queue_name, durable=True)
-                    self.client.channel.queue_bind(
-                        exchange=exchange,
-                        queue=queue_name,
-                        routing_key=key
-                    )
-                    
-                    # Set up consumer for this queue
-                    self.client.channel.basic_consume(
-                        queue=queue_name,
-                        on_message_callback=self._create_callback(key),
-                        auto_ack=False
-                    )
-            
-            # Set prefetch count to ensure fair dispatch
-            self.client.channel.basic_qos(prefetch_count=1)
-            
-            logger.info("Successfully set up exchanges and queues")
-            
+            logger.info(f"Consuming {self.queue_name} with prefetch {prefetch}")
+
         except Exception as e:
-            logger.error(f"Failed to set up queues: {str(e)}")
+            logger.error(f"Failed to set up queue {self.queue_name}: {str(e)}")
             if self.client:
                 self.client.close()
             raise
 
-    def _create_callback(self, routing_key):
-        """Create a callback function for a specific routing key"""
-        def callback(ch, method, properties, body):
-            try:
-                if routing_key == 'agent.created':
-                    self.handler.handle_agent_created(ch, method, properties, body)
-                elif routing_key == 'transaction.initiated':
-                    self.handler.handle_transaction_event(ch, method, properties, body)
-                elif routing_key == 'commission.recorded':
-                    self.handler.handle_commission_recorded(ch, method, properties, body)
-                else:
-                    logger.warning(f"No handler for routing key: {routing_key}")
-                    ch.basic_ack(delivery_tag=method.delivery_tag)
-            except Exception as e:
-                logger.error(f"Error processing message on {routing_key}: {str(e)}")
-                ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
-        return callback
+    def _on_message(self, ch, method, properties, body):
+        if self.router:
+            self.router.route(ch, method, properties, body)
+            return
+
+        if not self.partitions:
+            self._dispatch_one(ch, method, properties, body)
+            return
+
+        try:
+            agent_id = json.loads(body).get('agent_id')
+        except (ValueError, AttributeError):
+            logger.error(f"Undecodable message on {self.queue_name}")
+            ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+            return
+
+        executor = self.partitions[shard_for(agent_id, len(self.partitions))]
+        future = executor.submit(_dispatch_in_process, event_type(method, properties), body)
+        self._in_flight += 1
+        connection = self.client.connection
+        future.add_done_callback(
+            lambda f: connection.add_callback_threadsafe(
+                functools.partial(self._settle, ch, method.delivery_tag, f)
+            )
+        )
+
+    @staticmethod
+    def _dispatch_one(ch, method, properties, body, event: str = None):
+        try:
+            dispatch(ch, method, properties, body, event)
+        except Exception as e:
+            logger.error(f"Error processing message on {method.routing_key}: {str(e)}")
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=False)
+
+    def _consume_batches(self):
+        """Collect deliveries into batches until stop() is requested"""
+        channel = self.client.channel
+        window = self.config.get('batch_window_ms', 50) / 1000
+        batch = []
+        deadline = None
+        for method, properties, body in channel.consume(self.queue_name, inactivity_timeout=window):
+            if method is not None:
+                batch.append((method, properties, body))
+                if deadline is None:
+                    deadline = time.monotonic() + window
+            if batch and (method is None or len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                try:
+                    self.batch.handle(channel, batch, event_type)
+                except Exception as e:
+                    logger.error(f"Error processing batch on {self.queue_name}: {str(e)}")
+                    channel.basic_nack(delivery_tag=batch[-1][0].delivery_tag, multiple=True, requeue=True)
+                batch, deadline = [], None
+            if self._stop_requested.is_set() and not batch:
+                break
+        # Anything prefetched but not yet handled goes back to the queue
+        channel.cancel()
+
+    def _settle(self, ch, delivery_tag, future):
+        self._in_flight -= 1
+        try:
+            action, requeue = future.result()
+        except Exception as e:
+            logger.error(f"Partition worker failed: {str(e)}")
+            action, requeue = 'nack', False
+        if not ch.is_open:
+            # The broker redelivers unacked messages once the channel is gone
+            return
+        if action == 'ack':
+            ch.basic_ack(delivery_tag=delivery_tag)
+        else:
+            ch.basic_nack(delivery_tag=delivery_tag, requeue=requeue)
 
     def start(self):
         """Start consuming messages"""
         try:
-            logger.info("Wallet service consumer started")
-            self.client.channel.start_consuming()
-        except KeyboardInterrupt:
-            self.stop()
+            self.setup_queues()
+            logger.info(f"Wallet service consumer started for {self.queue_name}")
+            if self.batch:
+                self._consume_batches()
+            else:
+                self.client.channel.start_consuming()
         except Exception as e:
-            logger.error(f"Error in consumer: {str(e)}")
-            self.stop()
+            logger.error(f"Error in consumer for {self.queue_name}: {str(e)}")
+            self.close()
             raise
 
     def stop(self):
-        """Stop consuming messages and close connections"""
+        """Ask the consumer to stop; safe to call from any thread"""
+        self._stop_requested.set()
+        if self.batch:
+            # The batch loop checks the flag at least once per batch window
+            return
+        try:
+            if self.client and self.client.connection and self.client.connection.is_open:
+                self.client.connection.add_callback_threadsafe(self.client.channel.stop_consuming)
+        except Exception as e:
+            logger.error(f"Error stopping consumer for {self.queue_name}: {str(e)}")
+
+    def drain(self, timeout: float):
+        """Wait for partition work to finish and its acks to be sent, then close"""
+        deadline = timeout
+        while self._in_flight and deadline > 0 and self.client.connection.is_open:
+            self.client.connection.process_data_events(time_limit=0.1)
+            deadline -= 0.1
+        if self._in_flight:
+            logger.warning(f"{self._in_flight} deliveries on {self.queue_name} left unacked, the broker will redeliver them")
+        self.close()
+
+    def close(self):
         try:
-            if self.client and self.client.channel:
-                self.client.channel.stop_consuming()
             if self.client:
                 self.client.close()
-            logger.info("Consumer stopped")
+            logger.info(f"Consumer for {self.queue_name} stopped")
         except Exception as e:
-            logger.error(f"Error stopping consumer: {str(e)}")
-            raise
+            logger.error(f"Error closing consumer for {self.queue_name}: {str(e)}")
+
+
+class ConsumerRuntime:
+    """
+    Runs the configured consumers: `workers` threads per queue, each with its
+    own connection and prefetch, plus optional `processes` partition workers
+    keyed by agent_id. A queue with partition workers is fed by a single
+    consumer so that per-agent order survives the fan-out.
+    """
+
+    RESTART_DELAY = 5  # seconds
+
+    def __init__(self, consumers: dict, drain_timeout: float = 30):
+        self.consumers_config = consumers
+        self.drain_timeout = drain_timeout
+        self.consumers = []
+        self.threads = []
+        self.executors = []
+        self._stopping = threading.Event()
+
+    def start(self):
+        for queue_name, config in self.consumers_config.items():
+            partitions = None
+            workers = config.get('workers', 1)
+            if config.get('processes'):
+                context = multiprocessing.get_context('spawn')
+                partitions = [
+                    ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_init_worker_process)
+                    for _ in range(config['processes'])
+                ]
+                self.executors.extend(partitions)
+                workers = 1
+
+            for i in range(workers):
+                consumer = EventConsumer(queue_name, config, partitions)
+                thread = threading.Thread(
+                    target=self._run_consumer,
+                    args=(consumer,),
+                    name=f"Consumer-{queue_name}-{i + 1}",
+                    daemon=True
+                )
+                self.consumers.append(consumer)
+                self.threads.append(thread)
+                thread.start()
+            logger.info(
+                f"Started {workers} consumer(s) for {queue_name} "
+                f"(prefetch={config.get('prefetch', 1)}, processes={config.get('processes', 0)})"
+            )
+
+    def _run_consumer(self, consumer: EventConsumer):
+        while not self._stopping.is_set():
+            try:
+                consumer.start()
+            except Exception as e:
+                if self._stopping.is_set():
+                    break
+                logger.error(f"Consumer for {consumer.queue_name} failed, restarting in {self.RESTART_DELAY}s: {str(e)}")
+                self._stopping.wait(self.RESTART_DELAY)
+                continue
+            # start_consuming returned because stop() was requested
+            consumer.drain(self.drain_timeout)
+            break
+
+    def stop(self):
+        """Stop consuming, let in-flight work finish and close everything"""
+        self._stopping.set()
+        for consumer in self.consumers:
+            consumer.stop()
+        for thread in self.threads:
+            thread.join(timeout=self.drain_timeout)
+            if thread.is_alive():
+                logger.warning(f"Consumer thread {thread.name} did not drain in time")
+        for executor in self.executors:
+            executor.shutdown(wait=True, cancel_futures=True)
+        close_publisher_pool()
+        logger.info("Consumer runtime stopped")
+
 
 if __name__ == '__main__':
-    consumer = EventConsumer()
-    consumer.start() 
\ No newline at end of file
+    from django.conf import settings
+    from .sharding import build_consumer_config
+    runtime = ConsumerRuntime(
+        build_consumer_config(settings.WALLET_CONSUMERS, settings.WALLET_SHARD_COUNT, settings.WALLET_SHARD_CONSUMER),
+        settings.WALLET_CONSUMER_DRAIN_TIMEOUT
+    )
+    runtime.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        runtime.stop()
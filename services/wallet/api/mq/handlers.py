@@ -2,8 +2,10 @@ import json
 import logging
 from decimal import Decimal
 from django.db import transaction
-from ..models import Wallet
+from ..models import Wallet, InsufficientBalance
+from .. import inbox
 from .publisher import EventPublisher
+from ..tokens import profile_cache
 
 logger = logging.getLogger(__name__)
 
@@ -11,6 +13,18 @@ class EventHandler:
     """
     Handles RabbitMQ events for wallet service
     """
+
+    @staticmethod
+    def _replay(ch, method, description: str, result) -> None:
+        """
+        Acknowledge the redelivery of an event already applied, publishing
+        again the result event its first delivery published, which may
+        have been lost after the commit
+        """
+        if result is not None:
+            EventPublisher.publish(result)
+        logger.info(f"{description} already applied, acknowledging redelivery")
+        ch.basic_ack(delivery_tag=method.delivery_tag)
     
     @staticmethod
     def handle_agent_created(ch, method, properties, body):
@@ -37,10 +51,10 @@ class EventHandler:
                     logger.info(f"Wallet already exists for agent {agent_id}")
                 except Wallet.DoesNotExist:
                     # Create new wallet with initial balance
-                    wallet = Wallet.objects.create(
+                    wallet = Wallet.objects.open(
                         agent_id=agent_id,
                         balance=Decimal('10000.00'),  # Initial balance of 10,000
-                        is_active=True
+                        source_event=method.routing_key
                     )
                     logger.info(f"Created new wallet for agent {agent_id} with initial balance")
                 
@@ -84,81 +98,78 @@ class EventHandler:
             logger.info(f"Transaction will be processed as a {'credit' if is_credit else 'debit'} operation")
 
             try:
-                with transaction.atomic():
-                    logger.info(f"Looking up wallet for agent_id: {agent_id}")
-                    wallet = Wallet.objects.select_for_update().get(agent_id=agent_id)
-                    logger.info(f"Found wallet with current balance: {wallet.balance}")
-                    
-                    if status == 'INITIATED':
-                        logger.info("Processing INITIATED transaction")
-                        # For debit transactions, we need to check the balance
-                        if not is_credit and wallet.balance < amount:
-                            logger.error(f"Insufficient balance. Required: {amount}, Available: {wallet.balance}")
-                            EventPublisher.publish_transaction_failed(
-                                transaction_id=transaction_id,
-                                agent_id=agent_id,
-                                reason=f"Insufficient balance. Required: {amount}, Available: {wallet.balance}"
+                if status == 'INITIATED':
+                    cached = inbox.cached_results(inbox.TRANSACTION_INITIATED, [transaction_id])
+                    if cached:
+                        EventHandler._replay(ch, method, f"Transaction {transaction_id}", cached[transaction_id])
+                        return
+
+                    with transaction.atomic():
+                        if not inbox.record(inbox.TRANSACTION_INITIATED, transaction_id):
+                            stored = inbox.stored_results(inbox.TRANSACTION_INITIATED, [transaction_id])
+                            EventHandler._replay(
+                                ch, method, f"Transaction {transaction_id}", stored.get(str(transaction_id))
                             )
-                            # Acknowledge the message since we've handled the insufficient balance case
-                            ch.basic_ack(delivery_tag=method.delivery_tag)
                             return
-                        
-                        # If sufficient balance, update it immediately for float transactions
+
                         try:
-                            logger.info(f"Updating wallet balance: Current={wallet.balance}, Amount={amount}, Operation={'credit' if is_credit else 'debit'}")
-                            old_balance = wallet.balance
-                            wallet.update_balance(amount, is_credit)
-                            logger.info(f"Balance updated successfully: Old={old_balance}, New={wallet.balance}")
-                            
-                            # Publish appropriate event based on credit/debit
                             if is_credit:
-                                logger.info("Publishing wallet.credited event")
-                                EventPublisher.publish_wallet_credited(
-                                    transaction_id=transaction_id,
-                                    agent_id=agent_id,
-                                    amount=str(amount),
-                                    transaction_type=transaction_type
-                                )
+                                balance = Wallet.objects.credit(agent_id, amount, transaction_id, transaction_type, 'transaction.initiated')
                             else:
-                                logger.info("Publishing wallet.debited event")
-                                EventPublisher.publish_wallet_debited(
-                                    transaction_id=transaction_id,
-                                    agent_id=agent_id,
-                                    amount=str(amount),
-                                    transaction_type=transaction_type
+                                # Captures the hold placed when the transaction was created
+                                balance = Wallet.objects.debit(
+                                    agent_id, amount, transaction_id, transaction_type, 'transaction.initiated',
+                                    hold_transaction_id=transaction_id
                                 )
-                            
-                            # Acknowledge successful processing
-                            ch.basic_ack(delivery_tag=method.delivery_tag)
-                            return
-                            
-                        except ValueError as e:
-                            logger.error(f"Balance update failed with error: {str(e)}")
-                            EventPublisher.publish_transaction_failed(
+                        except InsufficientBalance as e:
+                            logger.error(f"Insufficient balance. Required: {e.required}, Available: {e.available}")
+                            # The transaction fails, so give back the funds its hold reserved
+                            Wallet.objects.release_hold(transaction_id)
+                            event = EventPublisher.transaction_failed_event(
                                 transaction_id=transaction_id,
                                 agent_id=agent_id,
-                                reason=str(e)
+                                reason=f"Insufficient balance. Required: {e.required}, Available: {e.available}"
                             )
-                            # Acknowledge the message since we've handled the error case
-                        ch.basic_ack(delivery_tag=method.delivery_tag)
-                        return
-                        
-                    elif status == 'SUCCESSFUL':
-                        logger.info(f"Transaction {transaction_id} already successful, no action needed")
-                        ch.basic_ack(delivery_tag=method.delivery_tag)
-                        return
-                        
-                    elif status == 'FAILED':
-                        logger.info(f"Transaction {transaction_id} failed, no balance update needed")
-                        ch.basic_ack(delivery_tag=method.delivery_tag)
-                        return
-                    
-                    else:
-                        logger.warning(f"Unhandled transaction status: {status}")
-                        # Don't requeue messages with unknown status
-                        ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
-                        return
-                
+                            EventPublisher.publish(event)
+                            inbox.store_results(inbox.TRANSACTION_INITIATED, {transaction_id: event})
+                            # Acknowledge the message since we've handled the insufficient balance case
+                            ch.basic_ack(delivery_tag=method.delivery_tag)
+                            return
+
+                        logger.info(f"Balance updated for transaction {transaction_id}: New={balance}")
+                        # Publish appropriate event based on credit/debit
+                        builder = EventPublisher.wallet_credited_event if is_credit else EventPublisher.wallet_debited_event
+                        event = builder(
+                            transaction_id=transaction_id,
+                            agent_id=agent_id,
+                            amount=str(amount),
+                            transaction_type=transaction_type,
+                            provider=data.get('provider_code'),
+                            initiated_at=data.get('initiated_at')
+                        )
+                        EventPublisher.publish(event)
+                        inbox.store_results(inbox.TRANSACTION_INITIATED, {transaction_id: event})
+
+                    # Acknowledge successful processing
+                    ch.basic_ack(delivery_tag=method.delivery_tag)
+                    return
+
+                elif status == 'SUCCESSFUL':
+                    logger.info(f"Transaction {transaction_id} already successful, no action needed")
+                    ch.basic_ack(delivery_tag=method.delivery_tag)
+                    return
+
+                elif status == 'FAILED':
+                    logger.info(f"Transaction {transaction_id} failed, no balance update needed")
+                    ch.basic_ack(delivery_tag=method.delivery_tag)
+                    return
+
+                else:
+                    logger.warning(f"Unhandled transaction status: {status}")
+                    # Don't requeue messages with unknown status
+                    ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+                    return
+
             except Wallet.DoesNotExist:
                 logger.error(f"No wallet found for agent {agent_id}")
                 # Don't requeue if wallet doesn't exist
@@ -197,22 +208,46 @@ class EventHandler:
                 ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
                 return
 
+            cached = inbox.cached_results(inbox.COMMISSION_RECORDED, [transaction_id])
+            if cached:
+                EventHandler._replay(ch, method, f"Commission for transaction {transaction_id}", cached[transaction_id])
+                return
+
             try:
                 with transaction.atomic():
-                    # Get agent's wallet
-                    wallet = Wallet.objects.select_for_update().get(agent_id=agent_id)
-                    
-                    # Deduct commission from wallet
-                    old_balance = wallet.balance
-                    wallet.update_balance(commission_amount, is_credit=False)  # Always debit commission
-                    logger.info(f"Applied commission deduction: Old balance={old_balance}, New balance={wallet.balance}, Commission amount={commission_amount}")
+                    if not inbox.record(inbox.COMMISSION_RECORDED, transaction_id):
+                        stored = inbox.stored_results(inbox.COMMISSION_RECORDED, [transaction_id])
+                        EventHandler._replay(
+                            ch, method, f"Commission for transaction {transaction_id}", stored.get(str(transaction_id))
+                        )
+                        return
+
+                    # Deduct commission from wallet; holds of other transactions
+                    # do not stand in the way of a commission already earned
+                    try:
+                        balance = Wallet.objects.debit(
+                            agent_id, commission_amount, transaction_id, transaction_type, 'commission.recorded',
+                            ignore_holds=True
+                        )
+                        logger.info(f"Applied commission deduction: New balance={balance}, Commission amount={commission_amount}")
+                        commission_status = True
+                    except InsufficientBalance as e:
+                        # The transaction itself went through; it completes
+                        # with its commission left uncollected
+                        logger.error(
+                            f"Commission for transaction {transaction_id} not collected. "
+                            f"Required: {e.required}, Balance: {e.available}"
+                        )
+                        commission_status = False
                     
                     # Publish transaction.completed event
-                    EventPublisher.publish_transaction_completed(
+                    event = EventPublisher.transaction_completed_event(
                         transaction_id=transaction_id,
                         commission_amount=str(commission_amount),
-                        commission_status=True
+                        commission_status=commission_status
                     )
+                    EventPublisher.publish(event)
+                    inbox.store_results(inbox.COMMISSION_RECORDED, {transaction_id: event})
                     
                     logger.info(f"Successfully processed commission for transaction {transaction_id}")
                     ch.basic_ack(delivery_tag=method.delivery_tag)
@@ -226,4 +261,24 @@ class EventHandler:
                 
         except Exception as e:
             logger.error(f"Error handling commission.recorded event: {str(e)}")
-            ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False) 
\ No newline at end of file
+            ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+
+    @staticmethod
+    def handle_profile_changed(ch, method, properties, body):
+        """
+        Handle user.updated, user.deleted and agent.updated events
+        Drops the cached profile so the next request reloads it
+        """
+        try:
+            data = json.loads(body)
+            user_id = data.get('user_id')
+            if user_id is None:
+                logger.error(f"No user_id in {method.routing_key} event")
+                ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+                return
+            profile_cache.invalidate(user_id)
+            logger.info(f"Invalidated cached profile for user {user_id} on {method.routing_key}")
+            ch.basic_ack(delivery_tag=method.delivery_tag)
+        except Exception as e:
+            logger.error(f"Error handling {method.routing_key} event: {str(e)}")
+            ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
@@ -0,0 +1,219 @@
+import json
+import queue
+import logging
+import threading
+from contextlib import contextmanager
+import pika
+from pika.exceptions import AMQPConnectionError, AMQPChannelError, NackError, UnroutableError
+from django.conf import settings
+from .client import RabbitMQClient
+
+logger = logging.getLogger(__name__)
+
+
+class PublisherPool:
+    """
+    Process-wide pool of long-lived RabbitMQ publisher channels.
+
+    BlockingConnection is not thread-safe, so every pooled client is checked
+    out by exactly one thread at a time. Channels run in confirm mode, dropped
+    connections are discarded and replaced on the next checkout, and a publish
+    that fails on a dead connection is retried once on a fresh one.
+    """
+
+    def __init__(self, size: int = 4, checkout_timeout: float = 10):
+        self.size = size
+        self.checkout_timeout = checkout_timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _create_client(self) -> RabbitMQClient:
+        client = RabbitMQClient()
+        client.connect()
+        client.channel.confirm_delivery()
+        logger.info("Opened pooled publisher channel (%s/%s)", self._created, self.size)
+        return client
+
+    @staticmethod
+    def _is_usable(client: RabbitMQClient) -> bool:
+        return (
+            client.connection is not None
+            and client.connection.is_open
+            and client.channel is not None
+            and client.channel.is_open
+        )
+
+    def _discard(self, client: RabbitMQClient) -> None:
+        try:
+            client.close()
+        except Exception as e:
+            logger.debug("Error closing discarded publisher channel: %s", str(e))
+        with self._lock:
+            self._created -= 1
+
+    def _checkout(self) -> RabbitMQClient:
+        if self._closed:
+            raise RuntimeError("Publisher pool is closed")
+
+        try:
+            client = self._idle.get_nowait()
+        except queue.Empty:
+            client = None
+            with self._lock:
+                if self._created < self.size:
+                    self._created += 1
+                    grow = True
+                else:
+                    grow = False
+            if grow:
+                try:
+                    return self._create_client()
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            try:
+                client = self._idle.get(timeout=self.checkout_timeout)
+            except queue.Empty:
+                raise RuntimeError("Timed out waiting for a publisher channel")
+
+        # Service heartbeats that accumulated while the channel sat idle
+        try:
+            if self._is_usable(client):
+                client.connection.process_data_events(time_limit=0)
+        except AMQPConnectionError:
+            pass
+
+        if not self._is_usable(client):
+            logger.info("Pooled publisher channel dropped, reconnecting")
+            self._discard(client)
+            with self._lock:
+                self._created += 1
+            try:
+                return self._create_client()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+        return client
+
+    @contextmanager
+    def acquire(self):
+        """Check out a connected, confirm-mode client for exclusive use"""
+        client = self._checkout()
+        broken = False
+        try:
+            yield client
+        except (AMQPConnectionError, AMQPChannelError) as e:
+            # A nack or unroutable return leaves the channel usable
+            broken = not isinstance(e, (NackError, UnroutableError))
+            raise
+        finally:
+            if broken or self._closed or not self._is_usable(client):
+                self._discard(client)
+            else:
+                self._idle.put(client)
+
+    def publish(self, exchange: str, routing_key: str, message: dict) -> None:
+        """
+        Publish a persistent JSON message and wait for the broker confirm.
+        Retries once on a fresh connection if the pooled one has gone away.
+        """
+        self.publish_raw(exchange, routing_key, json.dumps(message).encode())
+
+    def publish_raw(self, exchange: str, routing_key: str, body: bytes, headers: dict = None,
+                    mandatory: bool = False) -> None:
+        """
+        Publish an already encoded JSON body, see publish(). With mandatory a
+        message no queue is bound for raises UnroutableError.
+        """
+        properties = pika.BasicProperties(
+            delivery_mode=2,  # make message persistent
+            content_type='application/json',
+            headers=headers
+        )
+        for attempt in range(2):
+            try:
+                with self.acquire() as client:
+                    client.channel.basic_publish(
+                        exchange=exchange,
+                        routing_key=routing_key,
+                        body=body,
+                        properties=properties,
+                        mandatory=mandatory
+                    )
+                return
+            except (NackError, UnroutableError):
+                raise
+            except (AMQPConnectionError, AMQPChannelError) as e:
+                if attempt:
+                    raise
+                logger.warning("Publisher channel failed (%s), retrying on a new connection", str(e))
+
+    def publish_batch(self, events: list) -> None:
+        """
+        Publish (exchange, routing_key, message) tuples in one AMQP transaction.
+        A channel cannot be in confirm and tx mode at once, so each pooled
+        connection lazily opens a second, tx-mode channel for batches. The
+        broker accepts all messages on tx_commit or none of them.
+        """
+        properties = pika.BasicProperties(
+            delivery_mode=2,  # make message persistent
+            content_type='application/json'
+        )
+        for attempt in range(2):
+            try:
+                with self.acquire() as client:
+                    tx_channel = getattr(client, 'tx_channel', None)
+                    if tx_channel is None or not tx_channel.is_open:
+                        tx_channel = client.connection.channel()
+                        tx_channel.tx_select()
+                        client.tx_channel = tx_channel
+                    for exchange, routing_key, message in events:
+                        tx_channel.basic_publish(
+                            exchange=exchange,
+                            routing_key=routing_key,
+                            body=json.dumps(message).encode(),
+                            properties=properties
+                        )
+                    tx_channel.tx_commit()
+                return
+            except (AMQPConnectionError, AMQPChannelError) as e:
+                if attempt:
+                    raise
+                logger.warning("Publisher channel failed (%s), retrying batch on a new connection", str(e))
+
+    def close(self) -> None:
+        """Close every idle channel; checked-out ones are closed on return"""
+        self._closed = True
+        while True:
+            try:
+                client = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(client)
+        logger.info("Closed publisher pool")
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_publisher_pool() -> PublisherPool:
+    """Return the process-wide publisher pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PublisherPool(size=getattr(settings, 'RABBITMQ_PUBLISHER_POOL_SIZE', 4))
+    return _pool
+
+
+def close_publisher_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
@@ -1,113 +1,122 @@
-import json
 import logging
-from .client import RabbitMQClient
+from .pool import get_publisher_pool
 
 logger = logging.getLogger(__name__)
 
 class EventPublisher:
     """
-    Publishes events to RabbitMQ
+    Publishes events to RabbitMQ over the process-wide publisher pool.
+    The *_event builders return (exchange, routing_key, message) tuples so
+    several events can be sent together with publish_batch().
     """
-    
+
     @staticmethod
-    def publish_transaction_failed(transaction_id: str, agent_id: str, reason: str):
-        """
-        Publish a transaction.failed event
-        """
+    def transaction_failed_event(transaction_id: str, agent_id: str, reason: str) -> tuple:
+        return 'transaction_events', 'transaction.failed', {
+            'transaction_id': transaction_id,
+            'agent_id': agent_id,
+            'status': 'FAILED',
+            'reason': reason
+        }
+
+    @staticmethod
+    def wallet_credited_event(transaction_id: str, agent_id: str, amount: str, transaction_type: str = 'BANK_WITHDRAWAL',
+                         provider: str = None, initiated_at: str = None) -> tuple:
+        # provider and initiated_at are passed through from transaction.initiated
+        # for the commission engine's rate schedules
+        return 'wallet_events', 'wallet.credited', {
+            'transaction_id': transaction_id,
+            'agent_id': agent_id,
+            'amount': amount,
+            'transaction_type': transaction_type,
+            'provider': provider,
+            'initiated_at': initiated_at
+        }
+
+    @staticmethod
+    def wallet_debited_event(transaction_id: str, agent_id: str, amount: str, transaction_type: str = 'WALLET_LOAD',
+                         provider: str = None, initiated_at: str = None) -> tuple:
+        # provider and initiated_at are passed through from transaction.initiated
+        # for the commission engine's rate schedules
+        return 'wallet_events', 'wallet.debited', {
+            'transaction_id': transaction_id,
+            'agent_id': agent_id,
+            'amount': amount,
+            'transaction_type': transaction_type,
+            'provider': provider,
+            'initiated_at': initiated_at
+        }
+
+    @staticmethod
+    def transaction_completed_event(transaction_id: str, commission_amount: str, commission_status: bool = True) -> tuple:
+        return 'transaction_events', 'transaction.completed', {
+            'transaction_id': transaction_id,
+            'commission_amount': commission_amount,
+            'commission_status': commission_status
+        }
+
+    @staticmethod
+    def _publish(event: tuple) -> None:
+        exchange, routing_key, message = event
         try:
-            with RabbitMQClient() as client:
-                message = {
-                    'transaction_id': transaction_id,
-                    'agent_id': agent_id,
-                    'status': 'FAILED',
-                    'reason': reason
-                }
-                
-                client.channel.basic_publish(
-                    exchange='transaction_events',
-                    routing_key='transaction.failed',
-                    body=json.dumps(message).encode()
-                )
-                
-                logger.info(f"Published transaction.failed event for transaction {transaction_id}")
-                
+            get_publisher_pool().publish(exchange, routing_key, message)
+            logger.info(f"Published {routing_key} event for transaction {message['transaction_id']}")
         except Exception as e:
-            logger.error(f"Error publishing transaction.failed event: {str(e)}")
+            logger.error(f"Error publishing {routing_key} event: {str(e)}")
             raise
 
     @staticmethod
-    def publish_wallet_credited(transaction_id: str, agent_id: str, amount: str, transaction_type: str = 'BANK_WITHDRAWAL'):
+    def publish(event: tuple) -> None:
         """
-        Publish a wallet.credited event
+        Publish an (exchange, routing_key, message) event built by one of
+        the *_event methods
+        """
+        EventPublisher._publish(event)
+
+    @staticmethod
+    def publish_batch(events: list) -> None:
         """
+        Publish several events in one broker round trip
+        """
+        if not events:
+            return
         try:
-            with RabbitMQClient() as client:
-                message = {
-                    'transaction_id': transaction_id,
-                    'agent_id': agent_id,
-                    'amount': amount,
-                    'transaction_type': transaction_type
-                }
-                
-                client.channel.basic_publish(
-                    exchange='wallet_events',
-                    routing_key='wallet.credited',
-                    body=json.dumps(message).encode()
-                )
-                
-                logger.info(f"Published wallet.credited event for transaction {transaction_id}")
-                
+            get_publisher_pool().publish_batch(events)
+            logger.info(f"Published batch of {len(events)} events")
         except Exception as e:
-            logger.error(f"Error publishing wallet.credited event: {str(e)}")
+            logger.error(f"Error publishing batch of {len(events)} events: {str(e)}")
             raise
 
     @staticmethod
-    def publish_wallet_debited(transaction_id: str, agent_id: str, amount: str, transaction_type: str = 'WALLET_LOAD'):
+    def publish_transaction_failed(transaction_id: str, agent_id: str, reason: str):
+        """
+        Publish a transaction.failed event
+        """
+        EventPublisher._publish(EventPublisher.transaction_failed_event(transaction_id, agent_id, reason))
+
+    @staticmethod
+    def publish_wallet_credited(transaction_id: str, agent_id: str, amount: str, transaction_type: str = 'BANK_WITHDRAWAL',
+                            provider: str = None, initiated_at: str = None):
+        """
+        Publish a wallet.credited event
+        """
+        EventPublisher._publish(EventPublisher.wallet_credited_event(
+            transaction_id, agent_id, amount, transaction_type, provider, initiated_at
+        ))
+
+    @staticmethod
+    def publish_wallet_debited(transaction_id: str, agent_id: str, amount: str, transaction_type: str = 'WALLET_LOAD',
+                            provider: str = None, initiated_at: str = None):
         """
         Publish a wallet.debited event
         """
-        try:
-            with RabbitMQClient() as client:
-                message = {
-                    'transaction_id': transaction_id,
-                    'agent_id': agent_id,
-                    'amount': amount,
-                    'transaction_type': transaction_type
-                }
-                
-                client.channel.basic_publish(
-                    exchange='wallet_events',
-                    routing_key='wallet.debited',
-                    body=json.dumps(message).encode()
-                )
-                
-                logger.info(f"Published wallet.debited event for transaction {transaction_id}")
-                
-        except Exception as e:
-            logger.error(f"Error publishing wallet.debited event: {str(e)}")
-            raise
+        EventPublisher._publish(EventPublisher.wallet_debited_event(
+            transaction_id, agent_id, amount, transaction_type, provider, initiated_at
+        ))
 
     @staticmethod
     def publish_transaction_completed(transaction_id: str, commission_amount: str, commission_status: bool = True):
         """
         Publish a transaction.completed event
         """
-        try:
-            with RabbitMQClient() as client:
-                message = {
-                    'transaction_id': transaction_id,
-                    'commission_amount': commission_amount,
-                    'commission_status': commission_status
-                }
-                
-                client.channel.basic_publish(
-                    exchange='transaction_events',
-                    routing_key='transaction.completed',
-                    body=json.dumps(message).encode()
-                )
-                
-                logger.info(f"Published transaction.completed event for transaction {transaction_id}")
-                
-        except Exception as e:
-            logger.error(f"Error publishing transaction.completed event: {str(e)}")
-            raise 
\ No newline at end of file
+        EventPublisher._publish(EventPublisher.transaction_completed_event(transaction_id, commission_amount, commission_status))
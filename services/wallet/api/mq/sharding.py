@@ -0,0 +1,116 @@
+import json
+import hashlib
+import logging
+from pika.exceptions import UnroutableError
+from .pool import get_publisher_pool
+
+logger = logging.getLogger(__name__)
+
+SHARD_EXCHANGE = 'wallet_shards'
+EVENT_HEADER = 'x-event'
+# One consumer at a time per shard queue, so each agent has a single writer
+SHARD_QUEUE_ARGUMENTS = {'x-single-active-consumer': True}
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash (Lamping & Veach). Growing from n to n+1 buckets
+    moves only 1/(n+1) of the keys.
+    """
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+def shard_for(agent_id: str, shards: int) -> int:
+    """Stable shard index for an agent; Python's hash() is salted per process"""
+    digest = hashlib.md5((agent_id or '').encode()).digest()
+    return jump_hash(int.from_bytes(digest[:8], 'big'), shards)
+
+
+def shard_queue(shard: int) -> str:
+    return f'wallet_shard.{shard}'
+
+
+def build_consumer_config(consumers: dict, shard_count: int, shard_consumer: dict = None) -> dict:
+    """
+    Expand WALLET_CONSUMERS for sharded mode. Queues marked 'sharded' become
+    routers with a single worker that forward each event to wallet_shard.<n>
+    by agent_id, so an agent's events reach its shard in the order they
+    arrived, and one single-active-consumer queue with a single worker is
+    added per shard so each agent's balance has exactly one writer.
+    `shard_consumer` supplies the prefetch and batch options of the shard
+    queues.
+    """
+    if shard_count <= 0:
+        return consumers
+
+    expanded = {}
+    for queue_name, config in consumers.items():
+        if config.get('sharded'):
+            config = dict(config, role='router', shard_count=shard_count, workers=1, processes=0)
+        expanded[queue_name] = config
+
+    for shard in range(shard_count):
+        expanded[shard_queue(shard)] = {
+            'exchange': SHARD_EXCHANGE,
+            'exchange_type': 'direct',
+            'routing_keys': [f'shard.{shard}'],
+            'queue_arguments': SHARD_QUEUE_ARGUMENTS,
+            'prefetch': 50,
+            **(shard_consumer or {}),
+            'workers': 1,
+            'processes': 0,
+        }
+    return expanded
+
+
+class ShardRouter:
+    """
+    Forwards deliveries to the shard queue that owns their agent. Events are
+    published mandatory and only acked once the broker has queued them, so
+    an event with no shard queue to go to is requeued rather than dropped.
+    """
+
+    def __init__(self, shard_count: int):
+        self.shard_count = shard_count
+
+    def declare_shards(self, channel) -> None:
+        """
+        Declare and bind every shard queue as the shard consumers do, so
+        routed events are queued even before their consumer has started
+        """
+        channel.exchange_declare(exchange=SHARD_EXCHANGE, exchange_type='direct', durable=True)
+        for shard in range(self.shard_count):
+            channel.queue_declare(queue=shard_queue(shard), durable=True, arguments=SHARD_QUEUE_ARGUMENTS)
+            channel.queue_bind(exchange=SHARD_EXCHANGE, queue=shard_queue(shard), routing_key=f'shard.{shard}')
+
+    def route(self, ch, method, properties, body):
+        try:
+            agent_id = json.loads(body).get('agent_id')
+        except (ValueError, AttributeError):
+            logger.error(f"Undecodable message on {method.routing_key}, rejecting")
+            ch.basic_reject(delivery_tag=method.delivery_tag, requeue=False)
+            return
+
+        shard = shard_for(agent_id, self.shard_count)
+        try:
+            get_publisher_pool().publish_raw(
+                SHARD_EXCHANGE,
+                f'shard.{shard}',
+                body,
+                headers={EVENT_HEADER: method.routing_key},
+                mandatory=True
+            )
+        except UnroutableError:
+            logger.error(f"No queue bound for shard {shard}, requeueing {method.routing_key}")
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            return
+        except Exception as e:
+            logger.error(f"Failed to route {method.routing_key} to shard {shard}: {str(e)}")
+            ch.basic_nack(delivery_tag=method.delivery_tag, requeue=True)
+            return
+        ch.basic_ack(delivery_tag=method.delivery_tag)
@@ -0,0 +1,146 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional
+import jwt
+from django.conf import settings
+from django.core.cache import cache
+from .services.http import get_client
+
+logger = logging.getLogger(__name__)
+
+PROFILE_CACHE_PREFIX = 'auth:profile:'
+
+
+class TokenError(Exception):
+    """Raised when an access token is malformed, expired or not signed by user_management"""
+
+
+def decode_access_token(token: str) -> dict:
+    """
+    Verify a SimpleJWT access token in-process: signature, expiry and
+    token type. Returns the claims.
+    """
+    try:
+        claims = jwt.decode(
+            token,
+            settings.JWT_SIGNING_KEY,
+            algorithms=[settings.JWT_ALGORITHM],
+            options={'require': ['exp', 'user_id']}
+        )
+    except jwt.ExpiredSignatureError:
+        raise TokenError('Token has expired')
+    except jwt.InvalidTokenError as e:
+        raise TokenError(f'Invalid token: {str(e)}')
+    if claims.get('token_type') != 'access':
+        raise TokenError('Not an access token')
+    return claims
+
+
+class ProfileCache:
+    """
+    Two-tier cache of user profiles (role, agent_id) keyed by user_id.
+
+    The first tier is a bounded in-process LRU with a short TTL, so the hot
+    path needs no network call at all. The second is the shared Django cache
+    (Redis) with a longer TTL, which profile change events invalidate. A
+    Redis outage only costs the second tier.
+    """
+
+    def __init__(self, max_size: int = 10000, local_ttl: float = 30, shared_ttl: int = 300):
+        self.max_size = max_size
+        self.local_ttl = local_ttl
+        self.shared_ttl = shared_ttl
+        self._entries = OrderedDict()  # user_id -> (expires_at, profile)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(user_id) -> str:
+        return f"{PROFILE_CACHE_PREFIX}{user_id}"
+
+    def get(self, user_id) -> Optional[dict]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(user_id)
+                    return entry[1]
+                del self._entries[user_id]
+
+        try:
+            profile = cache.get(self._key(user_id))
+        except Exception as e:
+            logger.warning(f"Profile cache unavailable: {str(e)}")
+            return None
+        if profile is not None:
+            self._remember(user_id, profile)
+        return profile
+
+    def set(self, user_id, profile: dict) -> None:
+        self._remember(user_id, profile)
+        try:
+            cache.set(self._key(user_id), profile, self.shared_ttl)
+        except Exception as e:
+            logger.warning(f"Profile cache unavailable: {str(e)}")
+
+    def invalidate(self, user_id) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+        try:
+            cache.delete(self._key(user_id))
+        except Exception as e:
+            logger.warning(f"Profile cache unavailable: {str(e)}")
+
+    def _remember(self, user_id, profile: dict) -> None:
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.local_ttl, profile)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+profile_cache = ProfileCache(
+    max_size=getattr(settings, 'AUTH_PROFILE_CACHE_SIZE', 10000),
+    local_ttl=getattr(settings, 'AUTH_PROFILE_LOCAL_TTL', 30),
+    shared_ttl=getattr(settings, 'AUTH_PROFILE_CACHE_TTL', 300)
+)
+
+
+def fetch_profile(token: str) -> dict:
+    """Load the caller's profile from user_management; used on cache misses"""
+    response = get_client('user_management', settings.USER_SERVICE_URL).get(
+        "/api/users/me/",
+        headers={'Authorization': f'Bearer {token}'}
+    )
+    if response.status_code != 200:
+        raise TokenError(f'Token rejected by user management service: {response.status_code}')
+    user_data = response.json()
+    agent_profile = user_data.get('agent_profile') or {}
+    return {
+        'id': user_data['id'],
+        'role': user_data.get('role'),
+        'is_active': user_data.get('is_active', True),
+        'is_staff': user_data.get('is_staff', False),
+        'is_superuser': user_data.get('is_superuser', False),
+        'agent_id': agent_profile.get('agent_id'),
+        'agent_status': agent_profile.get('status'),
+    }
+
+
+def authenticate_token(token: str) -> dict:
+    """
+    Return the profile for a bearer token. With JWT_SIGNING_KEY configured
+    the token is verified locally and the profile comes from the cache;
+    otherwise every call is validated by user_management.
+    """
+    if not settings.JWT_SIGNING_KEY:
+        return fetch_profile(token)
+
+    user_id = decode_access_token(token)['user_id']
+    profile = profile_cache.get(user_id)
+    if profile is None:
+        profile = fetch_profile(token)
+        profile_cache.set(user_id, profile)
+    return profile
@@ -4,7 +4,9 @@ from . import views
 
 router = DefaultRouter()
 router.register(r'wallets', views.WalletViewSet, basename='wallet')
+router.register(r'internal/wallets', views.InternalWalletViewSet, basename='internal-wallet')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('metrics/http/', views.http_metrics, name='http-metrics'),
 ] 
\ No newline at end of file
@@ -2,10 +2,15 @@ from rest_framework import viewsets, status, permissions
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
-from .models import Wallet
+from django.conf import settings
+from .models import Wallet, HoldConflict, InsufficientBalance
 from .serializers import WalletSerializer, WalletBalanceSerializer
+from .authentication import InternalServiceAuthentication
+from .inbox import settle_initiated
 import logging
 from decimal import Decimal, InvalidOperation
+from django.http import HttpResponse
+from .services.http import render_metrics
 
 logger = logging.getLogger(__name__)
 
@@ -34,7 +39,11 @@ class WalletViewSet(viewsets.ReadOnlyModelViewSet):
         wallet = self.get_queryset().first()
         if not wallet:
             return Response({'detail': 'Wallet not found'}, status=status.HTTP_404_NOT_FOUND)
-        return Response({'balance': str(wallet.balance)})
+        return Response({
+            'balance': str(wallet.balance),
+            'held_balance': str(wallet.held_balance),
+            'available_balance': str(wallet.available_balance)
+        })
 
     @action(detail=False, methods=['post'])
     def check_balance(self, request):
@@ -59,11 +68,12 @@ class WalletViewSet(viewsets.ReadOnlyModelViewSet):
         try:
             wallet = Wallet.objects.get(agent_id=agent_id)
             amount = Decimal(str(amount))
-            has_sufficient_balance = wallet.balance >= amount
+            has_sufficient_balance = wallet.available_balance >= amount
             
             return Response({
                 'has_sufficient_balance': has_sufficient_balance,
                 'current_balance': str(wallet.balance),
+                'available_balance': str(wallet.available_balance),
                 'required_amount': str(amount)
             })
             
@@ -76,4 +86,153 @@ class WalletViewSet(viewsets.ReadOnlyModelViewSet):
             return Response(
                 {'detail': 'Invalid amount format'},
                 status=status.HTTP_400_BAD_REQUEST
-            ) 
\ No newline at end of file
+            )
+
+
+class IsInternalService(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return bool(getattr(request.user, 'is_internal_service', False))
+
+
+class InternalWalletViewSet(viewsets.ViewSet):
+    """
+    Service-to-service balance queries and holds, authenticated by the
+    shared service key instead of a user token.
+    """
+    authentication_classes = [InternalServiceAuthentication]
+    permission_classes = [IsInternalService]
+
+    MAX_BATCH = 500
+
+    @action(detail=False, methods=['get'])
+    def balance(self, request):
+        """Balance of one agent's wallet, ?agent_id=..."""
+        agent_id = request.query_params.get('agent_id')
+        if not agent_id:
+            return Response({'detail': 'agent_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        wallet = Wallet.objects.filter(agent_id=agent_id).only('balance', 'held_balance').first()
+        if wallet is None:
+            return Response({'detail': 'Wallet not found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({
+            'agent_id': agent_id,
+            'balance': str(wallet.balance),
+            'held_balance': str(wallet.held_balance),
+            'available_balance': str(wallet.available_balance)
+        })
+
+    @action(detail=False, methods=['post'])
+    def balances(self, request):
+        """Balances of several agents' wallets in one query"""
+        agent_ids = request.data.get('agent_ids')
+        if not isinstance(agent_ids, list) or not agent_ids:
+            return Response({'detail': 'agent_ids must be a non-empty list'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(agent_ids) > self.MAX_BATCH:
+            return Response(
+                {'detail': f'At most {self.MAX_BATCH} agent_ids per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        balances = {}
+        available = {}
+        rows = Wallet.objects.filter(agent_id__in=agent_ids).values_list('agent_id', 'balance', 'held_balance')
+        for agent_id, balance, held_balance in rows:
+            balances[agent_id] = str(balance)
+            available[agent_id] = str(balance - held_balance)
+        return Response({
+            'balances': balances,
+            'available': available,
+            'missing': [agent_id for agent_id in agent_ids if agent_id not in balances]
+        })
+
+    @action(detail=False, methods=['post'], url_path='holds')
+    def place_hold(self, request):
+        """
+        Reserve funds for a transaction:
+        {agent_id, transaction_id, amount, ttl_seconds (optional)}
+        """
+        agent_id = request.data.get('agent_id')
+        transaction_id = request.data.get('transaction_id')
+        if not agent_id or not transaction_id:
+            return Response({'detail': 'agent_id and transaction_id are required'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            amount = Decimal(str(request.data.get('amount')))
+            ttl = int(request.data.get('ttl_seconds') or settings.WALLET_HOLD_DEFAULT_TTL)
+        except (ValueError, TypeError, InvalidOperation):
+            return Response({'detail': 'Invalid amount or ttl_seconds'}, status=status.HTTP_400_BAD_REQUEST)
+        if amount <= 0 or ttl <= 0:
+            return Response({'detail': 'amount and ttl_seconds must be positive'}, status=status.HTTP_400_BAD_REQUEST)
+        ttl = min(ttl, settings.WALLET_HOLD_MAX_TTL)
+
+        try:
+            hold, available = Wallet.objects.place_hold(agent_id, amount, str(transaction_id), ttl)
+        except Wallet.DoesNotExist:
+            return Response({'detail': 'Wallet not found'}, status=status.HTTP_404_NOT_FOUND)
+        except InsufficientBalance as e:
+            return Response(
+                {
+                    'detail': f"Insufficient balance. Required: {e.required}, Available: {e.available}",
+                    'required_amount': str(e.required),
+                    'available_balance': str(e.available)
+                },
+                status=status.HTTP_409_CONFLICT
+            )
+        except HoldConflict as e:
+            return Response({'detail': str(e)}, status=status.HTTP_409_CONFLICT)
+
+        return Response({
+            'hold_id': str(hold.id),
+            'transaction_id': hold.transaction_id,
+            'agent_id': hold.agent_id,
+            'amount': str(hold.amount),
+            'status': hold.status,
+            'expires_at': hold.expires_at.isoformat(),
+            'available_balance': str(available)
+        }, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], url_path='holds/release')
+    def release_hold(self, request):
+        """Release the active hold for a transaction: {transaction_id}"""
+        transaction_id = request.data.get('transaction_id')
+        if not transaction_id:
+            return Response({'detail': 'transaction_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        released = Wallet.objects.release_hold(str(transaction_id))
+        return Response({'transaction_id': transaction_id, 'released': released})
+
+    @action(detail=False, methods=['post'], url_path='transactions/settle')
+    def settle_transactions(self, request):
+        """
+        Whether the wallet applied transactions the transaction engine is
+        giving up on, failing the ones it has not processed yet:
+        {transactions: [{transaction_id, agent_id}], reason}
+        """
+        transactions = request.data.get('transactions')
+        reason = request.data.get('reason')
+        if not isinstance(transactions, list) or not transactions or not reason:
+            return Response(
+                {'detail': 'transactions must be a non-empty list and reason is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(transactions) > self.MAX_BATCH:
+            return Response(
+                {'detail': f'At most {self.MAX_BATCH} transactions per request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            transactions = {str(item['transaction_id']): str(item['agent_id']) for item in transactions}
+        except (KeyError, TypeError):
+            return Response(
+                {'detail': 'Each transaction needs a transaction_id and an agent_id'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        outcomes = settle_initiated(transactions, reason)
+        return Response({
+            'transactions': {
+                transaction_id: {'applied': applied, 'reason': failure}
+                for transaction_id, (applied, failure) in outcomes.items()
+            }
+        })
+
+
+def http_metrics(request):
+    """Inter-service HTTP client metrics in Prometheus text format"""
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4')
@@ -95,6 +95,17 @@ DATABASES = {
     }
 }
 
+# Redis Cache
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': f"redis://{os.getenv('REDIS_HOST')}:{os.getenv('REDIS_PORT')}/{os.getenv('REDIS_DB')}",
+        'OPTIONS': {
+            'CLIENT_CLASS': 'django_redis.client.DefaultClient',
+        }
+    }
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -174,6 +185,115 @@ RABBITMQ = {
     'VIRTUAL_HOST': os.getenv('RABBITMQ_VIRTUAL_HOST'),
 }
 
+# Long-lived publisher channels shared by all threads in a process
+RABBITMQ_PUBLISHER_POOL_SIZE = int(os.getenv('RABBITMQ_PUBLISHER_POOL_SIZE', 4))
+
+# Consumer runtime, configured per queue:
+#   workers   - consumer threads, each with its own connection
+#   prefetch  - unacked deliveries the broker may push to each worker
+#   processes - partition worker processes keyed by agent_id (0 disables);
+#               a partitioned queue is fed by a single consumer to keep
+#               each agent's events in order
+#   batch_size, batch_window_ms
+#             - apply up to batch_size balance events per database
+#               transaction, waiting at most batch_window_ms to fill a
+#               batch (0 or 1 disables; ignored with partition workers)
+WALLET_CONSUMERS = {
+    'wallet_agent_events': {
+        'exchange': 'user_events',
+        'routing_keys': ['agent.created'],
+        'workers': int(os.getenv('WALLET_AGENT_WORKERS', 1)),
+        'prefetch': int(os.getenv('WALLET_AGENT_PREFETCH', 10)),
+        'processes': 0,
+    },
+    'wallet_transaction_events': {
+        'exchange': 'transaction_events',
+        'routing_keys': ['transaction.initiated'],
+        'workers': int(os.getenv('WALLET_TRANSACTION_WORKERS', 1)),
+        'prefetch': int(os.getenv('WALLET_TRANSACTION_PREFETCH', 50)),
+        'processes': int(os.getenv('WALLET_TRANSACTION_PROCESSES', 0)),
+        'batch_size': int(os.getenv('WALLET_TRANSACTION_BATCH_SIZE', 0)),
+        'batch_window_ms': int(os.getenv('WALLET_TRANSACTION_BATCH_WINDOW_MS', 50)),
+        'sharded': True,
+    },
+    'wallet_commission_events': {
+        'exchange': 'commission_events',
+        'routing_keys': ['commission.recorded'],
+        'workers': int(os.getenv('WALLET_COMMISSION_WORKERS', 1)),
+        'prefetch': int(os.getenv('WALLET_COMMISSION_PREFETCH', 50)),
+        'processes': int(os.getenv('WALLET_COMMISSION_PROCESSES', 0)),
+        'batch_size': int(os.getenv('WALLET_COMMISSION_BATCH_SIZE', 0)),
+        'batch_window_ms': int(os.getenv('WALLET_COMMISSION_BATCH_WINDOW_MS', 50)),
+        'sharded': True,
+    },
+    'wallet_auth_events': {
+        'exchange': 'user_events',
+        'routing_keys': ['user.updated', 'user.deleted', 'agent.updated'],
+        'workers': 1,
+        'prefetch': 50,
+        'processes': 0,
+    },
+}
+
+# Per-agent sharding for balance mutations. When set, queues marked
+# 'sharded' only route events by a consistent hash of agent_id onto
+# wallet_shard.<n> queues, each drained by a single writer. Drain the shard
+# queues before changing the count, or per-agent ordering is lost.
+WALLET_SHARD_COUNT = int(os.getenv('WALLET_SHARD_COUNT', 0))
+WALLET_SHARD_CONSUMER = {
+    'prefetch': int(os.getenv('WALLET_SHARD_PREFETCH', 50)),
+    'batch_size': int(os.getenv('WALLET_SHARD_BATCH_SIZE', 0)),
+    'batch_window_ms': int(os.getenv('WALLET_SHARD_BATCH_WINDOW_MS', 50)),
+}
+
+# Write a balance snapshot every N ledger entries per wallet; balance_at()
+# scans at most this many entries past the nearest snapshot
+WALLET_SNAPSHOT_EVERY = int(os.getenv('WALLET_SNAPSHOT_EVERY', 100))
+
+# Balance holds placed by the transaction engine: TTL in seconds when the
+# caller gives none, and the longest TTL accepted. Expired holds are
+# released by the expire_holds command.
+WALLET_HOLD_DEFAULT_TTL = int(os.getenv('WALLET_HOLD_DEFAULT_TTL', 900))
+WALLET_HOLD_MAX_TTL = int(os.getenv('WALLET_HOLD_MAX_TTL', 3600))
+
+# Processed-event inbox (api.inbox): seconds a processed event id stays in
+# the cache that answers most redeliveries, and days its row is kept for
+# the rest; purge_processed_events deletes older rows
+INBOX_CACHE_TTL = int(os.getenv('INBOX_CACHE_TTL', 86400))
+INBOX_RETENTION_DAYS = int(os.getenv('INBOX_RETENTION_DAYS', 14))
+
+# Seconds to wait for in-flight messages on shutdown
+WALLET_CONSUMER_DRAIN_TIMEOUT = float(os.getenv('WALLET_CONSUMER_DRAIN_TIMEOUT', 30))
+
 # Service URLs
 TRANSACTION_ENGINE_SERVICE_URL = os.getenv('TRANSACTION_ENGINE_SERVICE_URL')
 USER_SERVICE_URL = os.getenv('USER_SERVICE_URL')
+
+# Shared key for service-to-service endpoints, sent as X-Service-Key
+INTERNAL_SERVICE_KEY = os.getenv('INTERNAL_SERVICE_KEY')
+
+# Inter-service HTTP calls (api.services.http): timeouts in seconds, retries
+# for idempotent requests, keep-alive pool size per service, and a circuit
+# breaker that opens after BREAKER_FAILURES consecutive failures for
+# BREAKER_RESET seconds
+INTER_SERVICE_HTTP = {
+    'CONNECT_TIMEOUT': float(os.getenv('HTTP_CONNECT_TIMEOUT', 2)),
+    'READ_TIMEOUT': float(os.getenv('HTTP_READ_TIMEOUT', 5)),
+    'RETRIES': int(os.getenv('HTTP_RETRIES', 2)),
+    'BACKOFF': float(os.getenv('HTTP_BACKOFF', 0.2)),
+    'POOL_SIZE': int(os.getenv('HTTP_POOL_SIZE', 20)),
+    'BREAKER_FAILURES': int(os.getenv('HTTP_BREAKER_FAILURES', 5)),
+    'BREAKER_RESET': float(os.getenv('HTTP_BREAKER_RESET', 30)),
+}
+
+# Local token verification. Must match SIMPLE_JWT's SIGNING_KEY in
+# user_management; when unset every request is validated over HTTP.
+JWT_SIGNING_KEY = os.getenv('JWT_SIGNING_KEY')
+JWT_ALGORITHM = os.getenv('JWT_ALGORITHM', 'HS256')
+
+# Profiles (role, agent_id) of authenticated users: an in-process LRU of
+# AUTH_PROFILE_CACHE_SIZE entries for AUTH_PROFILE_LOCAL_TTL seconds in
+# front of Redis for AUTH_PROFILE_CACHE_TTL seconds
+AUTH_PROFILE_CACHE_SIZE = int(os.getenv('AUTH_PROFILE_CACHE_SIZE', 10000))
+AUTH_PROFILE_LOCAL_TTL = float(os.getenv('AUTH_PROFILE_LOCAL_TTL', 30))
+AUTH_PROFILE_CACHE_TTL = int(os.getenv('AUTH_PROFILE_CACHE_TTL', 300))